@@ -0,0 +1,33 @@
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '0002_attendance_counters'
+down_revision: Union[str, None] = '0001_init'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'section_attendance_counters',
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('section_id', sa.Integer(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.execute(
+        "INSERT INTO section_attendance_counters (student_id, section_id, count) "
+        "SELECT student_id, section_id, COUNT(*) FROM section_attendance WHERE student_id IS NOT NULL AND section_id IS NOT NULL "
+        "GROUP BY student_id, section_id"
+    )
+    op.execute(
+        "INSERT INTO section_attendance_counters (student_id, section_id, count) "
+        "SELECT student_id, 0, COUNT(*) FROM section_attendance WHERE student_id IS NOT NULL AND section_id IS NOT NULL "
+        "GROUP BY student_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('section_attendance_counters')
@@ -0,0 +1,42 @@
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '0003_unique_memberships'
+down_revision: Union[str, None] = '0002_attendance_counters'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_KEYS = {
+    'section_students': ('uq_section_students_section_student', ['section_id', 'student_id']),
+    'section_teachers': ('uq_section_teachers_section_teacher', ['section_id', 'teacher_id']),
+    'section_beacons': ('uq_section_beacons_section_beacon', ['section_id', 'beacon_id']),
+}
+
+
+def upgrade() -> None:
+    for table, (index_name, columns) in UNIQUE_KEYS.items():
+        key = ', '.join(columns)
+        op.execute(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM {table} GROUP BY {key}) AS keep)"
+        )
+        op.create_index(index_name, table, columns, unique=True)
+
+    op.add_column('section_attendance', sa.Column('session_window', sa.Integer(), nullable=True))
+    op.create_index(
+        'uq_section_attendance_session_window',
+        'section_attendance',
+        ['section_id', 'student_id', 'session_window'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_section_attendance_session_window', table_name='section_attendance')
+    with op.batch_alter_table('section_attendance') as batch_op:
+        batch_op.drop_column('session_window')
+    for table, (index_name, _) in UNIQUE_KEYS.items():
+        op.drop_index(index_name, table_name=table)
@@ -0,0 +1,43 @@
+
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '0004_master_qr_sessions'
+down_revision: Union[str, None] = '0003_unique_memberships'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    sessions = op.create_table(
+        'master_qr_sessions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('secret', sa.String(), nullable=False),
+        sa.Column('teacher_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('section_id', sa.Integer(), sa.ForeignKey('sections.id'), nullable=True),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_master_qr_sessions_secret', 'master_qr_sessions', ['secret'], unique=True)
+    op.create_index('ix_master_qr_sessions_teacher_id', 'master_qr_sessions', ['teacher_id'])
+
+    # master QR codes that are switched on right now keep working after the upgrade
+    now = datetime.utcnow()
+    enabled = op.get_bind().execute(sa.text(
+        "SELECT id, master_qr_secret FROM users "
+        "WHERE role = 'teacher' AND master_qr_mode_enabled AND master_qr_secret IS NOT NULL"
+    )).all()
+    if enabled:
+        op.bulk_insert(sessions, [
+            {'secret': secret, 'teacher_id': teacher_id, 'started_at': now, 'expires_at': now + timedelta(hours=2)}
+            for teacher_id, secret in enabled
+        ])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_master_qr_sessions_teacher_id', table_name='master_qr_sessions')
+    op.drop_index('ix_master_qr_sessions_secret', table_name='master_qr_sessions')
+    op.drop_table('master_qr_sessions')
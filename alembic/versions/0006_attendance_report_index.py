@@ -0,0 +1,18 @@
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = '0006_attendance_report_index'
+down_revision: Union[str, None] = '0005_resource_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_section_attendance_section_timestamp', 'section_attendance', ['section_id', 'timestamp'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_section_attendance_section_timestamp', table_name='section_attendance')
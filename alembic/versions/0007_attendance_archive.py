@@ -0,0 +1,57 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '0007_attendance_archive'
+down_revision: Union[str, None] = '0006_attendance_report_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# partitions of closed months/terms are created by `python -m app.cli attendance archive`
+PARTITIONED = {'postgresql_partition_by': 'RANGE (timestamp)'}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'section_attendance_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('section_id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('session_window', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        **PARTITIONED,
+    )
+    op.create_index(
+        'ix_section_attendance_archive_section_timestamp', 'section_attendance_archive', ['section_id', 'timestamp']
+    )
+    op.create_table(
+        'attendance_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        **PARTITIONED,
+    )
+    op.create_index('ix_attendance_archive_student_timestamp', 'attendance_archive', ['student_id', 'timestamp'])
+
+    op.execute(
+        "CREATE VIEW section_attendance_history AS "
+        "SELECT id, timestamp, section_id, student_id, session_window FROM section_attendance "
+        "UNION ALL SELECT id, timestamp, section_id, student_id, session_window FROM section_attendance_archive"
+    )
+    op.execute(
+        "CREATE VIEW attendance_history AS "
+        "SELECT id, timestamp, student_id FROM attendance "
+        "UNION ALL SELECT id, timestamp, student_id FROM attendance_archive"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW attendance_history")
+    op.execute("DROP VIEW section_attendance_history")
+    op.drop_index('ix_attendance_archive_student_timestamp', table_name='attendance_archive')
+    op.drop_table('attendance_archive')
+    op.drop_index('ix_section_attendance_archive_section_timestamp', table_name='section_attendance_archive')
+    op.drop_table('section_attendance_archive')
@@ -0,0 +1,44 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '0009_lecture_sessions'
+down_revision: Union[str, None] = '0008_resource_updated_at'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('section_students', sa.Column('position', sa.Integer(), nullable=True))
+    # existing members keep their joining order
+    op.execute(
+        "UPDATE section_students SET position = ("
+        "SELECT COUNT(*) FROM section_students AS earlier "
+        "WHERE earlier.section_id = section_students.section_id AND earlier.id < section_students.id)"
+    )
+    op.create_index(
+        'uq_section_students_section_position', 'section_students', ['section_id', 'position'], unique=True
+    )
+
+    op.create_table(
+        'lecture_sessions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('section_id', sa.Integer(), sa.ForeignKey('sections.id'), nullable=False),
+        sa.Column('master_qr_session_id', sa.Integer(), sa.ForeignKey('master_qr_sessions.id'), nullable=True),
+        sa.Column('starts_at', sa.DateTime(), nullable=False),
+        sa.Column('ends_at', sa.DateTime(), nullable=False),
+        sa.Column('roster_size', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('presence', sa.LargeBinary(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_lecture_sessions_master_qr_session_id', 'lecture_sessions', ['master_qr_session_id'])
+    op.create_index('ix_lecture_sessions_section_starts', 'lecture_sessions', ['section_id', 'starts_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_lecture_sessions_section_starts', table_name='lecture_sessions')
+    op.drop_index('ix_lecture_sessions_master_qr_session_id', table_name='lecture_sessions')
+    op.drop_table('lecture_sessions')
+    op.drop_index('uq_section_students_section_position', table_name='section_students')
+    op.drop_column('section_students', 'position')
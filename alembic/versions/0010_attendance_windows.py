@@ -0,0 +1,73 @@
+from datetime import timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import get_settings
+
+revision: str = '0010_attendance_windows'
+down_revision: Union[str, None] = '0009_lecture_sessions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # epoch buckets are gone; lecture keys are negative lecture ids, everything else is NULL
+    op.execute("UPDATE section_attendance SET session_window = NULL WHERE session_window > 0")
+
+    minutes = get_settings().attendance_session_window_minutes
+    if minutes > 0:
+        window = timedelta(minutes=minutes)
+        lectures = {}
+        for lecture_id, section_id, starts_at, ends_at in bind.execute(
+            sa.text("SELECT id, section_id, starts_at, ends_at FROM lecture_sessions ORDER BY starts_at DESC, id DESC")
+            .columns(starts_at=sa.DateTime(), ends_at=sa.DateTime())
+        ):
+            lectures.setdefault(section_id, []).append((lecture_id, starts_at, ends_at))
+
+        keyed, dropped, seen, last_kept = [], [], set(), {}
+        for mark_id, section_id, student_id, timestamp in bind.execute(sa.text(
+            "SELECT id, section_id, student_id, timestamp FROM section_attendance "
+            "ORDER BY section_id, student_id, timestamp, id"
+        ).columns(timestamp=sa.DateTime())):
+            lecture_id = next(
+                (lid for lid, starts_at, ends_at in lectures.get(section_id, ()) if starts_at <= timestamp < ends_at), None
+            )
+            if lecture_id is not None:
+                key = (section_id, student_id, lecture_id)
+                if key in seen:
+                    dropped.append(mark_id)
+                else:
+                    seen.add(key)
+                    keyed.append({"id": mark_id, "session_window": -lecture_id})
+                continue
+            previous = last_kept.get((section_id, student_id))
+            if previous is not None and timestamp - previous < window:
+                dropped.append(mark_id)
+            else:
+                last_kept[(section_id, student_id)] = timestamp
+
+        if keyed:
+            bind.execute(sa.text("UPDATE section_attendance SET session_window = :session_window WHERE id = :id"), keyed)
+        for start in range(0, len(dropped), 500):
+            bind.execute(
+                sa.text("DELETE FROM section_attendance WHERE id IN :ids").bindparams(sa.bindparam('ids', expanding=True)),
+                {"ids": dropped[start:start + 500]},
+            )
+
+    op.execute("DELETE FROM section_attendance_counters")
+    op.execute(
+        "INSERT INTO section_attendance_counters (student_id, section_id, count) "
+        "SELECT student_id, section_id, COUNT(*) FROM section_attendance_history GROUP BY student_id, section_id"
+    )
+    op.execute(
+        "INSERT INTO section_attendance_counters (student_id, section_id, count) "
+        "SELECT student_id, 0, COUNT(*) FROM section_attendance_history GROUP BY student_id"
+    )
+
+
+def downgrade() -> None:
+    # deleted duplicates are not restored
+    op.execute("UPDATE section_attendance SET session_window = NULL WHERE session_window < 0")
@@ -0,0 +1,143 @@
+import math
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+
+from .config import Settings
+from .dependencies import token_user_id
+
+LOGIN_PATHS = frozenset({"/api/auth/token", "/api/auth/register"})
+SCAN_PATHS = frozenset({
+    "/api/attendance/scan-student",
+    "/api/attendance/scan-lecture",
+    "/api/attendance/manual",
+    "/api/attendance/batch",
+})
+# long-lived streams have their own per-user connection limit
+UNLIMITED_PREFIXES = ("/api/student/qr-stream/",)
+
+
+def endpoint_class(path: str) -> str | None:
+    if not path.startswith("/api/") or path.startswith(UNLIMITED_PREFIXES):
+        return None
+    if path in LOGIN_PATHS:
+        return "login"
+    if path in SCAN_PATHS:
+        return "scan"
+    return "read"
+
+
+class TokenBuckets:
+    # key -> [tokens, last refill], least recently used first; a bucket idle long enough
+    # to refill completely is indistinguishable from a new one, so it is dropped
+    def __init__(self, rate: float, burst: int, maxsize: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.idle_after = burst / rate if rate > 0 else 0.0
+        self._buckets: OrderedDict[object, list[float]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def take(self, key, now: float) -> float:
+        if not self.enabled:
+            return 0.0
+        buckets = self._buckets
+        while buckets and now - next(iter(buckets.values()))[1] >= self.idle_after:
+            buckets.popitem(last=False)
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.maxsize:
+                buckets.popitem(last=False)
+            buckets[key] = [self.burst - 1.0, now]
+            return 0.0
+        buckets.move_to_end(key)
+        tokens = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    # only touched from the event loop thread, so plain counters are enough
+    def __init__(self):
+        self.users = self.ips = self.login_ips = TokenBuckets(0, 0)
+        self.limits: dict[str, int] = {}
+        self.in_flight: dict[str, int] = {}
+
+    def configure(self, settings: Settings) -> None:
+        self.users = TokenBuckets(settings.rate_limit_user_per_second, settings.rate_limit_user_burst, settings.rate_limit_max_buckets)
+        self.ips = TokenBuckets(settings.rate_limit_ip_per_second, settings.rate_limit_ip_burst, settings.rate_limit_max_buckets)
+        self.login_ips = TokenBuckets(
+            settings.rate_limit_login_ip_per_second, settings.rate_limit_login_ip_burst, settings.rate_limit_max_buckets
+        )
+        self.limits = {
+            "login": settings.admission_login_concurrency,
+            "scan": settings.admission_scan_concurrency,
+            "read": settings.admission_read_concurrency,
+        }
+        self.in_flight = dict.fromkeys(self.limits, 0)
+
+    def admit(self, kind: str, client_ip: str, bearer: str | None, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        # a request turned away by the concurrency cap must not spend the caller's tokens
+        limit = self.limits[kind]
+        if limit and self.in_flight[kind] >= limit:
+            return 1.0
+        if kind == "login":
+            wait = self.login_ips.take(client_ip, now)
+        else:
+            user_id = token_user_id(bearer) if bearer else None
+            wait = self.ips.take(client_ip, now) if user_id is None else self.users.take(user_id, now)
+        if wait:
+            return wait
+        self.in_flight[kind] += 1
+        return 0.0
+
+    def release(self, kind: str) -> None:
+        self.in_flight[kind] -= 1
+
+
+admission = AdmissionController()
+
+
+def _bearer(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        kind = endpoint_class(scope["path"]) if scope["type"] == "http" else None
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        wait = admission.admit(kind, client[0] if client else "", _bearer(scope))
+        if wait:
+            response = JSONResponse(
+                {"detail": "Too many requests, slow down"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(kind)
@@ -1,20 +1,26 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from . import crud, schemas, models
+from . import crud, fast_json, presence, reports, schemas, models, signed_qr
 from .database import SessionLocal
-from typing import List
+from typing import List, Literal
 import pyotp
 import uuid
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
+from email.utils import format_datetime
 from .dependencies import (
     create_access_token,
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+    create_stream_ticket,
     require_roles,
-    get_current_user,
+    get_current_principal,
+    get_stream_principal,
 )
 from . import config as config_module
+from .attendance_queue import attendance_queue, QueueFullError
+from .beacon_cache import BEACONS_RESOURCE
+from .qr_stream import qr_broadcaster
 
 def get_db():
     db = SessionLocal()
@@ -45,7 +51,7 @@ def login_for_access_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires = timedelta(minutes=config_module.get_settings().access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.username, "uid": user.id, "role": user.role},
         expires_delta=access_token_expires,
@@ -57,7 +63,7 @@ def login_for_access_token(
 def get_attendance_count(
     section_id: int | None = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["student", "teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["student", "teacher"])),
 ):
     user_id = current_user.id
     return {"count": crud.count_section_attendance(db, student_id=user_id, section_id=section_id)}
@@ -66,46 +72,127 @@ def get_attendance_count(
 def create_user(
     user: schemas.UserCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     return crud.create_user(db=db, user=user)
 
+# every cached response is revalidated, so auth still runs on each request; "public" lets the proxy share one copy
+SHARED_REVALIDATE = "public, no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+def not_modified(request: Request, response: Response, db: Session, resource: str, cache_control: str) -> Response | None:
+    version, updated_at = crud.resource_stamp(db, resource)
+    headers = {"ETag": f'"{resource}.{version}"', "Cache-Control": cache_control}
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    response.headers.update(headers)
+    # Last-Modified is informational only: it has one-second resolution, so two writes in the same
+    # second would look unchanged to If-Modified-Since; every response carries an ETag instead
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    matched = next((tag for tag in tags if tag == "*" or fast_json.strip_encoding(tag) == headers["ETag"]), None)
+    if matched is None:
+        return None
+    # the 304 names the representation the client holds, including its content-coding suffix
+    if matched != "*":
+        headers["ETag"] = matched
+    fast_json.vary_on_encoding(headers)
+    return Response(status_code=304, headers=headers)
+
+def set_next_cursor(response: Response, rows: list, limit: int) -> None:
+    if len(rows) == limit:
+        response.headers["X-Next-After-Id"] = str(rows[-1].id)
+
 @api_router.get("/users/", response_model=List[schemas.User])
 def read_users(
+    request: Request,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(default=100, ge=1, le=1000),
+    after_id: int | None = None,
+    role: str | None = None,
+    section_id: int | None = None,
+    name_prefix: str | None = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+    if (cached := not_modified(request, response, db, crud.USERS_RESOURCE, SHARED_REVALIDATE)) is not None:
+        return cached
+    users = crud.get_users(
+        db, skip=skip, limit=limit, after_id=after_id, role=role, section_id=section_id, name_prefix=name_prefix
+    )
+    set_next_cursor(response, users, limit)
+    return fast_json.rows_response(request, response, users)
+
+ATTENDANCE_DENIED = {
+    400: "Student not in section",
+    403: "Teacher not assigned to this section",
+}
+
+def raise_for_attendance_status(status_code: int) -> None:
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail=ATTENDANCE_DENIED[status_code])
 
 @api_router.post("/attendance/manual", response_model=schemas.SectionAttendance)
 def manual_attendance(
     attendance: schemas.ManualAttendance,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
-    if not crud.is_teacher_in_section(db, section_id=attendance.section_id, teacher_id=current_user.id):
-        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
-    if not crud.is_student_in_section(db, section_id=attendance.section_id, student_id=attendance.student_id):
-        raise HTTPException(status_code=400, detail="Student not in section")
-    return crud.mark_section_attendance(db=db, section_id=attendance.section_id, student_id=attendance.student_id)
+    status_code, db_attendance = crud.authorize_and_mark_section_attendance(
+        db, section_id=attendance.section_id, student_id=attendance.student_id, teacher_id=current_user.id
+    )
+    raise_for_attendance_status(status_code)
+    return db_attendance
+
+@api_router.post("/attendance/batch", response_model=List[schemas.BatchAttendanceResult])
+def batch_attendance(
+    batch: schemas.BatchAttendance,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    allowed_sections = crud.teacher_section_ids(db, current_user.id, {item.section_id for item in batch.items})
+    members = crud.section_student_pairs(
+        db, {(item.section_id, item.student_id) for item in batch.items if item.section_id in allowed_sections}
+    )
+
+    results = []
+    rows = []
+    for index, item in enumerate(batch.items):
+        if item.section_id not in allowed_sections:
+            results.append(schemas.BatchAttendanceResult(index=index, status_code=403, detail=ATTENDANCE_DENIED[403]))
+        elif (item.section_id, item.student_id) not in members:
+            results.append(schemas.BatchAttendanceResult(index=index, status_code=400, detail=ATTENDANCE_DENIED[400]))
+        else:
+            timestamp = reports.naive_utc(item.timestamp or datetime.utcnow())
+            results.append(schemas.BatchAttendanceResult(index=index, status_code=200))
+            rows.append({"section_id": item.section_id, "student_id": item.student_id, "timestamp": timestamp})
+
+    marks = iter(crud.bulk_mark_section_attendance(db, rows))
+    for result in results:
+        if result.status_code == 200:
+            result.attendance = schemas.SectionAttendance.model_validate(next(marks))
+    return results
 
 @api_router.get("/student/qr-token/{user_id}")
 def get_student_qr_token(
     user_id: int,
+    format: Literal["totp", "signed"] = "totp",
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.Principal = Depends(get_current_principal),
 ):
     user = crud.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if current_user.role != "teacher" and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
+    if format == "signed":
+        return {"token": signed_qr.issue(user_id), "expires_in": signed_qr.seconds_left()}
     if not user.otp_secret:
         secret = pyotp.random_base32()
         crud.set_user_otp_secret(db, user_id, secret)
@@ -114,31 +201,86 @@ def get_student_qr_token(
     totp = pyotp.TOTP(user.otp_secret)
     return {"token": totp.now(), "expires_in": 30}
 
+@api_router.get("/student/qr-key/{user_id}")
+def get_student_qr_key(
+    user_id: int,
+    current_user: schemas.Principal = Depends(require_roles(["student"])),
+):
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return signed_qr.key_payload(user_id)
+
+@api_router.post("/student/qr-stream-ticket/{user_id}")
+def get_student_qr_stream_ticket(
+    user_id: int,
+    current_user: schemas.Principal = Depends(get_current_principal),
+):
+    if current_user.role != "teacher" and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"ticket": create_stream_ticket(current_user), "expires_in": config_module.get_settings().qr_stream_ticket_seconds}
+
+@api_router.get("/student/qr-stream/{user_id}")
+def stream_student_qr_token(
+    user_id: int,
+    current_user: schemas.Principal = Depends(get_stream_principal),
+):
+    if current_user.role != "teacher" and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if qr_broadcaster.connections(user_id) >= config_module.get_settings().qr_stream_max_connections_per_user:
+        raise HTTPException(status_code=429, detail="Too many open QR streams for this user")
+    # the stream stays open for minutes; a session from get_db would hold a pooled connection all that time
+    db = SessionLocal()
+    try:
+        user = crud.get_user(db, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        secret = user.otp_secret
+        if not secret:
+            secret = pyotp.random_base32()
+            crud.set_user_otp_secret(db, user_id, secret)
+    finally:
+        db.close()
+
+    return StreamingResponse(
+        qr_broadcaster.stream(user_id, secret),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @api_router.post("/attendance/scan-student", response_model=schemas.SectionAttendance)
 def scan_student_qr(
     token: str,
     section_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
-    users = crud.get_users(db)
-    for user in users:
-        if user.otp_secret:
-            totp = pyotp.TOTP(user.otp_secret)
-            if totp.verify(token):
-                if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
-                    raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
-                if not crud.is_student_in_section(db, section_id=section_id, student_id=user.id):
-                    raise HTTPException(status_code=400, detail="Student not in section")
-                return crud.mark_section_attendance(db, section_id=section_id, student_id=user.id)
-
-    raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if signed_qr.is_signed(token):
+        student_id = signed_qr.verify(token)
+        candidates = [] if student_id is None else [student_id]
+    else:
+        candidates = crud.find_user_ids_by_totp(db, token)
+    if not candidates:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if len(candidates) > 1:
+        # resolving the owner reads the roster, which only the section's teachers may see
+        if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+            raise_for_attendance_status(403)
+        members = sorted(uid for _, uid in crud.section_student_pairs(db, {(section_id, uid) for uid in candidates}))
+        if len(members) > 1:
+            raise HTTPException(status_code=409, detail="Ambiguous token, ask the student to refresh the code")
+        candidates = members or candidates
+    status_code, db_attendance = crud.authorize_and_mark_section_attendance(
+        db, section_id=section_id, student_id=candidates[0], teacher_id=current_user.id
+    )
+    raise_for_attendance_status(status_code)
+    return db_attendance
 
 @api_router.post("/teacher/master-qr/enable/{teacher_id}")
 def enable_master_qr(
     teacher_id: int,
+    section_id: int | None = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     teacher = crud.get_user(db, teacher_id)
     if not teacher or teacher.role != 'teacher':
@@ -146,15 +288,19 @@ def enable_master_qr(
     if current_user.id != teacher_id:
         raise HTTPException(status_code=403, detail="You can only enable your own master QR")
     
+    if section_id is not None and not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=teacher_id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+
     new_secret = str(uuid.uuid4())
-    crud.update_master_qr_mode(db, teacher_id, True, new_secret)
-    return {"message": "Master QR mode enabled", "master_qr_secret": new_secret}
+    crud.update_master_qr_mode(db, teacher_id, True, new_secret, section_id=section_id)
+    session = crud.find_active_master_qr_session(db, new_secret)
+    return {"message": "Master QR mode enabled", "master_qr_secret": new_secret, "expires_at": session.expires_at}
 
 @api_router.post("/teacher/master-qr/disable/{teacher_id}")
 def disable_master_qr(
     teacher_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     teacher = crud.get_user(db, teacher_id)
     if not teacher or teacher.role != 'teacher':
@@ -172,14 +318,13 @@ def scan_lecture_qr(
     section_id: int,
     beacon_id: str | None = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["student"])),
+    current_user: schemas.Principal = Depends(require_roles(["student"])),
 ):
-    teacher = crud.find_teacher_by_master_secret(db, secret)
-    if not teacher:
+    session = crud.find_active_master_qr_session(db, secret)
+    if not session:
         raise HTTPException(status_code=400, detail="Invalid or inactive Master QR code")
-
-    if not crud.is_student_in_section(db, section_id=section_id, student_id=student_id):
-        raise HTTPException(status_code=400, detail="Student not in section")
+    if session.section_id is not None and session.section_id != section_id:
+        raise HTTPException(status_code=400, detail="Master QR code belongs to another section")
 
     if config_module.get_settings().enable_ble_check:
         if beacon_id is None:
@@ -187,28 +332,44 @@ def scan_lecture_qr(
         if not crud.is_beacon_allowed_for_section(db, section_id=section_id, beacon_id=beacon_id):
             raise HTTPException(status_code=403, detail="BLE beacon not recognized for this section")
 
-    crud.mark_section_attendance(db, section_id=section_id, student_id=student_id)
-    return {"message": f"Attendance marked by master QR from {teacher.full_name}"}
+    if attendance_queue.running:
+        if not crud.is_student_in_section(db, section_id=section_id, student_id=student_id):
+            raise HTTPException(status_code=400, detail="Student not in section")
+        try:
+            attendance_queue.enqueue(section_id=section_id, student_id=student_id)
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Attendance queue is full", headers={"Retry-After": "1"})
+    else:
+        status_code, _ = crud.authorize_and_mark_section_attendance(db, section_id=section_id, student_id=student_id)
+        raise_for_attendance_status(status_code)
+    return {"message": f"Attendance marked by master QR from {session.teacher_name}"}
 
 
 @api_router.post("/sections", response_model=schemas.Section)
 def create_section(
     section: schemas.SectionCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     return crud.create_section(db, section)
 
 @api_router.get("/sections", response_model=List[schemas.Section])
-def list_sections(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.list_sections(db)
+def list_sections(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(get_current_principal),
+):
+    if (cached := not_modified(request, response, db, crud.SECTIONS_RESOURCE, SHARED_REVALIDATE)) is not None:
+        return cached
+    return fast_json.rows_response(request, response, crud.list_sections(db))
 
 @api_router.post("/sections/{section_id}/beacons", response_model=schemas.SectionBeacon)
 def add_beacon(
     section_id: int,
     beacon: schemas.SectionBeaconCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     if beacon.section_id != section_id:
         raise HTTPException(status_code=400, detail="section_id mismatch")
@@ -219,19 +380,196 @@ def add_beacon(
 @api_router.get("/sections/{section_id}/beacons", response_model=List[schemas.SectionBeacon])
 def list_beacons(
     section_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
         raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
-    return crud.list_section_beacons(db, section_id)
+    if (cached := not_modified(request, response, db, BEACONS_RESOURCE, PRIVATE_REVALIDATE)) is not None:
+        return cached
+    return fast_json.rows_response(request, response, crud.list_section_beacons(db, section_id))
+
+@api_router.get("/sections/{section_id}/students", response_model=List[schemas.RosterEntry])
+def list_section_students(
+    section_id: int,
+    request: Request,
+    response: Response,
+    after_id: int | None = None,
+    limit: int = Query(default=500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    resource = crud.section_students_resource(section_id)
+    if (cached := not_modified(request, response, db, resource, PRIVATE_REVALIDATE)) is not None:
+        return cached
+    roster = crud.get_section_roster(db, section_id, after_id=after_id, limit=limit)
+    set_next_cursor(response, roster, limit)
+    return fast_json.rows_response(request, response, roster)
+
+ReportFormat = Literal["json", "csv", "parquet", "arrow"]
+
+def export_chunks(fmt: str, build, **params):
+    db = SessionLocal()
+    try:
+        yield from reports.EXPORTERS[fmt](*build(db, **params))
+    finally:
+        db.close()
+
+def report_response(db: Session, fmt: str, filename: str, build, **params):
+    if fmt == "json":
+        columns, rows = build(db, **params)
+        names = [name for name, _ in columns]
+        return [dict(zip(names, row)) for row in rows]
+    if fmt != "csv" and not reports.columnar_available():
+        raise HTTPException(status_code=501, detail="Parquet/Arrow export requires pyarrow")
+    return StreamingResponse(
+        export_chunks(fmt, build, **params),
+        media_type=reports.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+@api_router.get("/reports/sections/{section_id}/matrix")
+def attendance_matrix_report(
+    section_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    fmt: ReportFormat = Query(default="json", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    return report_response(
+        db, fmt, f"section-{section_id}-matrix", reports.attendance_matrix, section_id=section_id, start=start, end=end
+    )
+
+@api_router.get("/reports/sections/{section_id}/rates")
+def attendance_rates_report(
+    section_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    fmt: ReportFormat = Query(default="json", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    return report_response(
+        db, fmt, f"section-{section_id}-rates", reports.attendance_rates, section_id=section_id, start=start, end=end
+    )
+
+@api_router.get("/reports/sections/{section_id}/absentees")
+def absentees_report(
+    section_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    max_rate: float = Query(default=0.0, ge=0.0, le=1.0),
+    fmt: ReportFormat = Query(default="json", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    return report_response(
+        db, fmt, f"section-{section_id}-absentees", reports.attendance_rates,
+        section_id=section_id, start=start, end=end, max_rate=max_rate,
+    )
+
+def lecture_summary(lecture: models.LectureSession) -> schemas.LectureSession:
+    return schemas.LectureSession(
+        id=lecture.id,
+        section_id=lecture.section_id,
+        master_qr_session_id=lecture.master_qr_session_id,
+        starts_at=lecture.starts_at,
+        ends_at=lecture.ends_at,
+        roster_size=lecture.roster_size,
+        present=presence.decode(lecture.presence).bit_count(),
+    )
+
+def rate(attended: int, held: int) -> float:
+    return round(attended / held, 4) if held else 0.0
+
+@api_router.post("/sections/{section_id}/lectures", response_model=schemas.LectureSession)
+def create_lecture(
+    section_id: int,
+    lecture: schemas.LectureSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    starts_at = reports.naive_utc(lecture.starts_at or datetime.utcnow())
+    minutes = lecture.minutes or config_module.get_settings().master_qr_session_minutes
+    ends_at = reports.naive_utc(lecture.ends_at) if lecture.ends_at else starts_at + timedelta(minutes=minutes)
+    if ends_at <= starts_at:
+        raise HTTPException(status_code=400, detail="Lecture must end after it starts")
+    return lecture_summary(crud.create_lecture_session(db, section_id, starts_at, ends_at))
+
+@api_router.get("/sections/{section_id}/lectures", response_model=List[schemas.LectureSession])
+def list_lectures(
+    section_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    start, end = reports.naive_utc(start), reports.naive_utc(end)
+    return [lecture_summary(lecture) for lecture in crud.list_lecture_sessions(db, section_id, start, end)]
+
+@api_router.get("/sections/{section_id}/lectures/rates", response_model=schemas.LectureRates)
+def lecture_rates(
+    section_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    start, end = reports.naive_utc(start), reports.naive_utc(end)
+    lectures, present, expected, students = crud.lecture_rates(db, section_id, start, end)
+    return schemas.LectureRates(
+        lectures=lectures,
+        present=present,
+        expected=expected,
+        rate=rate(present, expected),
+        students=[
+            schemas.LectureStudentRate(id=user_id, full_name=full_name, attended=attended, held=held, rate=rate(attended, held))
+            for user_id, full_name, attended, held in students
+        ],
+    )
+
+@api_router.get("/sections/{section_id}/lectures/{lecture_id}", response_model=schemas.LectureAttendance)
+def lecture_attendance(
+    section_id: int,
+    lecture_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if not crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+        raise HTTPException(status_code=403, detail="Teacher not assigned to this section")
+    lecture = crud.get_lecture_session(db, section_id, lecture_id)
+    if lecture is None:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+    present, absent = crud.lecture_attendance(db, lecture)
+    return schemas.LectureAttendance(
+        lecture=lecture_summary(lecture),
+        present=[schemas.RosterEntry(id=user_id, full_name=full_name) for user_id, full_name in present],
+        absent=[schemas.RosterEntry(id=user_id, full_name=full_name) for user_id, full_name in absent],
+    )
 
 @api_router.post("/sections/{section_id}/students/{student_id}")
 def add_student_to_section(
     section_id: int,
     student_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     user = crud.get_user(db, student_id)
     if not user or user.role != 'student':
@@ -244,7 +582,7 @@ def add_teacher_to_section(
     section_id: int,
     teacher_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["teacher"])),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
 ):
     user = crud.get_user(db, teacher_id)
     if not user or user.role != 'teacher':
@@ -0,0 +1,109 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import pyotp
+
+from . import async_crud, database, schemas, signed_qr
+from . import config as config_module
+from .api import raise_for_attendance_status
+from .attendance_queue import attendance_queue, QueueFullError
+from .dependencies import require_roles, get_current_principal
+
+
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+async_api_router = APIRouter()
+
+@async_api_router.get("/attendance/count")
+async def get_attendance_count(
+    section_id: int | None = None,
+    db=Depends(get_async_db),
+    current_user: schemas.Principal = Depends(require_roles(["student", "teacher"])),
+):
+    return {"count": await async_crud.count_section_attendance(db, student_id=current_user.id, section_id=section_id)}
+
+@async_api_router.get("/student/qr-token/{user_id}")
+async def get_student_qr_token(
+    user_id: int,
+    format: Literal["totp", "signed"] = "totp",
+    db=Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_current_principal),
+):
+    user = await async_crud.get_user(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if current_user.role != "teacher" and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if format == "signed":
+        return {"token": signed_qr.issue(user_id), "expires_in": signed_qr.seconds_left()}
+    if not user.otp_secret:
+        secret = pyotp.random_base32()
+        await async_crud.set_user_otp_secret(db, user_id, secret)
+        user.otp_secret = secret
+
+    totp = pyotp.TOTP(user.otp_secret)
+    return {"token": totp.now(), "expires_in": 30}
+
+@async_api_router.post("/attendance/scan-student", response_model=schemas.SectionAttendance)
+async def scan_student_qr(
+    token: str,
+    section_id: int,
+    db=Depends(get_async_db),
+    current_user: schemas.Principal = Depends(require_roles(["teacher"])),
+):
+    if signed_qr.is_signed(token):
+        student_id = signed_qr.verify(token)
+        candidates = [] if student_id is None else [student_id]
+    else:
+        candidates = await async_crud.find_user_ids_by_totp(db, token)
+    if not candidates:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if len(candidates) > 1:
+        # resolving the owner reads the roster, which only the section's teachers may see
+        if not await async_crud.is_teacher_in_section(db, section_id=section_id, teacher_id=current_user.id):
+            raise_for_attendance_status(403)
+        members = await async_crud.section_student_ids(db, section_id, candidates)
+        if len(members) > 1:
+            raise HTTPException(status_code=409, detail="Ambiguous token, ask the student to refresh the code")
+        candidates = members or candidates
+    status_code, db_attendance = await async_crud.authorize_and_mark_section_attendance(
+        db, section_id=section_id, student_id=candidates[0], teacher_id=current_user.id
+    )
+    raise_for_attendance_status(status_code)
+    return db_attendance
+
+@async_api_router.post("/attendance/scan-lecture")
+async def scan_lecture_qr(
+    secret: str,
+    student_id: int,
+    section_id: int,
+    beacon_id: str | None = None,
+    db=Depends(get_async_db),
+    current_user: schemas.Principal = Depends(require_roles(["student"])),
+):
+    session = await async_crud.find_active_master_qr_session(db, secret)
+    if not session:
+        raise HTTPException(status_code=400, detail="Invalid or inactive Master QR code")
+    if session.section_id is not None and session.section_id != section_id:
+        raise HTTPException(status_code=400, detail="Master QR code belongs to another section")
+
+    if config_module.get_settings().enable_ble_check:
+        if beacon_id is None:
+            raise HTTPException(status_code=400, detail="BLE beacon not provided")
+        if not await async_crud.is_beacon_allowed_for_section(db, section_id=section_id, beacon_id=beacon_id):
+            raise HTTPException(status_code=403, detail="BLE beacon not recognized for this section")
+
+    if attendance_queue.running:
+        if not await async_crud.is_student_in_section(db, section_id=section_id, student_id=student_id):
+            raise HTTPException(status_code=400, detail="Student not in section")
+        try:
+            await run_in_threadpool(attendance_queue.enqueue, section_id=section_id, student_id=student_id)
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Attendance queue is full", headers={"Retry-After": "1"})
+    else:
+        status_code, _ = await async_crud.authorize_and_mark_section_attendance(db, section_id=section_id, student_id=student_id)
+        raise_for_attendance_status(status_code)
+    return {"message": f"Attendance marked by master QR from {session.teacher_name}"}
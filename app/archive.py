@@ -0,0 +1,74 @@
+import datetime
+
+from sqlalchemy import and_, delete, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+from . import config as config_module
+
+ARCHIVED_TABLES = [
+    (models.SectionAttendance, models.SectionAttendanceArchive),
+    (models.Attendance, models.AttendanceArchive),
+]
+
+
+def partition_start(timestamp: datetime.datetime, months: list[int]) -> datetime.datetime:
+    months = sorted(set(months))
+    for month in reversed(months):
+        if timestamp.month >= month:
+            return datetime.datetime(timestamp.year, month, 1)
+    return datetime.datetime(timestamp.year - 1, months[-1], 1)
+
+def partition_end(start: datetime.datetime, months: list[int]) -> datetime.datetime:
+    later = [month for month in sorted(set(months)) if month > start.month]
+    if later:
+        return datetime.datetime(start.year, later[0], 1)
+    return datetime.datetime(start.year + 1, min(months), 1)
+
+def partition_name(table: str, start: datetime.datetime) -> str:
+    return f"{table}_{start:%Y_%m}"
+
+def history(hot, archive):
+    columns = [column.name for column in archive.__table__.columns]
+    return union_all(
+        select(*[hot.__table__.c[name] for name in columns]),
+        select(*[archive.__table__.c[name] for name in columns]),
+    ).subquery(f"{hot.__tablename__}_history")
+
+def section_attendance_history():
+    return history(models.SectionAttendance, models.SectionAttendanceArchive)
+
+def _create_partition(db: Session, archive, start: datetime.datetime, end: datetime.datetime) -> None:
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(archive.__tablename__, start)} "
+        f"PARTITION OF {archive.__tablename__} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+def _move_rows(db: Session, dialect: str, hot, archive, start: datetime.datetime, end: datetime.datetime) -> int:
+    columns = [column.name for column in archive.__table__.columns]
+    source = [hot.__table__.c[name] for name in columns]
+    closed = and_(hot.timestamp >= start, hot.timestamp < end)
+    if dialect == "postgresql":
+        moved = delete(hot).where(closed).returning(*source).cte("moved")
+        return db.execute(insert(archive).from_select(columns, select(moved))).rowcount
+    moved = db.execute(insert(archive).from_select(columns, select(*source).where(closed))).rowcount
+    db.execute(delete(hot).where(closed))
+    return moved
+
+def archive_closed_partitions(
+    db: Session, before: datetime.datetime | None = None
+) -> list[tuple[str, datetime.datetime, datetime.datetime, int]]:
+    months = config_module.get_settings().attendance_partition_months
+    cutoff = partition_start(before or datetime.datetime.utcnow(), months)
+    dialect = db.get_bind().dialect.name
+    archived = []
+    for hot, archive in ARCHIVED_TABLES:
+        while (oldest := db.scalar(select(func.min(hot.timestamp)))) is not None and oldest < cutoff:
+            start = partition_start(oldest, months)
+            end = partition_end(start, months)
+            if dialect == "postgresql":
+                _create_partition(db, archive, start, end)
+            moved = _move_rows(db, dialect, hot, archive, start, end)
+            db.commit()
+            archived.append((hot.__tablename__, start, end, moved))
+    return archived
@@ -0,0 +1,149 @@
+import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .beacon_cache import BEACONS_RESOURCE, beacon_allow_list
+from .cache import master_session_cache, publish_invalidation, user_cache
+from .crud import (
+    LECTURE_PRESENCE_CAS_ATTEMPTS,
+    active_master_qr_session_query,
+    attendance_counter_rows,
+    attendance_counter_upsert,
+    attendance_row,
+    attendance_window_minutes,
+    authorized_attendance_insert,
+    cache_master_qr_session,
+    covering_lecture_id,
+    covering_lectures_query,
+    duplicate_attendance_query,
+    failed_membership_check,
+    lecture_mark_groups,
+    lecture_presence_bits,
+    lecture_presence_query,
+    lecture_presence_swap,
+    lecture_session_window,
+    mark_time_range,
+    membership_checks_query,
+    section_beacon_ids_query,
+    section_membership_checks,
+    student_positions_query,
+)
+from .qr_stream import qr_broadcaster
+from .totp_index import TOTP_NAMESPACE, totp_index
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+async def set_user_otp_secret(db: AsyncSession, user_id: int, secret: str):
+    db_user = await get_user(db, user_id)
+    if db_user:
+        db_user.otp_secret = secret
+        await db.commit()
+        await db.refresh(db_user)
+        totp_index.set_secret(user_id, secret)
+        qr_broadcaster.set_secret(user_id, secret)
+        publish_invalidation(TOTP_NAMESPACE, user_id)
+        user_cache.invalidate(user_id)
+    return db_user
+
+async def otp_secrets(db: AsyncSession) -> list[tuple[int, str]]:
+    result = await db.execute(select(models.User.id, models.User.otp_secret).where(models.User.otp_secret.isnot(None)))
+    return result.all()
+
+async def find_user_ids_by_totp(db: AsyncSession, token: str) -> list[int]:
+    if not totp_index.loaded:
+        totp_index.load(await otp_secrets(db))
+    candidates = totp_index.probe(token)
+    if not candidates and totp_index.reload_due():
+        totp_index.load(await otp_secrets(db))
+        candidates = totp_index.probe(token)
+    return sorted(candidates)
+
+async def find_active_master_qr_session(db: AsyncSession, secret: str):
+    now = datetime.datetime.utcnow()
+    cached = master_session_cache.get(secret)
+    if cached is not None and cached.expires_at > now:
+        return cached
+    return cache_master_qr_session(await db.scalar(active_master_qr_session_query(secret, now)))
+
+async def is_student_in_section(db: AsyncSession, section_id: int, student_id: int) -> bool:
+    return await db.scalar(
+        select(models.SectionStudent.id)
+        .where(models.SectionStudent.section_id == section_id)
+        .where(models.SectionStudent.student_id == student_id)
+        .limit(1)
+    ) is not None
+
+async def is_teacher_in_section(db: AsyncSession, section_id: int, teacher_id: int) -> bool:
+    return await db.scalar(
+        select(models.SectionTeacher.id)
+        .where(models.SectionTeacher.section_id == section_id)
+        .where(models.SectionTeacher.teacher_id == teacher_id)
+        .limit(1)
+    ) is not None
+
+async def is_beacon_allowed_for_section(db: AsyncSession, section_id: int, beacon_id: str) -> bool:
+    if beacon_allow_list.version_check_due():
+        version = await db.scalar(
+            select(models.ResourceVersion.version).where(models.ResourceVersion.name == BEACONS_RESOURCE)
+        )
+        beacon_allow_list.apply_version(version or 0)
+    beacons = beacon_allow_list.get(section_id)
+    if beacons is None:
+        beacons = beacon_allow_list.put(section_id, await db.scalars(section_beacon_ids_query(section_id)))
+    return beacon_id in beacons
+
+async def section_student_ids(db: AsyncSession, section_id: int, student_ids: list[int]) -> list[int]:
+    result = await db.scalars(
+        select(models.SectionStudent.student_id)
+        .where(models.SectionStudent.section_id == section_id)
+        .where(models.SectionStudent.student_id.in_(student_ids))
+    )
+    return sorted(set(result))
+
+async def record_lecture_presence(db: AsyncSession, marks) -> None:
+    for section_id, student_marks in lecture_mark_groups(marks).items():
+        lectures = (await db.execute(covering_lectures_query(section_id, *mark_time_range(student_marks)))).all()
+        if not lectures:
+            continue
+        positions = (await db.execute(student_positions_query(section_id, student_marks))).all()
+        for lecture_id, bits in lecture_presence_bits(student_marks, lectures, positions).items():
+            for attempt in range(LECTURE_PRESENCE_CAS_ATTEMPTS + 1):
+                query = lecture_presence_query(lecture_id, lock=attempt == LECTURE_PRESENCE_CAS_ATTEMPTS)
+                swap = lecture_presence_swap(lecture_id, (await db.execute(query)).one(), bits)
+                if swap is None or (await db.execute(swap)).rowcount:
+                    break
+
+async def authorize_and_mark_section_attendance(
+    db: AsyncSession, section_id: int, student_id: int, teacher_id: int | None = None
+) -> tuple[int, models.SectionAttendance | None]:
+    row = attendance_row(section_id, student_id)
+    minutes = attendance_window_minutes()
+    if minutes > 0:
+        lectures = (await db.execute(covering_lectures_query(section_id, row["timestamp"], row["timestamp"]))).all()
+        row["session_window"] = lecture_session_window(covering_lecture_id(lectures, row["timestamp"]))
+    checks = section_membership_checks(section_id, student_id, teacher_id)
+    dialect = db.get_bind().dialect.name
+    db_attendance = (await db.scalars(authorized_attendance_insert(dialect, row, checks))).first()
+    if db_attendance is not None:
+        await db.execute(attendance_counter_upsert(dialect), attendance_counter_rows([(section_id, student_id)]))
+        await record_lecture_presence(db, [db_attendance])
+        await db.commit()
+        await db.refresh(db_attendance)
+        return 200, db_attendance
+    await db.rollback()
+    status_code = failed_membership_check((await db.execute(membership_checks_query(checks))).one(), checks)
+    if status_code is not None:
+        return status_code, None
+    return 200, await db.scalar(duplicate_attendance_query(row, minutes)) if minutes > 0 else None
+
+async def count_section_attendance(db: AsyncSession, student_id: int, section_id: int | None = None) -> int:
+    count = await db.scalar(
+        select(models.SectionAttendanceCounter.count)
+        .where(models.SectionAttendanceCounter.student_id == student_id)
+        .where(models.SectionAttendanceCounter.section_id == (models.TOTAL_SECTION_ID if section_id is None else section_id))
+    )
+    return count or 0
@@ -0,0 +1,218 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from . import crud
+from .config import get_settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# each worker spills to <attendance_spill_path>.w<pid> and its segments .w<pid>.<n>,
+# holding an flock on .w<pid>.lock for as long as it runs
+WORKER_PREFIX = "w"
+
+
+def _lock_owner(owner: str, blocking: bool = False):
+    while True:
+        fh = open(f"{owner}.lock", "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            fh.close()
+            return None
+        try:
+            if os.stat(fh.name).st_ino == os.fstat(fh.fileno()).st_ino:
+                return fh
+        except FileNotFoundError:
+            pass
+        # a recovering worker removed the lock file between our open and flock
+        fh.close()
+
+
+def _release_owner(fh) -> None:
+    os.remove(fh.name)
+    fh.close()
+
+
+def _segments(owner: str) -> list[str]:
+    found = []
+    for path in glob.glob(f"{glob.escape(owner)}.*"):
+        suffix = path[len(owner) + 1:]
+        if suffix.isdigit():
+            found.append((int(suffix), path))
+    return [path for _, path in sorted(found)]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class AttendanceWriteBehind:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: deque[dict] = deque()
+        self._failed: list[tuple[str, list[dict]]] = []
+        self._failed_rows = 0
+        self._lock = None
+        self._spill = None
+        self._segment = 0
+        self._thread: threading.Thread | None = None
+        self._closing = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        settings = get_settings()
+        self.max_size = settings.attendance_queue_max_size
+        self.batch_size = settings.attendance_flush_batch_size
+        self.interval = settings.attendance_flush_interval_ms / 1000
+        self.put_timeout = settings.attendance_queue_put_timeout_ms / 1000
+        self.spill_base = settings.attendance_spill_path
+        self.spill_path = f"{self.spill_base}.{WORKER_PREFIX}{os.getpid()}"
+        self._lock = _lock_owner(self.spill_path, blocking=True)
+        # segments left by a failed flush before the last stop are on disk and replayed below
+        self._failed, self._failed_rows = [], 0
+        self._recover()
+        self._closing = False
+        self._spill = open(self.spill_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="attendance-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        self._spill.close()
+        self._spill = None
+        if not self._failed and os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) == 0:
+            os.remove(self.spill_path)
+            _release_owner(self._lock)
+        else:
+            # leftovers are replayed by whichever worker starts next
+            self._lock.close()
+        self._lock = None
+
+    def enqueue(self, section_id: int, student_id: int, timestamp: datetime | None = None) -> None:
+        row = {"section_id": section_id, "student_id": student_id, "timestamp": timestamp or datetime.utcnow()}
+        with self._cond:
+            if self._closing:
+                raise QueueFullError()
+            deadline = time.monotonic() + self.put_timeout
+            # rows the DB has not taken yet count too, so an outage turns into 503s instead of unbounded memory
+            while len(self._pending) + self._failed_rows >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closing:
+                    raise QueueFullError()
+                self._cond.wait(remaining)
+            self._spill.write(json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n")
+            self._spill.flush()
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while not self._closing and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closing = self._closing
+                batch = list(self._pending)
+                self._pending.clear()
+                if batch:
+                    self._failed.append((self._rotate(), batch))
+                    self._failed_rows += len(batch)
+                self._cond.notify_all()
+            self._flush_failed()
+            if closing:
+                break
+
+    def _rotate(self) -> str:
+        self._spill.close()
+        self._segment += 1
+        segment = f"{self.spill_path}.{self._segment}"
+        os.replace(self.spill_path, segment)
+        self._spill = open(self.spill_path, "a", encoding="utf-8")
+        return segment
+
+    def _flush_failed(self) -> None:
+        while self._failed:
+            segment, rows = self._failed[0]
+            try:
+                self._write(rows)
+            except Exception:
+                logger.exception("Attendance flush failed, %d rows kept in %s", len(rows), segment)
+                return
+            with self._cond:
+                self._failed.pop(0)
+                self._failed_rows -= len(rows)
+                self._cond.notify_all()
+            os.remove(segment)
+
+    def _write(self, rows: list[dict]) -> None:
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                crud.bulk_mark_section_attendance(db, rows[start:start + self.batch_size])
+        finally:
+            db.close()
+
+    def _owners(self) -> set[str]:
+        # spill files written before per-worker paths belong to the bare attendance_spill_path
+        owners = {self.spill_path}
+        if os.path.exists(self.spill_base):
+            owners.add(self.spill_base)
+        for path in glob.glob(f"{glob.escape(self.spill_base)}.*"):
+            name = path[len(self.spill_base) + 1:].split(".")[0]
+            owners.add(f"{self.spill_base}.{name}" if name.startswith(WORKER_PREFIX) else self.spill_base)
+        return owners
+
+    def _recover(self) -> None:
+        for owner in sorted(self._owners()):
+            lock = self._lock if owner == self.spill_path else _lock_owner(owner)
+            if lock is None:
+                continue  # a running worker owns these files
+            try:
+                for path in _segments(owner) + [owner]:
+                    if os.path.exists(path):
+                        self._replay(path)
+            finally:
+                if lock is not self._lock:
+                    _release_owner(lock)
+
+    def _replay(self, path: str) -> None:
+        with open(path, encoding="utf-8") as fh:
+            rows = [json.loads(line) for line in fh if line.strip()]
+        for row in rows:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        db = SessionLocal()
+        try:
+            # a crash between commit and unlink leaves rows that are already stored
+            stored = crud.existing_section_attendance(db, rows)
+            crud.bulk_mark_section_attendance(
+                db, [row for row in rows if (row["section_id"], row["student_id"], row["timestamp"]) not in stored]
+            )
+        finally:
+            db.close()
+        os.remove(path)
+
+
+attendance_queue = AttendanceWriteBehind()
@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import on_invalidate
+from .config import Settings
+
+BEACONS_RESOURCE = "beacons"
+
+
+class BeaconAllowList:
+    def __init__(self, maxsize: int = 4096, check_interval: float = 2.0):
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._sections: OrderedDict[int, frozenset[str]] = OrderedDict()
+        self._version: int | None = None
+        self._checked_at = float("-inf")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sections.clear()
+            self._version = None
+            self._checked_at = float("-inf")
+
+    def configure(self, maxsize: int, check_interval: float) -> None:
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.clear()
+
+    def version_check_due(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.check_interval
+
+    def apply_version(self, version: int) -> None:
+        with self._lock:
+            if version != self._version:
+                self._sections.clear()
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, section_id: int) -> frozenset[str] | None:
+        with self._lock:
+            beacons = self._sections.get(section_id)
+            if beacons is not None:
+                self._sections.move_to_end(section_id)
+            return beacons
+
+    def put(self, section_id: int, beacons) -> frozenset[str]:
+        beacons = frozenset(beacons)
+        with self._lock:
+            self._sections[section_id] = beacons
+            self._sections.move_to_end(section_id)
+            while len(self._sections) > self.maxsize:
+                self._sections.popitem(last=False)
+        return beacons
+
+    def invalidate(self, section_id: int) -> None:
+        with self._lock:
+            self._sections.pop(section_id, None)
+
+
+beacon_allow_list = BeaconAllowList()
+on_invalidate(BEACONS_RESOURCE, lambda section_id: beacon_allow_list.invalidate(int(section_id)))
+
+
+def configure_beacon_cache(settings: Settings) -> None:
+    beacon_allow_list.configure(settings.beacon_cache_size, settings.beacon_cache_check_interval_seconds)
@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from pydantic import BaseModel
+
+from . import schemas
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "club_check:invalidate"
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InProcessBackend:
+    # shared store and invalidation channel for everything in this process; stands in for Redis in tests
+    errors: tuple[type[Exception], ...] = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, tuple[bytes, float]] = {}
+        self._subscribers: list[Callable[[str], None]] = []
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None or item[1] <= time.monotonic():
+                self._values.pop(key, None)
+                return None
+            return item[0]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def publish(self, message: str) -> None:
+        for callback in list(self._subscribers):
+            callback(message)
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        self._subscribers.append(callback)
+
+    def close(self) -> None:
+        self._subscribers.clear()
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.errors = (redis.RedisError, OSError)
+        self._subscribers: list[Callable[[str], None]] = []
+        self._pubsub = None
+        self._listener = None
+
+    def get(self, key: str) -> bytes | None:
+        return self._redis.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._redis.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(key)
+
+    def publish(self, message: str) -> None:
+        self._redis.publish(INVALIDATION_CHANNEL, message)
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        self._subscribers.append(callback)
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{INVALIDATION_CHANNEL: self._dispatch})
+            self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _dispatch(self, message: dict) -> None:
+        # an exception here would kill the listener thread and silently stop invalidations
+        for callback in list(self._subscribers):
+            try:
+                callback(message["data"].decode())
+            except Exception:
+                logger.exception("Cache invalidation callback failed for %r", message.get("data"))
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._pubsub.close()
+        self._redis.close()
+
+
+_backend: InProcessBackend | RedisBackend | None = None
+_origin = uuid.uuid4().hex
+_handlers: dict[str, list[Callable[[str], None]]] = {}
+
+
+def cache_backend(url: str | None) -> InProcessBackend | RedisBackend | None:
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InProcessBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache url: {url}")
+
+
+def on_invalidate(namespace: str, handler: Callable[[str], None]) -> None:
+    _handlers.setdefault(namespace, []).append(handler)
+
+
+def _shared(operation: str, *args) -> Any:
+    # the shared backend is an optimisation: when it is down, work from the local LRU and the database
+    backend = _backend
+    if backend is None:
+        return None
+    try:
+        return getattr(backend, operation)(*args)
+    except backend.errors as exc:
+        logger.warning("Shared cache %s failed, falling back to the local cache: %s", operation, exc)
+        return None
+
+
+def publish_invalidation(namespace: str, key: Hashable) -> None:
+    _shared("publish", f"{_origin} {namespace} {key}")
+
+
+def _receive(message: str) -> None:
+    try:
+        origin, namespace, key = message.split(" ", 2)
+    except ValueError:
+        logger.warning("Ignoring malformed cache invalidation %r", message)
+        return
+    if origin == _origin:
+        return
+    for handler in _handlers.get(namespace, ()):
+        try:
+            handler(key)
+        except Exception:
+            logger.exception("Cache invalidation handler failed for %s %s", namespace, key)
+
+
+class SharedCache(TTLCache):
+    # per-worker LRU in front of the shared backend; keys are strings so they survive the channel
+    def __init__(self, namespace: str, model: type[BaseModel], maxsize: int = 1024, ttl: float = 60.0):
+        super().__init__(maxsize, ttl)
+        self.namespace = namespace
+        self.model = model
+        on_invalidate(namespace, super().invalidate)
+
+    def _shared_key(self, key: str) -> str:
+        return f"club_check:{self.namespace}:{key}"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        key = str(key)
+        value = super().get(key)
+        if value is not None or _backend is None:
+            return default if value is None else value
+        raw = _shared("get", self._shared_key(key))
+        if raw is None:
+            return default
+        value = self.model.model_validate_json(raw)
+        super().set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: BaseModel) -> None:
+        key = str(key)
+        super().set(key, value)
+        if _backend is not None:
+            _shared("set", self._shared_key(key), value.model_dump_json().encode(), self.ttl)
+
+    def invalidate(self, key: Hashable) -> None:
+        key = str(key)
+        super().invalidate(key)
+        if _backend is not None:
+            _shared("delete", self._shared_key(key))
+            publish_invalidation(self.namespace, key)
+
+
+user_cache = SharedCache("users", schemas.Principal)
+master_session_cache = SharedCache("master_qr_sessions", schemas.MasterQrSession)
+
+
+def close_cache_backend() -> None:
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+
+
+def configure_caches(settings: Settings) -> None:
+    global _backend
+    close_cache_backend()
+    user_cache.configure(settings.user_cache_size, settings.user_cache_ttl_seconds)
+    master_session_cache.configure(settings.master_qr_cache_size, settings.master_qr_cache_ttl_seconds)
+    _backend = cache_backend(settings.cache_url)
+    if _backend is not None:
+        _backend.subscribe(_receive)
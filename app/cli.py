@@ -0,0 +1,70 @@
+import argparse
+import datetime
+import sys
+
+from . import archive, crud
+from .database import SessionLocal
+
+
+def counters(args) -> int:
+    db = SessionLocal()
+    try:
+        if args.action == "rebuild":
+            print(f"Rebuilt {crud.rebuild_attendance_counters(db)} attendance counters")
+            return 0
+        mismatches = crud.verify_attendance_counters(db)
+        for student_id, section_id, stored, expected in mismatches:
+            print(f"student={student_id} section={section_id} stored={stored} expected={expected}")
+        print(f"{len(mismatches)} mismatched attendance counters")
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+
+def lectures(args) -> int:
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt presence of {crud.rebuild_lecture_presence(db)} lectures")
+        return 0
+    finally:
+        db.close()
+
+
+def attendance(args) -> int:
+    db = SessionLocal()
+    try:
+        archived = archive.archive_closed_partitions(db, before=args.before)
+        for table, start, end, moved in archived:
+            print(f"{table} {start:%Y-%m-%d}..{end:%Y-%m-%d}: archived {moved} rows")
+        print(f"{len(archived)} partitions archived")
+        return 0
+    finally:
+        db.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    counters_parser = commands.add_parser("counters", help="Recompute or check attendance counters from raw marks")
+    counters_parser.add_argument("action", choices=["rebuild", "verify"])
+    counters_parser.set_defaults(handler=counters)
+
+    lectures_parser = commands.add_parser("lectures", help="Recompute lecture presence bitmaps from raw marks")
+    lectures_parser.add_argument("action", choices=["rebuild"])
+    lectures_parser.set_defaults(handler=lectures)
+
+    attendance_parser = commands.add_parser("attendance", help="Move marks of closed partitions into archive tables")
+    attendance_parser.add_argument("action", choices=["archive"])
+    attendance_parser.add_argument(
+        "--before", type=datetime.datetime.fromisoformat, default=None,
+        help="Archive partitions that start before the one containing this date (default: now)",
+    )
+    attendance_parser.set_defaults(handler=attendance)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import List
+from typing import List, Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -14,17 +14,83 @@ class Settings(BaseSettings):
 
     secret_key: str = Field(default="change-me-in-production", description="JWT secret key")
     jwt_algorithm: str = "HS256"
+    student_qr_key: str | None = Field(default=None, description="HKDF master key for signed student QR codes, defaults to secret_key")
     access_token_expire_minutes: int = 60
+    trust_token_claims: bool = Field(default=True, description="Authorize by the signed uid/role claims without a user lookup")
+    bcrypt_rounds: int = Field(default=12, description="Existing hashes are upgraded on the next login when this changes")
+    password_hash_workers: int = Field(default=2, description="Processes for bcrypt work, 0 hashes inline")
+    password_hash_max_pending: int = 32
+    password_hash_timeout: float = 10.0
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 60.0
+    master_qr_session_minutes: int = 120
+    master_qr_cache_size: int = 1024
+    master_qr_cache_ttl_seconds: float = Field(default=30.0, description="How long other workers may accept a disabled master QR")
+    cache_url: str | None = Field(
+        default=None, description="redis://... shares cached users/sessions and invalidations between workers, unset keeps them per process"
+    )
 
     database_url: str = Field(default="sqlite:///./club_check.db")
+    async_database: bool = Field(default=False, description="Serve the hot attendance endpoints from an async engine")
+    async_database_url: str | None = Field(default=None, description="Defaults to database_url with an async driver")
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    ops_token: str | None = Field(default=None, description="Bearer token for /health/db-pool and /metrics, unset hides them")
+    sqlite_journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"] = "WAL"
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456
 
     cors_origins: str = Field(default="*")
+    response_compression_min_bytes: int = Field(default=1024, description="Compress list responses from this size, 0 disables")
+    response_gzip_level: int = 5
+    response_brotli_quality: int = Field(default=4, description="Used when the brotli package is installed")
+
+    admission_control: bool = Field(default=False, description="Token buckets and per-class concurrency limits, excess gets 429")
+    rate_limit_user_per_second: float = 5.0
+    rate_limit_user_burst: int = 20
+    rate_limit_ip_per_second: float = Field(default=10.0, description="Requests without a valid token, per client IP")
+    rate_limit_ip_burst: int = 50
+    rate_limit_login_ip_per_second: float = Field(default=2.0, description="Login/register per client IP; a campus NAT shares one")
+    rate_limit_login_ip_burst: int = 60
+    rate_limit_max_buckets: int = 100000
+    admission_login_concurrency: int = Field(default=8, description="In-flight requests per endpoint class, 0 is unlimited")
+    admission_scan_concurrency: int = 32
+    admission_read_concurrency: int = 64
+
+    metrics_enabled: bool = Field(default=False, description="Request/query instrumentation and GET /metrics")
+    metrics_slow_query_ms: float = 200.0
+    metrics_n_plus_one_threshold: int = Field(default=5, description="Log a request that runs one statement this many times")
 
     create_tables_on_startup: bool = True
     seed_on_startup: bool = False
 
+    attendance_session_window_minutes: int = Field(
+        default=0,
+        description="When > 0: one mark per student per lecture session, and outside lectures a repeat "
+        "within this many minutes of an earlier mark returns that mark; 0 keeps every mark",
+    )
+    attendance_write_behind: bool = False
+    attendance_queue_max_size: int = 10000
+    attendance_queue_put_timeout_ms: int = 100
+    attendance_flush_interval_ms: int = 200
+    attendance_flush_batch_size: int = 500
+    attendance_spill_path: str = Field(default="./attendance_spill.jsonl", description="Base path shared by workers; each writes <path>.w<pid> under an flock and replays those of dead workers")
+    attendance_partition_months: List[int] = Field(
+        default_factory=lambda: list(range(1, 13)),
+        description="Months that open an archive partition, e.g. [9, 2] for autumn/spring terms",
+    )
+
+    qr_stream_max_connections_per_user: int = 3
+    qr_stream_ticket_seconds: int = Field(default=60, description="Lifetime of the single-purpose JWT an EventSource passes in the URL")
+
     enable_ble_check: bool = False
     ble_service_uuid_hint: str | None = None
+    beacon_cache_size: int = 4096
+    beacon_cache_check_interval_seconds: float = Field(default=2.0, description="How often a worker compares its beacon cache with the shared version")
 
 
 @lru_cache()
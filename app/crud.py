@@ -1,9 +1,20 @@
 
-from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
+import datetime
+from collections import Counter
+from typing import Iterable
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from sqlalchemy import and_, func, insert, literal, or_, select, text, tuple_, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from . import models, presence, schemas
+from . import config as config_module
+from .archive import section_attendance_history
+from .beacon_cache import BEACONS_RESOURCE, beacon_allow_list
+from .cache import master_session_cache, publish_invalidation, user_cache
+from .passwords import password_hasher
+from .qr_stream import qr_broadcaster
+from .totp_index import TOTP_NAMESPACE, totp_index
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
@@ -11,28 +22,70 @@ def get_user(db: Session, user_id: int):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int | None = None,
+    role: str | None = None,
+    section_id: int | None = None,
+    name_prefix: str | None = None,
+):
+    query = db.query(models.User.username, models.User.full_name, models.User.role, models.User.id)
+    if after_id is not None:
+        query = query.filter(models.User.id > after_id)
+    if role is not None:
+        query = query.filter(models.User.role == role)
+    if section_id is not None:
+        members = union(
+            select(models.SectionStudent.student_id).where(models.SectionStudent.section_id == section_id),
+            select(models.SectionTeacher.teacher_id).where(models.SectionTeacher.section_id == section_id),
+        )
+        query = query.filter(models.User.id.in_(members))
+    if name_prefix:
+        query = query.filter(
+            or_(
+                models.User.username.startswith(name_prefix, autoescape=True),
+                models.User.full_name.startswith(name_prefix, autoescape=True),
+            )
+        )
+    return query.order_by(models.User.id).offset(skip).limit(limit).all()
+
+def get_section_roster(db: Session, section_id: int, after_id: int | None = None, limit: int = 500):
+    query = (
+        db.query(models.User.id, models.User.full_name)
+        .join(models.SectionStudent, models.SectionStudent.student_id == models.User.id)
+        .filter(models.SectionStudent.section_id == section_id)
+    )
+    if after_id is not None:
+        query = query.filter(models.User.id > after_id)
+    return query.order_by(models.User.id).limit(limit).all()
 
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = password_hasher.hash(user.password)
     db_user = models.User(username=user.username, full_name=user.full_name, hashed_password=hashed_password, role=user.role)
     db.add(db_user)
+    bump_resource_version(db, USERS_RESOURCE)
     db.commit()
     db.refresh(db_user)
     return db_user
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_and_update(plain_password, hashed_password)[0]
 
 
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+        db.refresh(user)
     return user
 
 def mark_attendance(db: Session, student_id: int):
@@ -48,52 +101,374 @@ def set_user_otp_secret(db: Session, user_id: int, secret: str):
         db_user.otp_secret = secret
         db.commit()
         db.refresh(db_user)
+        totp_index.set_secret(user_id, secret)
+        qr_broadcaster.set_secret(user_id, secret)
+        publish_invalidation(TOTP_NAMESPACE, user_id)
+        user_cache.invalidate(user_id)
     return db_user
 
-def update_master_qr_mode(db: Session, teacher_id: int, enabled: bool, secret: str = None):
+def otp_secrets(db: Session) -> list[tuple[int, str]]:
+    return db.query(models.User.id, models.User.otp_secret).filter(models.User.otp_secret.isnot(None)).all()
+
+def find_user_ids_by_totp(db: Session, token: str) -> list[int]:
+    if not totp_index.loaded:
+        totp_index.load(otp_secrets(db))
+    candidates = totp_index.probe(token)
+    if not candidates and totp_index.reload_due():
+        # secrets written by another worker only reach this index through a reload
+        totp_index.load(otp_secrets(db))
+        candidates = totp_index.probe(token)
+    return sorted(candidates)
+
+def update_master_qr_mode(
+    db: Session,
+    teacher_id: int,
+    enabled: bool,
+    secret: str = None,
+    section_id: int | None = None,
+    minutes: int | None = None,
+):
     db_teacher = get_user(db, teacher_id)
     if db_teacher and db_teacher.role == 'teacher':
+        now = datetime.datetime.utcnow()
+        active = (
+            db.query(models.MasterQrSession)
+            .filter(models.MasterQrSession.teacher_id == teacher_id)
+            .filter(models.MasterQrSession.expires_at > now)
+            .all()
+        )
+        for session in active:
+            session.expires_at = now
+        if active:
+            close_lecture_sessions(db, [session.id for session in active], now)
+        if enabled:
+            minutes = minutes or config_module.get_settings().master_qr_session_minutes
+            master_session = models.MasterQrSession(
+                secret=secret,
+                teacher_id=teacher_id,
+                section_id=section_id,
+                started_at=now,
+                expires_at=now + datetime.timedelta(minutes=minutes),
+            )
+            db.add(master_session)
+            if section_id is not None:
+                db.flush()
+                open_lecture_session(db, section_id, now, master_session.expires_at, master_session.id)
         db_teacher.master_qr_mode_enabled = enabled
         db_teacher.master_qr_secret = secret
         db.commit()
         db.refresh(db_teacher)
+        for session in active:
+            master_session_cache.invalidate(session.secret)
+        user_cache.invalidate(teacher_id)
     return db_teacher
 
 
+def cache_master_qr_session(session: models.MasterQrSession | None) -> schemas.MasterQrSession | None:
+    if session is None:
+        return None
+    entry = schemas.MasterQrSession(
+        secret=session.secret,
+        teacher_id=session.teacher_id,
+        teacher_name=session.teacher.full_name,
+        section_id=session.section_id,
+        started_at=session.started_at,
+        expires_at=session.expires_at,
+    )
+    master_session_cache.set(session.secret, entry)
+    return entry
+
+def active_master_qr_session_query(secret: str, now: datetime.datetime):
+    return (
+        select(models.MasterQrSession)
+        .options(joinedload(models.MasterQrSession.teacher))
+        .where(models.MasterQrSession.secret == secret)
+        .where(models.MasterQrSession.expires_at > now)
+    )
+
+def find_active_master_qr_session(db: Session, secret: str) -> schemas.MasterQrSession | None:
+    now = datetime.datetime.utcnow()
+    cached = master_session_cache.get(secret)
+    if cached is not None and cached.expires_at > now:
+        return cached
+    return cache_master_qr_session(db.scalar(active_master_qr_session_query(secret, now)))
+
+
 def create_section(db: Session, section: schemas.SectionCreate):
     db_section = models.Section(name=section.name)
     db.add(db_section)
+    bump_resource_version(db, SECTIONS_RESOURCE)
     db.commit()
     db.refresh(db_section)
     return db_section
 def list_sections(db: Session):
-    return db.query(models.Section).all()
-def add_student_to_section(db: Session, section_id: int, student_id: int):
-    db_link = models.SectionStudent(section_id=section_id, student_id=student_id)
-    db.add(db_link)
+    return db.query(models.Section.name, models.Section.id).order_by(models.Section.id).all()
+def _dialect_insert(dialect: str, model):
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    return insert(model)
+def _insert_or_get(db: Session, model, resources: tuple[str, ...] = (), defaults: dict | None = None, **values):
+    stmt = _dialect_insert(db.get_bind().dialect.name, model).values(**values, **(defaults or {}))
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(values))
+    if db.execute(stmt).rowcount:
+        for name in resources:
+            bump_resource_version(db, name)
     db.commit()
-    db.refresh(db_link)
-    return db_link
+    return db.query(model).filter_by(**values).one()
+ROSTER_POSITION_RETRIES = 3
+def roster_size_query(section_id: int):
+    return select(func.coalesce(func.max(models.SectionStudent.position) + 1, 0)).where(
+        models.SectionStudent.section_id == section_id
+    )
+def add_student_to_section(db: Session, section_id: int, student_id: int):
+    resources = (USERS_RESOURCE, section_students_resource(section_id))
+    defaults = {"position": roster_size_query(section_id).scalar_subquery()}
+    for _ in range(ROSTER_POSITION_RETRIES):
+        try:
+            return _insert_or_get(db, models.SectionStudent, resources, defaults, section_id=section_id, student_id=student_id)
+        except IntegrityError:
+            # a concurrent insert took the same roster position
+            db.rollback()
+    return _insert_or_get(db, models.SectionStudent, resources, defaults, section_id=section_id, student_id=student_id)
 def add_teacher_to_section(db: Session, section_id: int, teacher_id: int):
-    db_link = models.SectionTeacher(section_id=section_id, teacher_id=teacher_id)
-    db.add(db_link)
-    db.commit()
-    db.refresh(db_link)
-    return db_link
-def mark_section_attendance(db: Session, section_id: int, student_id: int):
-    db_attendance = models.SectionAttendance(section_id=section_id, student_id=student_id)
-    db.add(db_attendance)
-    db.commit()
-    db.refresh(db_attendance)
-    return db_attendance
-def find_teacher_by_master_secret(db: Session, secret: str):
+    return _insert_or_get(db, models.SectionTeacher, (USERS_RESOURCE,), section_id=section_id, teacher_id=teacher_id)
+def attendance_counter_rows(marks: Iterable[tuple[int, int]]) -> list[dict]:
+    deltas = Counter()
+    for section_id, student_id in marks:
+        deltas[(student_id, section_id)] += 1
+        deltas[(student_id, models.TOTAL_SECTION_ID)] += 1
+    # a stable key order keeps concurrent transactions from deadlocking on the counter rows
+    return [{"student_id": student_id, "section_id": section_id, "count": n} for (student_id, section_id), n in sorted(deltas.items())]
+def attendance_counter_upsert(dialect: str):
+    table = models.SectionAttendanceCounter.__table__
+    stmt = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.student_id, table.c.section_id],
+        set_={"count": table.c.count + stmt.excluded["count"]},
+    )
+def _bump_attendance_counters(db: Session, marks: Iterable[tuple[int, int]]) -> None:
+    rows = attendance_counter_rows(marks)
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        db.execute(attendance_counter_upsert(dialect), rows)
+        return
+    table = models.SectionAttendanceCounter.__table__
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(table.c.student_id == row["student_id"], table.c.section_id == row["section_id"])
+            .values(count=table.c.count + row["count"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table), row)
+def attendance_window_minutes() -> int:
+    return config_module.get_settings().attendance_session_window_minutes
+def lecture_session_window(lecture_id: int | None) -> int | None:
+    # one mark per lecture is enforced by the unique (section, student, session_window) index;
+    # negative so lecture keys never meet the epoch buckets rows carried before 0010
+    return None if lecture_id is None else -lecture_id
+def covering_lecture_id(lectures, timestamp: datetime.datetime) -> int | None:
+    return next((lecture_id for lecture_id, starts_at, ends_at in lectures if starts_at <= timestamp < ends_at), None)
+def attendance_row(
+    section_id: int, student_id: int, timestamp: datetime.datetime | None = None, lecture_id: int | None = None
+) -> dict:
+    timestamp = timestamp or datetime.datetime.utcnow()
+    return {
+        "section_id": section_id,
+        "student_id": student_id,
+        "timestamp": timestamp,
+        "session_window": lecture_session_window(lecture_id),
+    }
+def duplicate_attendance_clauses(row: dict, minutes: int) -> list:
+    mark = models.SectionAttendance
+    clauses = [mark.section_id == row["section_id"], mark.student_id == row["student_id"]]
+    if row["session_window"] is not None:
+        return clauses + [mark.session_window == row["session_window"]]
+    # outside a lecture: any mark within the sliding window, either side, so backdated batches dedupe too
+    window = datetime.timedelta(minutes=minutes)
+    return clauses + [mark.timestamp > row["timestamp"] - window, mark.timestamp < row["timestamp"] + window]
+def duplicate_attendance_query(row: dict, minutes: int):
     return (
-        db.query(models.User)
-        .filter(models.User.role == 'teacher')
-        .filter(models.User.master_qr_mode_enabled == True)
-        .filter(models.User.master_qr_secret == secret)
-        .first()
+        select(models.SectionAttendance)
+        .where(*duplicate_attendance_clauses(row, minutes))
+        .order_by(models.SectionAttendance.timestamp)
+        .limit(1)
     )
+def section_attendance_insert(dialect: str):
+    stmt = _dialect_insert(dialect, models.SectionAttendance)
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["section_id", "student_id", "session_window"])
+    return stmt
+def _session_window_key(row) -> tuple[int, int, int]:
+    if isinstance(row, dict):
+        return row["section_id"], row["student_id"], row["session_window"]
+    return row.section_id, row.student_id, row.session_window
+def windowed_attendance_row(db: Session, section_id: int, student_id: int) -> dict:
+    row = attendance_row(section_id, student_id)
+    if attendance_window_minutes() > 0:
+        lectures = db.execute(covering_lectures_query(section_id, row["timestamp"], row["timestamp"])).all()
+        row["session_window"] = lecture_session_window(covering_lecture_id(lectures, row["timestamp"]))
+    return row
+def section_membership_checks(section_id: int, student_id: int, teacher_id: int | None = None) -> list[tuple[int, object]]:
+    checks = []
+    if teacher_id is not None:
+        checks.append((403, select(models.SectionTeacher.id).where(
+            models.SectionTeacher.section_id == section_id, models.SectionTeacher.teacher_id == teacher_id
+        ).exists()))
+    checks.append((400, select(models.SectionStudent.id).where(
+        models.SectionStudent.section_id == section_id, models.SectionStudent.student_id == student_id
+    ).exists()))
+    return checks
+def authorized_attendance_insert(dialect: str, row: dict, checks: list[tuple[int, object]]):
+    columns = models.SectionAttendance.__table__.c
+    conditions = [clause for _, clause in checks]
+    minutes = attendance_window_minutes()
+    if row["session_window"] is None and minutes > 0:
+        conditions.append(~select(models.SectionAttendance.id).where(*duplicate_attendance_clauses(row, minutes)).exists())
+    values = select(*[literal(value, columns[name].type) for name, value in row.items()]).where(and_(*conditions))
+    return section_attendance_insert(dialect).from_select(list(row), values).returning(models.SectionAttendance)
+def membership_checks_query(checks: list[tuple[int, object]]):
+    return select(*[clause for _, clause in checks])
+def failed_membership_check(flags, checks: list[tuple[int, object]]) -> int | None:
+    for passed, (status_code, _) in zip(flags, checks):
+        if not passed:
+            return status_code
+    return None
+def authorize_and_mark_section_attendance(
+    db: Session, section_id: int, student_id: int, teacher_id: int | None = None
+) -> tuple[int, models.SectionAttendance | None]:
+    row = windowed_attendance_row(db, section_id, student_id)
+    checks = section_membership_checks(section_id, student_id, teacher_id)
+    db_attendance = db.scalars(authorized_attendance_insert(db.get_bind().dialect.name, row, checks)).first()
+    if db_attendance is not None:
+        _bump_attendance_counters(db, [(section_id, student_id)])
+        record_lecture_presence(db, [db_attendance])
+        db.commit()
+        db.refresh(db_attendance)
+        return 200, db_attendance
+    db.rollback()
+    status_code = failed_membership_check(db.execute(membership_checks_query(checks)).one(), checks)
+    if status_code is not None:
+        return status_code, None
+    minutes = attendance_window_minutes()
+    return 200, db.scalar(duplicate_attendance_query(row, minutes)) if minutes > 0 else None
+def _assign_lecture_windows(db: Session, rows: list[dict]) -> None:
+    by_section = {}
+    for row in rows:
+        by_section.setdefault(row["section_id"], []).append(row)
+    for section_id, section_rows in by_section.items():
+        stamps = [row["timestamp"] for row in section_rows]
+        lectures = db.execute(covering_lectures_query(section_id, min(stamps), max(stamps))).all()
+        for row in section_rows:
+            row["session_window"] = lecture_session_window(covering_lecture_id(lectures, row["timestamp"]))
+def _nearby_marks(db: Session, rows: list[dict], minutes: int) -> dict[tuple[int, int], list]:
+    window = datetime.timedelta(minutes=minutes)
+    stamps = [row["timestamp"] for row in rows]
+    mark = models.SectionAttendance.__table__.c
+    found = {}
+    for db_mark in db.execute(select(models.SectionAttendance.__table__).where(
+        tuple_(mark.section_id, mark.student_id).in_({(row["section_id"], row["student_id"]) for row in rows}),
+        mark.timestamp > min(stamps) - window,
+        mark.timestamp < max(stamps) + window,
+    )):
+        found.setdefault((db_mark.section_id, db_mark.student_id), []).append(db_mark)
+    return found
+def _insert_attendance_rows(db: Session, stmt, rows: list[dict]) -> list:
+    # Core RETURNING rows survive the commit (no expiry refresh per mark); without sort_by_parameter_order
+    # SQLite gets one multi-row INSERT, so the rows are matched back to the input by content
+    table = models.SectionAttendance.__table__
+    inserted = {}
+    for mark in db.execute(stmt.returning(*table.c), rows):
+        inserted.setdefault((mark.section_id, mark.student_id, mark.timestamp), []).append(mark)
+    return [
+        inserted[key].pop() for key in ((row["section_id"], row["student_id"], row["timestamp"]) for row in rows)
+        if inserted.get(key)
+    ]
+def bulk_mark_section_attendance(db: Session, rows: list[dict]) -> list:
+    if not rows:
+        return []
+    rows = [attendance_row(row["section_id"], row["student_id"], row.get("timestamp")) for row in rows]
+    minutes = attendance_window_minutes()
+    if minutes > 0:
+        _assign_lecture_windows(db, rows)
+    dialect = db.get_bind().dialect.name
+    table = models.SectionAttendance.__table__
+    marks: list = [None] * len(rows)
+    created = []
+
+    plain, sliding, windowed = [], [], {}
+    for index, row in enumerate(rows):
+        if row["session_window"] is not None:
+            windowed.setdefault(_session_window_key(row), []).append(index)
+        elif minutes > 0:
+            sliding.append(index)
+        else:
+            plain.append(index)
+
+    repeat_of = {}
+    if sliding:
+        window = datetime.timedelta(minutes=minutes)
+        nearby = _nearby_marks(db, [rows[index] for index in sliding], minutes)
+        accepted = {}
+        for index in sorted(sliding, key=lambda index: rows[index]["timestamp"]):
+            row = rows[index]
+            key = (row["section_id"], row["student_id"])
+            stored = next((mark for mark in nearby.get(key, ()) if abs(mark.timestamp - row["timestamp"]) < window), None)
+            earlier = next((other for other in accepted.get(key, ()) if row["timestamp"] - rows[other]["timestamp"] < window), None)
+            if stored is not None:
+                marks[index] = stored
+            elif earlier is not None:
+                repeat_of[index] = earlier
+            else:
+                accepted.setdefault(key, []).append(index)
+                plain.append(index)
+
+    if plain:
+        inserted = _insert_attendance_rows(db, insert(table), [rows[index] for index in plain])
+        created.extend(inserted)
+        for index, mark in zip(plain, inserted):
+            marks[index] = mark
+    for index, earlier in repeat_of.items():
+        marks[index] = marks[earlier]
+
+    if windowed:
+        columns = (table.c.section_id, table.c.student_id, table.c.session_window)
+        existing = {
+            _session_window_key(mark): mark
+            for mark in db.execute(select(table).where(tuple_(*columns).in_(list(windowed))))
+        }
+        new_rows = [rows[indexes[0]] for key, indexes in windowed.items() if key not in existing]
+        if new_rows:
+            # ON CONFLICT DO NOTHING skips rows, so these are keyed by window rather than by position
+            inserted = _insert_attendance_rows(db, section_attendance_insert(dialect), new_rows)
+            created.extend(inserted)
+            existing.update((_session_window_key(mark), mark) for mark in inserted)
+        missing = [key for key in windowed if key not in existing]
+        if missing:
+            # rows committed by a concurrent request between our lookup and insert
+            existing.update(
+                (_session_window_key(mark), mark)
+                for mark in db.execute(select(table).where(tuple_(*columns).in_(missing)))
+            )
+        for key, indexes in windowed.items():
+            for index in indexes:
+                marks[index] = existing[key]
+
+    _bump_attendance_counters(db, [(mark.section_id, mark.student_id) for mark in created])
+    record_lecture_presence(db, created)
+    db.commit()
+    return marks
+def existing_section_attendance(db: Session, rows: list[dict]) -> set[tuple]:
+    if not rows:
+        return set()
+    keys = {(row["section_id"], row["student_id"], row["timestamp"]) for row in rows}
+    columns = (models.SectionAttendance.section_id, models.SectionAttendance.student_id, models.SectionAttendance.timestamp)
+    return {tuple(row) for row in db.query(*columns).filter(tuple_(*columns).in_(keys)).all()}
 def is_student_in_section(db: Session, section_id: int, student_id: int) -> bool:
     return (
         db.query(models.SectionStudent)
@@ -110,24 +485,292 @@ def is_teacher_in_section(db: Session, section_id: int, teacher_id: int) -> bool
         .first()
         is not None
     )
+def teacher_section_ids(db: Session, teacher_id: int, section_ids: set[int]) -> set[int]:
+    rows = (
+        db.query(models.SectionTeacher.section_id)
+        .filter(models.SectionTeacher.teacher_id == teacher_id)
+        .filter(models.SectionTeacher.section_id.in_(section_ids))
+        .all()
+    )
+    return {section_id for (section_id,) in rows}
+def section_student_pairs(db: Session, pairs: set[tuple[int, int]]) -> set[tuple[int, int]]:
+    if not pairs:
+        return set()
+    rows = (
+        db.query(models.SectionStudent.section_id, models.SectionStudent.student_id)
+        .filter(models.SectionStudent.section_id.in_({section_id for section_id, _ in pairs}))
+        .filter(models.SectionStudent.student_id.in_({student_id for _, student_id in pairs}))
+        .all()
+    )
+    return {(section_id, student_id) for section_id, student_id in rows} & pairs
 def count_section_attendance(db: Session, student_id: int, section_id: int | None = None) -> int:
-    query = db.query(models.SectionAttendance).filter(models.SectionAttendance.student_id == student_id)
-    if section_id is not None:
-        query = query.filter(models.SectionAttendance.section_id == section_id)
-    return query.count()
+    count = (
+        db.query(models.SectionAttendanceCounter.count)
+        .filter(models.SectionAttendanceCounter.student_id == student_id)
+        .filter(models.SectionAttendanceCounter.section_id == (models.TOTAL_SECTION_ID if section_id is None else section_id))
+        .scalar()
+    )
+    return count or 0
+def _attendance_counts_from_rows(db: Session) -> dict[tuple[int, int], int]:
+    counts = {}
+    marks = section_attendance_history()
+    rows = db.execute(
+        select(marks.c.student_id, marks.c.section_id, func.count()).group_by(marks.c.student_id, marks.c.section_id)
+    )
+    for student_id, section_id, n in rows:
+        counts[(student_id, section_id)] = n
+        counts[(student_id, models.TOTAL_SECTION_ID)] = counts.get((student_id, models.TOTAL_SECTION_ID), 0) + n
+    return counts
+def verify_attendance_counters(db: Session) -> list[tuple[int, int, int, int]]:
+    expected = _attendance_counts_from_rows(db)
+    stored = {
+        (student_id, section_id): n
+        for student_id, section_id, n in db.query(
+            models.SectionAttendanceCounter.student_id,
+            models.SectionAttendanceCounter.section_id,
+            models.SectionAttendanceCounter.count,
+        )
+    }
+    return sorted(
+        (student_id, section_id, stored.get((student_id, section_id), 0), n)
+        for (student_id, section_id), n in {**{key: 0 for key in stored}, **expected}.items()
+        if stored.get((student_id, section_id), 0) != n
+    )
+def rebuild_attendance_counters(db: Session) -> int:
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE section_attendance IN SHARE MODE"))
+    counts = _attendance_counts_from_rows(db)
+    db.query(models.SectionAttendanceCounter).delete()
+    if counts:
+        db.execute(
+            insert(models.SectionAttendanceCounter),
+            [{"student_id": student_id, "section_id": section_id, "count": n} for (student_id, section_id), n in counts.items()],
+        )
+    db.commit()
+    return len(counts)
+def lecture_mark_groups(marks: Iterable) -> dict[int, dict[int, list[datetime.datetime]]]:
+    groups = {}
+    for mark in marks:
+        groups.setdefault(mark.section_id, {}).setdefault(mark.student_id, []).append(mark.timestamp)
+    return groups
+def covering_lectures_query(section_id: int, first: datetime.datetime, last: datetime.datetime):
+    lecture = models.LectureSession
+    return (
+        select(lecture.id, lecture.starts_at, lecture.ends_at)
+        .where(lecture.section_id == section_id, lecture.starts_at <= last, lecture.ends_at > first)
+        .order_by(lecture.starts_at.desc(), lecture.id.desc())
+    )
+def mark_time_range(student_marks: dict[int, list[datetime.datetime]]) -> tuple[datetime.datetime, datetime.datetime]:
+    timestamps = [timestamp for stamps in student_marks.values() for timestamp in stamps]
+    return min(timestamps), max(timestamps)
+def student_positions_query(section_id: int, student_ids: Iterable[int]):
+    member = models.SectionStudent
+    return select(member.student_id, member.position).where(
+        member.section_id == section_id, member.student_id.in_(list(student_ids)), member.position.is_not(None)
+    )
+def lecture_presence_bits(student_marks: dict[int, list[datetime.datetime]], lectures, positions) -> dict[int, int]:
+    bits = {}
+    for lecture_id, starts_at, ends_at in lectures:
+        for student_id, position in positions:
+            if any(starts_at <= timestamp < ends_at for timestamp in student_marks[student_id]):
+                bits[lecture_id] = bits.get(lecture_id, 0) | 1 << position
+    return bits
+LECTURE_PRESENCE_CAS_ATTEMPTS = 3
+def lecture_presence_query(lecture_id: int, lock: bool = False):
+    lecture = models.LectureSession.__table__.c
+    query = select(lecture.presence, lecture.roster_size, lecture.version).where(lecture.id == lecture_id)
+    return query.with_for_update() if lock else query
+def lecture_presence_swap(lecture_id: int, row, bits: int):
+    stored, roster_size, version = row
+    present = presence.decode(stored)
+    if present | bits == present:
+        return None
+    table = models.LectureSession.__table__
+    return (
+        update(table)
+        .where(table.c.id == lecture_id, table.c.version == version)
+        .values(
+            presence=presence.encode(present | bits),
+            roster_size=max(roster_size, bits.bit_length()),
+            version=version + 1,
+        )
+    )
+def record_lecture_presence(db: Session, marks: Iterable) -> None:
+    for section_id, student_marks in lecture_mark_groups(marks).items():
+        lectures = db.execute(covering_lectures_query(section_id, *mark_time_range(student_marks))).all()
+        if not lectures:
+            continue
+        positions = db.execute(student_positions_query(section_id, student_marks)).all()
+        for lecture_id, bits in lecture_presence_bits(student_marks, lectures, positions).items():
+            # compare-and-swap on version, so marks landing at once never drop each other's bits;
+            # after a few lost races take the row lock instead of spinning on a hot lecture
+            for attempt in range(LECTURE_PRESENCE_CAS_ATTEMPTS + 1):
+                row = db.execute(lecture_presence_query(lecture_id, lock=attempt == LECTURE_PRESENCE_CAS_ATTEMPTS)).one()
+                swap = lecture_presence_swap(lecture_id, row, bits)
+                if swap is None or db.execute(swap).rowcount:
+                    break
+def lecture_presence_from_marks(
+    db: Session, section_id: int, starts_at: datetime.datetime, ends_at: datetime.datetime
+) -> int:
+    marks, member = section_attendance_history(), models.SectionStudent
+    return presence.from_positions(db.scalars(
+        select(member.position).distinct()
+        .join(marks, and_(marks.c.section_id == member.section_id, marks.c.student_id == member.student_id))
+        .where(member.section_id == section_id, member.position.is_not(None))
+        .where(marks.c.timestamp >= starts_at, marks.c.timestamp < ends_at)
+    ))
+def open_lecture_session(
+    db: Session,
+    section_id: int,
+    starts_at: datetime.datetime,
+    ends_at: datetime.datetime,
+    master_qr_session_id: int | None = None,
+) -> models.LectureSession:
+    bits = lecture_presence_from_marks(db, section_id, starts_at, ends_at)
+    lecture = models.LectureSession(
+        section_id=section_id,
+        master_qr_session_id=master_qr_session_id,
+        starts_at=starts_at,
+        ends_at=ends_at,
+        roster_size=db.scalar(roster_size_query(section_id)),
+        presence=presence.encode(bits),
+        version=0,
+    )
+    db.add(lecture)
+    return lecture
+def create_lecture_session(
+    db: Session, section_id: int, starts_at: datetime.datetime, ends_at: datetime.datetime
+) -> models.LectureSession:
+    lecture = open_lecture_session(db, section_id, starts_at, ends_at)
+    db.commit()
+    db.refresh(lecture)
+    return lecture
+def close_lecture_sessions(db: Session, master_qr_session_ids: list[int], now: datetime.datetime) -> None:
+    db.query(models.LectureSession).filter(
+        models.LectureSession.master_qr_session_id.in_(master_qr_session_ids), models.LectureSession.ends_at > now
+    ).update({models.LectureSession.ends_at: now}, synchronize_session=False)
+def lecture_sessions_query(section_id: int, start: datetime.datetime | None = None, end: datetime.datetime | None = None):
+    query = select(models.LectureSession).where(models.LectureSession.section_id == section_id)
+    if start is not None:
+        query = query.where(models.LectureSession.starts_at >= start)
+    if end is not None:
+        query = query.where(models.LectureSession.starts_at < end)
+    return query.order_by(models.LectureSession.starts_at, models.LectureSession.id)
+def list_lecture_sessions(
+    db: Session, section_id: int, start: datetime.datetime | None = None, end: datetime.datetime | None = None
+) -> list[models.LectureSession]:
+    return list(db.scalars(lecture_sessions_query(section_id, start, end)))
+def get_lecture_session(db: Session, section_id: int, lecture_id: int) -> models.LectureSession | None:
+    return db.scalar(
+        select(models.LectureSession)
+        .where(models.LectureSession.id == lecture_id, models.LectureSession.section_id == section_id)
+    )
+def roster_positions(db: Session, section_id: int):
+    return db.execute(
+        select(models.SectionStudent.position, models.User.id, models.User.full_name)
+        .join(models.User, models.User.id == models.SectionStudent.student_id)
+        .where(models.SectionStudent.section_id == section_id, models.SectionStudent.position.is_not(None))
+        .order_by(models.SectionStudent.position)
+    ).all()
+def lecture_attendance(db: Session, lecture: models.LectureSession) -> tuple[list, list]:
+    roster = {position: (user_id, full_name) for position, user_id, full_name in roster_positions(db, lecture.section_id)}
+    bits = presence.decode(lecture.presence)
+    def entries(mask):
+        return [roster[position] for position in presence.positions(mask) if position in roster]
+    return entries(bits), entries(presence.absent(bits, lecture.roster_size))
+def lecture_rates(
+    db: Session, section_id: int, start: datetime.datetime | None = None, end: datetime.datetime | None = None
+) -> tuple[int, int, int, list[tuple]]:
+    lectures = lecture_sessions_query(section_id, start, end).subquery()
+    attended, held = presence.Tally(), presence.Tally()
+    present = expected = count = 0
+    for stored, roster_size in db.execute(select(lectures.c.presence, lectures.c.roster_size)):
+        bits = presence.decode(stored)
+        attended.add(bits)
+        held.add(presence.roster_mask(roster_size))
+        present += bits.bit_count()
+        expected += roster_size
+        count += 1
+    students = [
+        (user_id, full_name, attended[position], held[position])
+        for position, user_id, full_name in roster_positions(db, section_id)
+    ]
+    return count, present, expected, students
+def rebuild_lecture_presence(db: Session) -> int:
+    lectures = db.execute(select(
+        models.LectureSession.id, models.LectureSession.section_id,
+        models.LectureSession.starts_at, models.LectureSession.ends_at, models.LectureSession.roster_size,
+    )).all()
+    for lecture_id, section_id, starts_at, ends_at, roster_size in lectures:
+        bits = lecture_presence_from_marks(db, section_id, starts_at, ends_at)
+        db.execute(
+            update(models.LectureSession.__table__)
+            .where(models.LectureSession.__table__.c.id == lecture_id)
+            .values(
+                presence=presence.encode(bits),
+                roster_size=max(roster_size, bits.bit_length()),
+                version=models.LectureSession.__table__.c.version + 1,
+            )
+        )
+    db.commit()
+    return len(lectures)
+SECTIONS_RESOURCE = "sections"
+USERS_RESOURCE = "users"
+def section_students_resource(section_id: int) -> str:
+    return f"section:{section_id}:students"
+def resource_version_bump(dialect: str, name: str, now: datetime.datetime):
+    table = models.ResourceVersion.__table__
+    if dialect not in ("sqlite", "postgresql"):
+        return None
+    stmt = _dialect_insert(dialect, table).values(name=name, version=1, updated_at=now)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.name], set_={"version": table.c.version + 1, "updated_at": now}
+    )
+def bump_resource_version(db: Session, name: str) -> None:
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    stmt = resource_version_bump(db.get_bind().dialect.name, name, now)
+    if stmt is not None:
+        db.execute(stmt)
+        return
+    table = models.ResourceVersion.__table__
+    if db.execute(update(table).where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)).rowcount == 0:
+        db.execute(insert(table).values(name=name, version=1, updated_at=now))
+def get_resource_version(db: Session, name: str) -> int:
+    return db.query(models.ResourceVersion.version).filter(models.ResourceVersion.name == name).scalar() or 0
+def resource_stamp(db: Session, name: str) -> tuple[int, datetime.datetime | None]:
+    table = models.ResourceVersion.__table__
+    row = db.execute(select(table.c.version, table.c.updated_at).where(table.c.name == name)).first()
+    return (row.version, row.updated_at) if row else (0, None)
 def add_section_beacon(db: Session, section_id: int, beacon_id: str) -> models.SectionBeacon:
-    beacon = models.SectionBeacon(section_id=section_id, beacon_id=beacon_id)
-    db.add(beacon)
+    stmt = _dialect_insert(db.get_bind().dialect.name, models.SectionBeacon).values(section_id=section_id, beacon_id=beacon_id)
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["section_id", "beacon_id"])
+    if db.execute(stmt).rowcount:
+        bump_resource_version(db, BEACONS_RESOURCE)
     db.commit()
-    db.refresh(beacon)
-    return beacon
-def list_section_beacons(db: Session, section_id: int) -> list[models.SectionBeacon]:
-    return db.query(models.SectionBeacon).filter(models.SectionBeacon.section_id == section_id).all()
-def is_beacon_allowed_for_section(db: Session, section_id: int, beacon_id: str) -> bool:
+    beacon_allow_list.invalidate(section_id)
+    publish_invalidation(BEACONS_RESOURCE, section_id)
+    return db.query(models.SectionBeacon).filter_by(section_id=section_id, beacon_id=beacon_id).one()
+def list_section_beacons(db: Session, section_id: int):
     return (
-        db.query(models.SectionBeacon)
+        db.query(models.SectionBeacon.section_id, models.SectionBeacon.beacon_id, models.SectionBeacon.id)
         .filter(models.SectionBeacon.section_id == section_id)
-        .filter(models.SectionBeacon.beacon_id == beacon_id)
-        .first()
-        is not None
+        .order_by(models.SectionBeacon.id)
+        .all()
     )
+def section_beacon_ids_query(section_id: int):
+    return select(models.SectionBeacon.beacon_id).where(models.SectionBeacon.section_id == section_id)
+def preload_beacon_allow_list(db: Session) -> None:
+    beacon_allow_list.apply_version(get_resource_version(db, BEACONS_RESOURCE))
+    sections: dict[int, set[str]] = {}
+    for section_id, beacon_id in db.query(models.SectionBeacon.section_id, models.SectionBeacon.beacon_id):
+        sections.setdefault(section_id, set()).add(beacon_id)
+    for section_id, beacons in sections.items():
+        beacon_allow_list.put(section_id, beacons)
+def is_beacon_allowed_for_section(db: Session, section_id: int, beacon_id: str) -> bool:
+    if beacon_allow_list.version_check_due():
+        beacon_allow_list.apply_version(get_resource_version(db, BEACONS_RESOURCE))
+    beacons = beacon_allow_list.get(section_id)
+    if beacons is None:
+        beacons = beacon_allow_list.put(section_id, db.scalars(section_beacon_ids_query(section_id)))
+    return beacon_id in beacons
@@ -1,14 +1,219 @@
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
-from .config import get_settings
+from .config import Settings, get_settings
+from .metrics import metrics
 
-settings = get_settings()
 
-connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-engine = create_engine(settings.database_url, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        data = {
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(), idle=pool.checkedin())
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def instrument_queries(sync_engine) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.record_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+pysqlite:"))
+
+
+def _apply_sqlite_pragmas(dbapi_connection, settings: Settings) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.close()
+
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(settings: Settings) -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+def build_async_engine(settings: Settings):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(settings)
+    is_sqlite = url.startswith("sqlite")
+    kwargs = {}
+    if not _is_sqlite_memory(url):
+        kwargs.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    new_engine = create_async_engine(url, **kwargs)
+
+    if is_sqlite:
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            _apply_sqlite_pragmas(dbapi_connection, settings)
+    if settings.metrics_enabled:
+        instrument_queries(new_engine.sync_engine)
+
+    return new_engine
+
+
+def build_engine(settings: Settings):
+    url = settings.database_url
+    is_sqlite = url.startswith("sqlite")
+    kwargs = {"connect_args": {"check_same_thread": False} if is_sqlite else {}}
+    if not _is_sqlite_memory(url):
+        kwargs.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    new_engine = create_engine(url, **kwargs)
+
+    @event.listens_for(new_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.incr("connects")
+        if is_sqlite:
+            _apply_sqlite_pragmas(dbapi_connection, settings)
+
+    @event.listens_for(new_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats.incr("checkouts")
+
+    @event.listens_for(new_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        pool_stats.incr("checkins")
+
+    if settings.metrics_enabled:
+        instrument_queries(new_engine)
+    return new_engine
+
+
+_lock = threading.Lock()
+_engine = None
+_session_factory = None
+_async_engine = None
+_async_session_factory = None
+
+
+def get_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                new_engine = build_engine(get_settings())
+                _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=new_engine)
+                _engine = new_engine
+    return _engine
+
+
+def SessionLocal():
+    get_engine()
+    return _session_factory()
+
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        with _lock:
+            if _async_engine is None:
+                new_engine = build_async_engine(get_settings())
+                _async_session_factory = async_sessionmaker(new_engine, autoflush=False, expire_on_commit=False)
+                _async_engine = new_engine
+    return _async_engine
+
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _async_session_factory()
+
+
+async def dispose_engines() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+
+def reset_engines() -> None:
+    global _engine, _session_factory, _async_engine, _async_session_factory
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = _session_factory = _async_engine = _async_session_factory = None
+
 
 Base = declarative_base()
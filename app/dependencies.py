@@ -1,64 +1,122 @@
+import hmac
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 
 from .database import SessionLocal
-from .config import get_settings
-from . import crud, models
+from .cache import user_cache
+from . import config as config_module
+from . import crud, schemas
 
 
-settings = get_settings()
-SECRET_KEY = settings.secret_key
-ALGORITHM = settings.jwt_algorithm
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
+STREAM_TICKET_SCOPE = "qr-stream"
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    from jose import jwt
+
+    settings = config_module.get_settings()
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str) -> dict:
+    from jose import JWTError, jwt
+
+    settings = config_module.get_settings()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: Optional[str] = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username=username)
-    if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+def token_user_id(token: str) -> Optional[int]:
+    try:
+        return _decode_token(token).get("uid")
+    except HTTPException:
+        return None
+
+
+def load_principal(user_id: int) -> Optional[schemas.Principal]:
+    principal = user_cache.get(user_id)
+    if principal is None:
+        db = SessionLocal()
+        try:
+            user = crud.get_user(db, user_id)
+        finally:
+            db.close()
+        if user is None:
+            return None
+        principal = schemas.Principal.model_validate(user)
+        user_cache.set(user_id, principal)
+    return principal
+
+
+async def _principal_from_payload(payload: dict) -> schemas.Principal:
+    user_id: Optional[int] = payload.get("uid")
+    role: Optional[str] = payload.get("role")
+    if user_id is None:
+        raise _credentials_exception()
+    if role is not None and config_module.get_settings().trust_token_claims:
+        return schemas.Principal(id=user_id, username=payload["sub"], role=role)
+    principal = user_cache.get(user_id) or await run_in_threadpool(load_principal, user_id)
+    if principal is None:
+        raise _credentials_exception()
+    return principal
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> schemas.Principal:
+    payload = _decode_token(token)
+    if payload.get("scope") == STREAM_TICKET_SCOPE:
+        raise _credentials_exception()
+    return await _principal_from_payload(payload)
+
+
+def create_stream_ticket(principal: schemas.Principal) -> str:
+    seconds = config_module.get_settings().qr_stream_ticket_seconds
+    return create_access_token(
+        {"sub": principal.username, "uid": principal.id, "role": principal.role, "scope": STREAM_TICKET_SCOPE},
+        expires_delta=timedelta(seconds=seconds),
+    )
+
+
+async def get_stream_principal(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    ticket: Optional[str] = None,
+) -> schemas.Principal:
+    # EventSource cannot send headers; it passes a short-lived stream ticket instead of the access token,
+    # so whatever lands in proxy logs is useless for anything but reopening the stream for a minute
+    if token:
+        return await get_current_principal(token)
+    if not ticket:
+        raise _credentials_exception()
+    payload = _decode_token(ticket)
+    if payload.get("scope") != STREAM_TICKET_SCOPE:
+        raise _credentials_exception()
+    return await _principal_from_payload(payload)
 
 
 def require_roles(allowed_roles: List[str]):
-    def role_dependency(current_user: models.User = Depends(get_current_user)) -> models.User:
+    async def role_dependency(current_user: schemas.Principal = Depends(get_current_principal)) -> schemas.Principal:
         if current_user.role not in allowed_roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
         return current_user
@@ -66,3 +124,11 @@ def require_roles(allowed_roles: List[str]):
     return role_dependency
 
 
+def require_ops_token(authorization: Optional[str] = Header(default=None)) -> None:
+    # operational endpoints expose pool and traffic internals; without a configured token they do not exist
+    expected = config_module.get_settings().ops_token
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), expected.encode()):
+        raise _credentials_exception()
@@ -0,0 +1,89 @@
+import datetime
+import gzip
+import importlib.util
+import json
+from typing import Iterable, Sequence
+
+from fastapi import Request, Response
+
+from . import config as config_module
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), default=_default).encode()
+
+
+def rows_body(rows: Sequence) -> bytes:
+    if not rows:
+        return b"[]"
+    fields = rows[0]._fields
+    return dumps([dict(zip(fields, row)) for row in rows])
+
+
+def brotli_available() -> bool:
+    return importlib.util.find_spec("brotli") is not None
+
+
+def strip_encoding(etag: str) -> str:
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix + '"'):
+            return etag[: -len(suffix) - 1] + '"'
+    return etag
+
+
+def _accepted(request: Request) -> set[str]:
+    accepted = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def vary_on_encoding(headers: dict) -> None:
+    if config_module.get_settings().response_compression_min_bytes > 0:
+        headers["Vary"] = "Accept-Encoding"
+
+
+def encode(request: Request, body: bytes, headers: dict) -> bytes:
+    settings = config_module.get_settings()
+    if settings.response_compression_min_bytes <= 0:
+        return body
+    vary_on_encoding(headers)
+    if len(body) < settings.response_compression_min_bytes:
+        return body
+    accepted = _accepted(request)
+    if "br" in accepted and brotli_available():
+        import brotli
+
+        coding, body = "br", brotli.compress(body, quality=settings.response_brotli_quality)
+    elif "gzip" in accepted:
+        coding, body = "gzip", gzip.compress(body, compresslevel=settings.response_gzip_level, mtime=0)
+    else:
+        return body
+    headers["Content-Encoding"] = coding
+    if "etag" in headers:
+        # a strong validator has to differ between content codings of the same resource
+        headers["etag"] = headers["etag"][:-1] + f'-{coding}"'
+    return body
+
+
+def rows_response(request: Request, response: Response, rows: Iterable) -> Response:
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    body = encode(request, rows_body(list(rows)), headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,84 +1,193 @@
+import time
+
+_import_started = time.perf_counter()
+
 import json
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Depends, FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from . import models
-from .database import engine, SessionLocal
+from . import database
+from .database import SessionLocal, pool_stats
 from .api import api_router
-from . import crud, schemas
-from .config import get_settings
+from . import crud
+from .config import Settings, get_settings
+from .dependencies import require_ops_token
+from .admission import AdmissionMiddleware, admission
+from .attendance_queue import attendance_queue
+from .beacon_cache import configure_beacon_cache
+from .cache import close_cache_backend, configure_caches
+from .metrics import MetricsMiddleware, metrics
+from .passwords import PasswordHashingBusy, password_hasher
+
+logger = logging.getLogger(__name__)
 
-settings = get_settings()
+_import_seconds = time.perf_counter() - _import_started
 
-app = FastAPI(title=settings.app_name)
 
-origins = settings.cors_origins
-if isinstance(origins, str):
+def parse_cors_origins(origins: str) -> list[str]:
     raw_value = origins.strip()
     if raw_value == "*":
-        origins = ["*"]
-    else:
-        try:
-            parsed = json.loads(raw_value)
-            if isinstance(parsed, list) and all(isinstance(x, str) for x in parsed):
-                origins = parsed
-            else:
-                origins = [o.strip() for o in raw_value.split(",") if o.strip()]
-        except json.JSONDecodeError:
-            origins = [o.strip() for o in raw_value.split(",") if o.strip()]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.on_event("startup")
-def on_startup():
-    if settings.create_tables_on_startup:
-        models.Base.metadata.create_all(bind=engine)
-    if settings.seed_on_startup:
-        seed_initial_data()
+        return ["*"]
+    try:
+        parsed = json.loads(raw_value)
+        if isinstance(parsed, list) and all(isinstance(x, str) for x in parsed):
+            return parsed
+    except json.JSONDecodeError:
+        pass
+    return [o.strip() for o in raw_value.split(",") if o.strip()]
+
+
+def password_hashing_busy(request: Request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent logins, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 
 def seed_initial_data():
     db = SessionLocal()
     try:
-        teacher = crud.get_user_by_username(db, username="teacher")
-        if not teacher:
-            teacher = crud.create_user(
-                db,
-                schemas.UserCreate(
-                    username="teacher", full_name="Prof. Teacher", password="teacherpass", role="teacher"
-                ),
-            )
-        student = crud.get_user_by_username(db, username="student")
-        if not student:
-            student = crud.create_user(
-                db,
-                schemas.UserCreate(
-                    username="student", full_name="John Student", password="studentpass", role="student"
-                ),
-            )
-
-        sections = crud.list_sections(db)
-        default_section = next((s for s in sections if s.name == "Default Section"), None)
+        users = {}
+        for username, full_name, password, role in (
+            ("teacher", "Prof. Teacher", "teacherpass", "teacher"),
+            ("student", "John Student", "studentpass", "student"),
+        ):
+            users[role] = crud.get_user_by_username(db, username=username)
+            if not users[role]:
+                users[role] = models.User(
+                    username=username, full_name=full_name, hashed_password=password_hasher.hash(password), role=role
+                )
+                db.add(users[role])
+
+        default_section = db.query(models.Section).filter(models.Section.name == "Default Section").first()
         if not default_section:
-            default_section = crud.create_section(db, schemas.SectionCreate(name="Default Section"))
+            default_section = models.Section(name="Default Section")
+            db.add(default_section)
+        db.flush()
 
-        if teacher and not crud.is_teacher_in_section(db, default_section.id, teacher.id):
-            crud.add_teacher_to_section(db, default_section.id, teacher.id)
-        if student and not crud.is_student_in_section(db, default_section.id, student.id):
-            crud.add_student_to_section(db, default_section.id, student.id)
+        if not crud.is_teacher_in_section(db, default_section.id, users["teacher"].id):
+            db.add(models.SectionTeacher(section_id=default_section.id, teacher_id=users["teacher"].id))
+        if not crud.is_student_in_section(db, default_section.id, users["student"].id):
+            db.add(models.SectionStudent(
+                section_id=default_section.id,
+                student_id=users["student"].id,
+                position=crud.roster_size_query(default_section.id).scalar_subquery(),
+            ))
+        if db.new:
+            for resource in (crud.USERS_RESOURCE, crud.SECTIONS_RESOURCE, crud.section_students_resource(default_section.id)):
+                crud.bump_resource_version(db, resource)
+        db.commit()
     finally:
         db.close()
 
 
-app.include_router(api_router, prefix="/api")
+def on_startup(settings: Settings):
+    if settings.create_tables_on_startup:
+        models.Base.metadata.create_all(bind=database.get_engine())
+    if settings.seed_on_startup:
+        seed_initial_data()
+    if settings.enable_ble_check:
+        db = SessionLocal()
+        try:
+            crud.preload_beacon_allow_list(db)
+        finally:
+            db.close()
+    if settings.attendance_write_behind:
+        attendance_queue.start()
+
+
+async def on_shutdown():
+    await run_in_threadpool(attendance_queue.stop)
+    await run_in_threadpool(password_hasher.shutdown)
+    await run_in_threadpool(close_cache_backend)
+    await database.dispose_engines()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    await run_in_threadpool(on_startup, app.state.settings)
+    app.state.startup_timings["startup_hooks_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Started in %s", app.state.startup_timings)
+    yield
+    await on_shutdown()
+
+
+def build_api_router(settings: Settings) -> APIRouter:
+    if not settings.async_database:
+        return api_router
+    from .api_async import async_api_router
+
+    router = APIRouter()
+    overridden = {(route.path, method) for route in async_api_router.routes for method in route.methods}
+    router.routes.extend(async_api_router.routes)
+    router.routes.extend(
+        route for route in api_router.routes if not any((route.path, method) in overridden for method in route.methods)
+    )
+    return router
+
+
+def create_app() -> FastAPI:
+    started = time.perf_counter()
+    settings = get_settings()
+    configure_caches(settings)
+    configure_beacon_cache(settings)
+
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
+    app.state.settings = settings
+    if settings.admission_control:
+        # inside CORS so that browsers can read the 429
+        admission.configure(settings)
+        app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=parse_cors_origins(settings.cors_origins),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-After-Id"],
+    )
+    if settings.metrics_enabled:
+        metrics.configure(settings.metrics_slow_query_ms / 1000, settings.metrics_n_plus_one_threshold)
+        app.add_middleware(MetricsMiddleware)
+    app.add_exception_handler(PasswordHashingBusy, password_hashing_busy)
+    app.include_router(build_api_router(settings), prefix="/api")
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Welcome to Club Check API"}
+
+    @app.get("/health/db-pool", dependencies=[Depends(require_ops_token)])
+    def read_db_pool_stats():
+        return pool_stats.snapshot(database.get_engine().pool)
+
+    @app.get("/health/startup")
+    def read_startup_timings():
+        return app.state.startup_timings
+
+    if settings.metrics_enabled:
+        @app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_ops_token)])
+        def read_metrics():
+            gauges = {f"club_check_db_pool_{name}": value for name, value in pool_stats.snapshot(database.get_engine().pool).items()}
+            return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+    app.state.startup_timings = {
+        "imports_ms": round(_import_seconds * 1000, 1),
+        "create_app_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    return app
 
 
-@app.get("/")
-def read_root():
-    return {"message": "Welcome to Club Check API"}
\ No newline at end of file
+def __getattr__(name: str):
+    # `uvicorn app.main:app` keeps working; the app is only built when something asks for it
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,172 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+BACKGROUND_ROUTE = "-"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ("scope", "durations", "statements")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.durations: list[float] = []
+        self.statements: Counter = Counter()
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("club_check_request_stats", default=None)
+
+
+def route_label(scope: dict | None) -> str:
+    if scope is None:
+        return BACKGROUND_ROUTE
+    template = getattr(scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    # included routers keep their own template, the router prefix is whatever precedes it in the path
+    return scope["path"].rsplit("/", template.count("/"))[0] + template
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class Metrics:
+    def __init__(self, slow_query_seconds: float = 0.2, n_plus_one_threshold: int = 5):
+        self.slow_query_seconds = slow_query_seconds
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self.clear()
+
+    def configure(self, slow_query_seconds: float, n_plus_one_threshold: int) -> None:
+        self.slow_query_seconds = slow_query_seconds
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    def clear(self) -> None:
+        with self._lock:
+            self.requests: dict[tuple[str, str, str], Histogram] = {}
+            self.queries_per_request: dict[str, Histogram] = {}
+            self.query_seconds: dict[str, Histogram] = {}
+            self.slow_queries: Counter = Counter()
+            self.n_plus_one: Counter = Counter()
+
+    def record_query(self, statement: str, seconds: float) -> None:
+        stats = _current.get()
+        if seconds >= self.slow_query_seconds:
+            route = route_label(stats.scope if stats else None)
+            logger.warning("Slow query (%.1f ms) on %s: %s", seconds * 1000, route, statement[:500])
+            with self._lock:
+                self.slow_queries[route] += 1
+        if stats is None:
+            with self._lock:
+                self.query_seconds.setdefault(BACKGROUND_ROUTE, Histogram(QUERY_BUCKETS)).observe(seconds)
+            return
+        stats.durations.append(seconds)
+        stats.statements[statement] += 1
+
+    def start_request(self, scope: dict):
+        return _current.set(RequestStats(scope))
+
+    def finish_request(self, token, method: str, status: int, seconds: float) -> None:
+        stats = _current.get()
+        _current.reset(token)
+        route = route_label(stats.scope)
+        statement, repeats = max(stats.statements.items(), key=lambda item: item[1], default=("", 0))
+        if repeats >= self.n_plus_one_threshold:
+            logger.warning("Possible N+1 on %s %s: %d runs of %s", method, route, repeats, statement[:500])
+        with self._lock:
+            self.requests.setdefault((method, route, str(status)), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries_per_request.setdefault(route, Histogram(QUERY_COUNT_BUCKETS)).observe(len(stats.durations))
+            durations = self.query_seconds.setdefault(route, Histogram(QUERY_BUCKETS))
+            for duration in stats.durations:
+                durations.observe(duration)
+            if repeats >= self.n_plus_one_threshold:
+                self.n_plus_one[route] += 1
+
+    def render(self, gauges: dict[str, float] | None = None) -> str:
+        lines = []
+        with self._lock:
+            self._render_histograms(
+                lines, "club_check_http_request_duration_seconds", "HTTP request latency by route",
+                {_labels(method=method, route=route, status=status): h for (method, route, status), h in self.requests.items()},
+            )
+            self._render_histograms(
+                lines, "club_check_db_queries_per_request", "SQL statements executed per request",
+                {_labels(route=route): h for route, h in self.queries_per_request.items()},
+            )
+            self._render_histograms(
+                lines, "club_check_db_query_duration_seconds", "SQL statement latency by route",
+                {_labels(route=route): h for route, h in self.query_seconds.items()},
+            )
+            for name, help_text, counter in (
+                ("club_check_db_slow_queries_total", "Statements slower than the slow query threshold", self.slow_queries),
+                ("club_check_db_n_plus_one_total", "Requests that repeated one statement past the N+1 threshold", self.n_plus_one),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [f"{name}{{{_labels(route=route)}}} {n}" for route, n in sorted(counter.items())]
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines: list[str], name: str, help_text: str, series: dict[str, Histogram]) -> None:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, histogram in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = metrics.start_request(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.finish_request(token, scope["method"], status, time.perf_counter() - start)
@@ -1,5 +1,5 @@
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, LargeBinary, String, DateTime
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -17,6 +17,19 @@ class User(Base):
     master_qr_secret = Column(String, nullable=True)
 
 
+class MasterQrSession(Base):
+    __tablename__ = "master_qr_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    secret = Column(String, unique=True, index=True, nullable=False)
+    teacher_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    section_id = Column(Integer, ForeignKey("sections.id"), nullable=True)
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    teacher = relationship("User")
+
+
 class Attendance(Base):
     __tablename__ = "attendance"
 
@@ -36,32 +49,106 @@ class Section(Base):
 
 class SectionBeacon(Base):
     __tablename__ = "section_beacons"
+    __table_args__ = (Index("uq_section_beacons_section_beacon", "section_id", "beacon_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("sections.id"), index=True)
     beacon_id = Column(String, index=True)
 
 
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+
 class SectionStudent(Base):
     __tablename__ = "section_students"
+    __table_args__ = (
+        Index("uq_section_students_section_student", "section_id", "student_id", unique=True),
+        Index("uq_section_students_section_position", "section_id", "position", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("sections.id"), index=True)
     student_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # 0-based order of joining the section, the student's bit in lecture presence bitmaps
+    position = Column(Integer, nullable=True)
 
 
 class SectionTeacher(Base):
     __tablename__ = "section_teachers"
+    __table_args__ = (Index("uq_section_teachers_section_teacher", "section_id", "teacher_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("sections.id"), index=True)
     teacher_id = Column(Integer, ForeignKey("users.id"), index=True)
 
 
+class LectureSession(Base):
+    __tablename__ = "lecture_sessions"
+    __table_args__ = (Index("ix_lecture_sessions_section_starts", "section_id", "starts_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    section_id = Column(Integer, ForeignKey("sections.id"), nullable=False)
+    master_qr_session_id = Column(Integer, ForeignKey("master_qr_sessions.id"), nullable=True, index=True)
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime, nullable=False)
+    # roster positions below roster_size were expected at the lecture, set bits in presence attended it
+    roster_size = Column(Integer, nullable=False, default=0)
+    presence = Column(LargeBinary, nullable=False, default=b"")
+    version = Column(Integer, nullable=False, default=0)
+
+
+TOTAL_SECTION_ID = 0
+
+
+class SectionAttendanceCounter(Base):
+    __tablename__ = "section_attendance_counters"
+
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    section_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
 class SectionAttendance(Base):
     __tablename__ = "section_attendance"
+    __table_args__ = (
+        Index("uq_section_attendance_session_window", "section_id", "student_id", "session_window", unique=True),
+        Index("ix_section_attendance_section_timestamp", "section_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("sections.id"), index=True)
     student_id = Column(Integer, ForeignKey("users.id"), index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    # NULL when the one-mark-per-window rule is off, so such rows never conflict
+    session_window = Column(Integer, nullable=True)
+
+
+class SectionAttendanceArchive(Base):
+    __tablename__ = "section_attendance_archive"
+    __table_args__ = (
+        Index("ix_section_attendance_archive_section_timestamp", "section_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    timestamp = Column(DateTime, primary_key=True)
+    section_id = Column(Integer, nullable=False)
+    student_id = Column(Integer, nullable=False)
+    session_window = Column(Integer, nullable=True)
+
+
+class AttendanceArchive(Base):
+    __tablename__ = "attendance_archive"
+    __table_args__ = (
+        Index("ix_attendance_archive_student_timestamp", "student_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    timestamp = Column(DateTime, primary_key=True)
+    student_id = Column(Integer, nullable=False)
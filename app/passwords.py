@@ -0,0 +1,84 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from . import config as config_module
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+@lru_cache()
+def _context(rounds: int) -> "CryptContext":
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int) -> tuple[bool, str | None]:
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._workers = 0
+        self._pending = 0
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _submit(self, fn, *args):
+        settings = config_module.get_settings()
+        if settings.password_hash_workers <= 0:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= settings.password_hash_max_pending:
+                raise PasswordHashingBusy()
+            if self._executor is None or self._workers != settings.password_hash_workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._workers = settings.password_hash_workers
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            self._pending += 1
+            future: Future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=settings.password_hash_timeout)
+        except TimeoutError:
+            raise PasswordHashingBusy()
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password: str) -> str:
+        return self._submit(_hash, password, config_module.get_settings().bcrypt_rounds)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        return self._submit(_verify_and_update, password, hashed_password, config_module.get_settings().bcrypt_rounds)
+
+
+password_hasher = PasswordHasher()
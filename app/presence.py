@@ -0,0 +1,54 @@
+from typing import Iterable
+
+# bit n of a lecture bitmap is the student at roster position n; stored little-endian
+
+
+def decode(bitmap: bytes | None) -> int:
+    return int.from_bytes(bitmap or b"", "little")
+
+
+def encode(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def from_positions(positions: Iterable[int]) -> int:
+    bits = 0
+    for position in positions:
+        bits |= 1 << position
+    return bits
+
+
+def positions(bits: int) -> list[int]:
+    found = []
+    while bits:
+        lowest = bits & -bits
+        found.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return found
+
+
+def roster_mask(roster_size: int) -> int:
+    return (1 << roster_size) - 1
+
+
+def absent(bits: int, roster_size: int) -> int:
+    return roster_mask(roster_size) & ~bits
+
+
+class Tally:
+    # per-position counters as bit planes: adding a bitmap is a ripple-carry over a few big ints
+    def __init__(self):
+        self.planes: list[int] = []
+
+    def add(self, bits: int) -> None:
+        level = 0
+        while bits:
+            if level == len(self.planes):
+                self.planes.append(0)
+            plane = self.planes[level]
+            self.planes[level] = plane ^ bits
+            bits &= plane
+            level += 1
+
+    def __getitem__(self, position: int) -> int:
+        return sum(((plane >> position) & 1) << level for level, plane in enumerate(self.planes))
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+
+import pyotp
+from sqlalchemy import select
+
+from . import database, models
+from .cache import on_invalidate
+from .totp_index import TOTP_INTERVAL, TOTP_NAMESPACE
+
+
+def load_otp_secret(user_id: int) -> str | None:
+    db = database.SessionLocal()
+    try:
+        return db.scalar(select(models.User.otp_secret).where(models.User.id == user_id))
+    finally:
+        db.close()
+
+
+class QrTokenBroadcaster:
+    def __init__(self, interval: int = TOTP_INTERVAL):
+        self.interval = interval
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._totps: dict[int, pyotp.TOTP] = {}
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def connections(self, user_id: int) -> int:
+        return len(self._subscribers.get(user_id, ()))
+
+    def subscribe(self, user_id: int, secret: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        self._totps[user_id] = pyotp.TOTP(secret, interval=self.interval)
+        queue.put_nowait(self._current_event(user_id))
+        self._loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+            del self._totps[user_id]
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def stream(self, user_id: int, secret: str):
+        queue = self.subscribe(user_id, secret)
+        try:
+            while True:
+                event = await queue.get()
+                yield f"event: token\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    def publish(self, step: int) -> None:
+        for user_id in self._subscribers:
+            self._push(user_id, self._event(user_id, step, self.interval))
+
+    def set_secret(self, user_id: int, secret: str) -> None:
+        # called from request threads and the invalidation listener; stream state lives on the event loop
+        if user_id in self._totps and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._replace_secret, user_id, secret)
+
+    def forget(self, user_id: int) -> None:
+        # the secret changed on another worker
+        if user_id in self._totps and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.create_task, self._reload(user_id))
+
+    async def _reload(self, user_id: int) -> None:
+        secret = await asyncio.to_thread(load_otp_secret, user_id)
+        if secret:
+            self._replace_secret(user_id, secret)
+
+    def _replace_secret(self, user_id: int, secret: str) -> None:
+        if user_id not in self._totps:
+            return
+        self._totps[user_id] = pyotp.TOTP(secret, interval=self.interval)
+        self._push(user_id, self._current_event(user_id))
+
+    def _push(self, user_id: int, event: dict) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _event(self, user_id: int, step: int, expires_in: int) -> dict:
+        return {"token": self._totps[user_id].generate_otp(step), "expires_in": expires_in}
+
+    def _current_event(self, user_id: int) -> dict:
+        now = time.time()
+        return self._event(user_id, int(now // self.interval), self.interval - int(now) % self.interval)
+
+    async def _run(self) -> None:
+        while True:
+            step = int(time.time() // self.interval) + 1
+            await asyncio.sleep(max(step * self.interval - time.time(), 0))
+            self.publish(step)
+
+
+qr_broadcaster = QrTokenBroadcaster()
+on_invalidate(TOTP_NAMESPACE, lambda user_id: qr_broadcaster.forget(int(user_id)))
@@ -0,0 +1,177 @@
+import csv
+import datetime
+import importlib.util
+import io
+from itertools import groupby, islice
+from typing import Iterable, Iterator
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .archive import section_attendance_history
+
+CHUNK_ROWS = 1000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+Columns = list[tuple[str, type]]
+Report = tuple[Columns, Iterator[tuple]]
+
+
+def naive_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def _attendance_filters(marks, section_id: int, start: datetime.datetime | None, end: datetime.datetime | None) -> list:
+    filters = [marks.c.section_id == section_id]
+    if start is not None:
+        filters.append(marks.c.timestamp >= naive_utc(start))
+    if end is not None:
+        filters.append(marks.c.timestamp < naive_utc(end))
+    return filters
+
+def _roster(section_id: int):
+    return (
+        select(models.User.id, models.User.full_name)
+        .join(models.SectionStudent, models.SectionStudent.student_id == models.User.id)
+        .where(models.SectionStudent.section_id == section_id)
+    )
+
+def held_days(db: Session, section_id: int, start=None, end=None) -> list[str]:
+    marks = section_attendance_history()
+    day = func.date(marks.c.timestamp)
+    rows = db.execute(
+        select(day).where(*_attendance_filters(marks, section_id, start, end)).group_by(day).order_by(day)
+    )
+    return [str(value) for (value,) in rows]
+
+def attendance_matrix(db: Session, section_id: int, start=None, end=None) -> Report:
+    days = held_days(db, section_id, start, end)
+    history = section_attendance_history()
+    day = func.date(history.c.timestamp).label("day")
+    marks = (
+        select(history.c.student_id, day, func.count().label("marks"))
+        .where(*_attendance_filters(history, section_id, start, end))
+        .group_by(history.c.student_id, day)
+        .subquery()
+    )
+    stmt = (
+        _roster(section_id)
+        .add_columns(marks.c.day, marks.c.marks)
+        .outerjoin(marks, marks.c.student_id == models.User.id)
+        .order_by(models.User.id)
+        .execution_options(yield_per=CHUNK_ROWS)
+    )
+
+    def rows():
+        for (student_id, full_name), group in groupby(db.execute(stmt), key=lambda row: (row[0], row[1])):
+            counts = {str(row.day): row.marks for row in group if row.day is not None}
+            yield (student_id, full_name, *[counts.get(value, 0) for value in days])
+
+    return [("student_id", int), ("full_name", str), *[(value, int) for value in days]], rows()
+
+def attendance_rates(db: Session, section_id: int, start=None, end=None, max_rate: float | None = None) -> Report:
+    held = len(held_days(db, section_id, start, end))
+    marks = section_attendance_history()
+    attended = func.count(func.distinct(func.date(marks.c.timestamp)))
+    stmt = (
+        _roster(section_id)
+        .add_columns(attended)
+        .outerjoin(marks, and_(marks.c.student_id == models.User.id, *_attendance_filters(marks, section_id, start, end)))
+        .group_by(models.User.id, models.User.full_name)
+        .order_by(models.User.id)
+        .execution_options(yield_per=CHUNK_ROWS)
+    )
+    if max_rate is not None:
+        stmt = stmt.having(attended <= max_rate * held)
+
+    def rows():
+        for student_id, full_name, days in db.execute(stmt):
+            yield student_id, full_name, days, held, round(days / held, 4) if held else 0.0
+
+    columns = [("student_id", int), ("full_name", str), ("attended_days", int), ("held_days", int), ("rate", float)]
+    return columns, rows()
+
+def _chunks(rows: Iterable[tuple], size: int = CHUNK_ROWS) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+def csv_chunks(columns: Columns, rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def columnar_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+class _ChunkSink:
+    def __init__(self):
+        self.closed = False
+        self._position = 0
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _arrow_schema(columns: Columns):
+    import pyarrow as pa
+
+    types = {int: pa.int64(), str: pa.string(), float: pa.float64()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def _columnar_chunks(columns: Columns, rows: Iterable[tuple], open_writer) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    for chunk in _chunks(rows):
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)], schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def parquet_chunks(columns: Columns, rows: Iterable[tuple]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    return _columnar_chunks(columns, rows, lambda sink, schema: pq.ParquetWriter(sink, schema))
+
+def arrow_chunks(columns: Columns, rows: Iterable[tuple]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    return _columnar_chunks(columns, rows, lambda sink, schema: pa.ipc.new_stream(sink, schema))
+
+EXPORTERS = {"csv": csv_chunks, "parquet": parquet_chunks, "arrow": arrow_chunks}
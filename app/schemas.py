@@ -1,6 +1,6 @@
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import datetime
 
 class UserBase(BaseModel):
@@ -24,6 +24,14 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class Principal(BaseModel):
+    id: int
+    username: str
+    role: str
+
+    class Config:
+        from_attributes = True
+
 class AttendanceBase(BaseModel):
     student_id: int
 
@@ -37,6 +45,14 @@ class Attendance(AttendanceBase):
     class Config:
         from_attributes = True
 
+class MasterQrSession(BaseModel):
+    secret: str
+    teacher_id: int
+    teacher_name: Optional[str] = None
+    section_id: Optional[int] = None
+    started_at: datetime.datetime
+    expires_at: datetime.datetime
+
 class ManualAttendance(BaseModel):
     student_id: int
     section_id: int
@@ -50,6 +66,38 @@ class Section(SectionBase):
 
     class Config:
         from_attributes = True
+class RosterEntry(BaseModel):
+    id: int
+    full_name: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+class LectureSessionCreate(BaseModel):
+    starts_at: Optional[datetime.datetime] = None
+    ends_at: Optional[datetime.datetime] = None
+    minutes: Optional[int] = Field(default=None, ge=1, le=24 * 60)
+class LectureSession(BaseModel):
+    id: int
+    section_id: int
+    master_qr_session_id: Optional[int] = None
+    starts_at: datetime.datetime
+    ends_at: datetime.datetime
+    roster_size: int
+    present: int
+class LectureAttendance(BaseModel):
+    lecture: LectureSession
+    present: List[RosterEntry]
+    absent: List[RosterEntry]
+class LectureStudentRate(RosterEntry):
+    attended: int
+    held: int
+    rate: float
+class LectureRates(BaseModel):
+    lectures: int
+    present: int
+    expected: int
+    rate: float
+    students: List[LectureStudentRate]
 class SectionMembership(BaseModel):
     section_id: int
     user_id: int
@@ -64,6 +112,15 @@ class SectionAttendance(SectionAttendanceBase):
 
     class Config:
         from_attributes = True
+class BatchAttendanceItem(SectionAttendanceBase):
+    timestamp: Optional[datetime.datetime] = None
+class BatchAttendance(BaseModel):
+    items: List[BatchAttendanceItem] = Field(min_length=1, max_length=1000)
+class BatchAttendanceResult(BaseModel):
+    index: int
+    status_code: int
+    detail: Optional[str] = None
+    attendance: Optional[SectionAttendance] = None
 class SectionBeaconBase(BaseModel):
     section_id: int
     beacon_id: str
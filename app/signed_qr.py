@@ -0,0 +1,77 @@
+import base64
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+
+from . import config as config_module
+from .totp_index import TOTP_INTERVAL, TOTP_VALID_WINDOW
+
+# s1.<user id>.<time step>.<truncated HMAC-SHA256 of "<user id>.<time step>">
+PREFIX = "s1"
+MAC_BYTES = 10
+HKDF_SALT = b"club-check/student-qr"
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def hkdf_sha256(key: bytes, info: bytes, salt: bytes = HKDF_SALT) -> bytes:
+    prk = hmac.new(salt, key, hashlib.sha256).digest()
+    return hmac.new(prk, info + b"\x01", hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=65536)
+def _derive(master_key: str, user_id: int) -> bytes:
+    return hkdf_sha256(master_key.encode(), f"student-qr:{user_id}".encode())
+
+
+def student_key(user_id: int) -> bytes:
+    settings = config_module.get_settings()
+    return _derive(settings.student_qr_key or settings.secret_key, user_id)
+
+
+def current_step(for_time: float | None = None) -> int:
+    return int((time.time() if for_time is None else for_time) // TOTP_INTERVAL)
+
+
+def seconds_left(for_time: float | None = None) -> int:
+    return TOTP_INTERVAL - int(time.time() if for_time is None else for_time) % TOTP_INTERVAL
+
+
+def _mac(user_id: int, step: int) -> str:
+    return _b64(hmac.new(student_key(user_id), f"{user_id}.{step}".encode(), hashlib.sha256).digest()[:MAC_BYTES])
+
+
+def issue(user_id: int, for_time: float | None = None) -> str:
+    step = current_step(for_time)
+    return f"{PREFIX}.{user_id}.{step}.{_mac(user_id, step)}"
+
+
+def is_signed(token: str) -> bool:
+    return token.startswith(PREFIX + ".")
+
+
+def verify(token: str, for_time: float | None = None) -> int | None:
+    try:
+        prefix, user_id, step, mac = token.split(".")
+        user_id, step = int(user_id), int(step)
+    except ValueError:
+        return None
+    if prefix != PREFIX or abs(step - current_step(for_time)) > TOTP_VALID_WINDOW:
+        return None
+    if not hmac.compare_digest(mac, _mac(user_id, step)):
+        return None
+    return user_id
+
+
+def key_payload(user_id: int) -> dict:
+    # server_time lets the phone correct its own clock, codes from a skewed clock fall outside the window
+    return {
+        "key": _b64(student_key(user_id)),
+        "format": PREFIX,
+        "interval": TOTP_INTERVAL,
+        "mac_bytes": MAC_BYTES,
+        "server_time": time.time(),
+    }
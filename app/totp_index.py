@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Iterable
+
+import pyotp
+
+from .cache import on_invalidate
+
+TOTP_NAMESPACE = "totp"
+TOTP_INTERVAL = 30
+TOTP_VALID_WINDOW = 1
+
+
+class TotpIndex:
+    def __init__(self, interval: int = TOTP_INTERVAL, valid_window: int = TOTP_VALID_WINDOW):
+        self.interval = interval
+        self.valid_window = valid_window
+        self._lock = threading.Lock()
+        self._totps: dict[int, pyotp.TOTP] = {}
+        self._steps: dict[int, dict[str, set[int]]] = {}
+        self._loaded_at: float | None = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totps.clear()
+            self._steps.clear()
+            self._loaded_at = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def reload_due(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.interval
+
+    def load(self, rows: Iterable[tuple[int, str]]) -> None:
+        with self._lock:
+            self._totps = {user_id: pyotp.TOTP(secret, interval=self.interval) for user_id, secret in rows}
+            self._steps.clear()
+            self._loaded_at = time.monotonic()
+
+    def set_secret(self, user_id: int, secret: str | None) -> None:
+        with self._lock:
+            old = self._totps.pop(user_id, None)
+            if old is not None:
+                for step, tokens in self._steps.items():
+                    self._discard(tokens, old.generate_otp(step), user_id)
+            if secret:
+                totp = pyotp.TOTP(secret, interval=self.interval)
+                self._totps[user_id] = totp
+                for step, tokens in self._steps.items():
+                    tokens.setdefault(totp.generate_otp(step), set()).add(user_id)
+
+    def forget(self, user_id: int) -> None:
+        # the secret changed on another worker: stop accepting the old one and reload on the next miss
+        self.set_secret(user_id, None)
+        with self._lock:
+            if self._loaded_at is not None:
+                self._loaded_at = float("-inf")
+
+    def probe(self, token: str, for_time: float | None = None) -> set[int]:
+        current = int((time.time() if for_time is None else for_time) // self.interval)
+        found: set[int] = set()
+        with self._lock:
+            self._roll(current)
+            for step in range(current - self.valid_window, current + self.valid_window + 1):
+                found |= self._steps[step].get(token, set())
+        return found
+
+    def _roll(self, current: int) -> None:
+        wanted = range(current - self.valid_window, current + self.valid_window + 1)
+        for step in [s for s in self._steps if s not in wanted]:
+            del self._steps[step]
+        for step in wanted:
+            if step not in self._steps:
+                tokens: dict[str, set[int]] = {}
+                for user_id, totp in self._totps.items():
+                    tokens.setdefault(totp.generate_otp(step), set()).add(user_id)
+                self._steps[step] = tokens
+
+    @staticmethod
+    def _discard(tokens: dict[str, set[int]], token: str, user_id: int) -> None:
+        ids = tokens.get(token)
+        if ids is None:
+            return
+        ids.discard(user_id)
+        if not ids:
+            del tokens[token]
+
+
+totp_index = TotpIndex()
+on_invalidate(TOTP_NAMESPACE, lambda user_id: totp_index.forget(int(user_id)))
@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def set_ble(enabled: bool) -> None:
+    os.environ["CLUB_CHECK_ENABLE_BLE_CHECK"] = "true" if enabled else "false"
+    from app import config
+    config.get_settings.cache_clear()
+
+
+def measure(client, url, headers, scans: int) -> float:
+    for _ in range(20):
+        client.post(url, headers=headers)
+    start = time.perf_counter()
+    for _ in range(scans):
+        assert client.post(url, headers=headers).status_code == 200
+    return (time.perf_counter() - start) / scans * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="scan-lecture latency with the BLE beacon check off and on")
+    parser.add_argument("--scans", type=int, default=500)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ.update({
+        "CLUB_CHECK_USE_ENV_FILE": "false",
+        "CLUB_CHECK_DATABASE_URL": f"sqlite:///{db_path}",
+        "CLUB_CHECK_CREATE_TABLES_ON_STARTUP": "true",
+        "CLUB_CHECK_BCRYPT_ROUNDS": "4",
+        "CLUB_CHECK_PASSWORD_HASH_WORKERS": "0",
+    })
+    from fastapi.testclient import TestClient
+    import app.main as main_module
+
+    try:
+        with TestClient(main_module.app) as client:
+            def token(username, role):
+                client.post("/api/auth/register", json={"username": username, "password": "pw", "role": role, "full_name": username})
+                return {"Authorization": "Bearer " + client.post(
+                    "/api/auth/token", data={"username": username, "password": "pw"}
+                ).json()["access_token"]}
+
+            teacher_headers = token("bench-teacher", "teacher")
+            student_headers = token("bench-student", "student")
+            teacher_id = client.get("/api/users/?role=teacher", headers=teacher_headers).json()[0]["id"]
+            student_id = client.get("/api/users/?role=student", headers=teacher_headers).json()[0]["id"]
+            section_id = client.post("/api/sections", json={"name": "bench"}, headers=teacher_headers).json()["id"]
+            client.post(f"/api/sections/{section_id}/teachers/{teacher_id}", headers=teacher_headers)
+            client.post(f"/api/sections/{section_id}/students/{student_id}", headers=teacher_headers)
+            client.post(
+                f"/api/sections/{section_id}/beacons",
+                json={"section_id": section_id, "beacon_id": "bench-beacon"},
+                headers=teacher_headers,
+            )
+            secret = client.post(f"/api/teacher/master-qr/enable/{teacher_id}", headers=teacher_headers).json()["master_qr_secret"]
+            url = f"/api/attendance/scan-lecture?secret={secret}&student_id={student_id}&section_id={section_id}&beacon_id=bench-beacon"
+
+            set_ble(False)
+            off = measure(client, url, student_headers, args.scans)
+            set_ble(True)
+            on = measure(client, url, student_headers, args.scans)
+    finally:
+        os.remove(db_path)
+
+    print(f"BLE off: {off:8.1f} us/scan")
+    print(f"BLE on:  {on:8.1f} us/scan ({(on - off) / off * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def legacy_router(get_db, require_roles, set_next_cursor):
+    # the pre-projection path: ORM entities, response_model validation, stdlib json
+    from fastapi import APIRouter, Depends, Response
+    from sqlalchemy.orm import Session
+
+    from app import models, schemas
+
+    router = APIRouter()
+
+    @router.get("/legacy/users", response_model=List[schemas.User])
+    def legacy_users(
+        response: Response, limit: int = 1000, after_id: int = 0,
+        db: Session = Depends(get_db), _=Depends(require_roles(["teacher"])),
+    ):
+        users = db.query(models.User).filter(models.User.id > after_id).order_by(models.User.id).limit(limit).all()
+        set_next_cursor(response, users, limit)
+        return users
+
+    @router.get("/legacy/sections/{section_id}/students", response_model=List[schemas.RosterEntry])
+    def legacy_roster(
+        section_id: int, response: Response, limit: int = 500, after_id: int = 0,
+        db: Session = Depends(get_db), _=Depends(require_roles(["teacher"])),
+    ):
+        roster = (
+            db.query(models.User)
+            .join(models.SectionStudent, models.SectionStudent.student_id == models.User.id)
+            .filter(models.SectionStudent.section_id == section_id, models.User.id > after_id)
+            .order_by(models.User.id)
+            .limit(limit)
+            .all()
+        )
+        set_next_cursor(response, roster, limit)
+        return roster
+
+    return router
+
+
+def seed(rows: int) -> int:
+    from sqlalchemy import insert
+
+    from app import database, models
+
+    models.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        section = models.Section(name="bench")
+        db.add(section)
+        db.flush()
+        db.execute(insert(models.User), [
+            {"username": f"bench-{n:05d}", "full_name": f"Bench Student {n}", "hashed_password": "x", "role": "student"}
+            for n in range(rows)
+        ])
+        ids = [user_id for (user_id,) in db.query(models.User.id).filter(models.User.username.startswith("bench-"))]
+        db.execute(insert(models.SectionStudent), [{"section_id": section.id, "student_id": user_id} for user_id in ids])
+        db.commit()
+        return section.id
+    finally:
+        db.close()
+
+
+def fetch_all(client, url, headers) -> tuple[int, int]:
+    rows = size = 0
+    after_id = 0
+    while after_id is not None:
+        r = client.get(f"{url}&after_id={after_id}", headers=headers)
+        assert r.status_code == 200, r.text
+        rows += len(r.json())
+        size += int(r.headers.get("content-length", len(r.content)))
+        after_id = r.headers.get("X-Next-After-Id")
+    return rows, size
+
+
+def measure(client, url, headers, requests: int) -> tuple[float, int, int]:
+    fetch_all(client, url, headers)
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        rows, size = fetch_all(client, url, headers)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, rows, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List endpoints: ORM + response_model vs column projection + orjson")
+    parser.add_argument("--rows", type=int, default=10000, help="Students in the section, fetched page by page")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ.update({
+        "CLUB_CHECK_USE_ENV_FILE": "false",
+        "CLUB_CHECK_DATABASE_URL": f"sqlite:///{db_path}",
+        "CLUB_CHECK_CREATE_TABLES_ON_STARTUP": "false",
+        "CLUB_CHECK_BCRYPT_ROUNDS": "4",
+        "CLUB_CHECK_PASSWORD_HASH_WORKERS": "0",
+    })
+    from fastapi.testclient import TestClient
+
+    from app.api import get_db, set_next_cursor
+    from app.dependencies import require_roles
+    from app.fast_json import orjson
+    from app.main import create_app
+
+    try:
+        section_id = seed(args.rows)
+        app = create_app()
+        app.include_router(legacy_router(get_db, require_roles, set_next_cursor), prefix="/api")
+        with TestClient(app) as client:
+            client.post("/api/auth/register", json={"username": "bench-teacher", "password": "pw", "role": "teacher"})
+            token = client.post("/api/auth/token", data={"username": "bench-teacher", "password": "pw"}).json()["access_token"]
+            auth = {"Authorization": f"Bearer {token}"}
+            teacher_id = client.get("/api/users/?role=teacher", headers=auth).json()[0]["id"]
+            client.post(f"/api/sections/{section_id}/teachers/{teacher_id}", headers=auth)
+
+            cases = [
+                ("users", "/api/legacy/users?limit=1000", "/api/users/?limit=1000"),
+                ("roster", f"/api/legacy/sections/{section_id}/students?limit=5000",
+                 f"/api/sections/{section_id}/students?limit=5000"),
+            ]
+            print(f"{args.rows} rows in pages, json encoder: {'orjson' if orjson else 'stdlib'}, median of {args.requests}")
+            for name, legacy_url, fast_url in cases:
+                identity = {**auth, "Accept-Encoding": "identity"}
+                legacy_ms, rows, legacy_size = measure(client, legacy_url, identity, args.requests)
+                fast_ms, _, fast_size = measure(client, fast_url, identity, args.requests)
+                gzip_ms, _, gzip_size = measure(client, fast_url, {**auth, "Accept-Encoding": "gzip"}, args.requests)
+                print(f"{name:7s} {rows} rows")
+                print(f"  legacy {legacy_ms:7.1f} ms {legacy_size:>9} B")
+                print(f"  fast   {fast_ms:7.1f} ms {fast_size:>9} B  x{legacy_ms / fast_ms:.1f}")
+                print(f"  gzip   {gzip_ms:7.1f} ms {gzip_size:>9} B")
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
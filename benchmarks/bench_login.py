@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("CLUB_CHECK_USE_ENV_FILE", "false")
+
+from app import config as config_module
+from app.passwords import _hash, password_hasher
+
+
+def run(workers: int, logins: int, concurrency: int, rounds: int) -> float:
+    os.environ["CLUB_CHECK_PASSWORD_HASH_WORKERS"] = str(workers)
+    os.environ["CLUB_CHECK_PASSWORD_HASH_MAX_PENDING"] = str(max(concurrency, 1))
+    os.environ["CLUB_CHECK_BCRYPT_ROUNDS"] = str(rounds)
+    config_module.get_settings.cache_clear()
+    hashed = _hash("benchmark-password", rounds)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as threads:
+        list(threads.map(lambda _: password_hasher.verify_and_update("benchmark-password", hashed), range(max(workers, 1))))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        results = list(threads.map(lambda _: password_hasher.verify_and_update("benchmark-password", hashed), range(logins)))
+    elapsed = time.perf_counter() - start
+    password_hasher.shutdown()
+    assert all(valid for valid, _ in results)
+    return logins / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Password verification throughput per hashing pool size")
+    parser.add_argument("--pool-sizes", default="0,1,2,4,8", help="0 verifies inline in the request threads")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=40, help="Simulated request threads")
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{'pool':>6} {'logins/sec':>12}")
+    for workers in (int(size) for size in args.pool_sizes.split(",")):
+        print(f"{workers:>6} {run(workers, args.logins, args.concurrency, args.rounds):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
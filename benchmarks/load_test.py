@@ -0,0 +1,337 @@
+import argparse
+import http.client
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pyotp
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("CLUB_CHECK_USE_ENV_FILE", "false")
+
+PASSWORD = "benchmark-password"
+SCENARIOS = ["login", "qr-token", "scan-student", "scan-lecture", "manual", "count"]
+
+
+@dataclass
+class Member:
+    id: int
+    username: str
+    section_id: int
+    headers: dict
+    otp_secret: str | None = None
+
+
+@dataclass
+class Fixture:
+    students: list[Member]
+    teachers: dict[int, Member]
+    master_secrets: dict[int, str]
+
+    def student(self, i: int) -> Member:
+        return self.students[i % len(self.students)]
+
+    def teacher_of(self, student: Member) -> Member:
+        return self.teachers[student.section_id]
+
+
+def bearer(user_id: int, username: str, role: str) -> dict:
+    from app.dependencies import create_access_token
+
+    token = create_access_token({"sub": username, "uid": user_id, "role": role}, expires_delta=timedelta(hours=4))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def seed(students: int, sections: int, rounds: int) -> Fixture:
+    from sqlalchemy import insert
+
+    from app import crud, database, models
+    from app.passwords import _hash
+
+    models.Base.metadata.create_all(bind=database.get_engine())
+    hashed = _hash(PASSWORD, rounds)
+    prefix = f"lt{uuid.uuid4().hex[:8]}"
+    db = database.SessionLocal()
+    try:
+        section_ids = list(db.scalars(
+            insert(models.Section).returning(models.Section.id, sort_by_parameter_order=True),
+            [{"name": f"{prefix}-section-{n}"} for n in range(sections)],
+        ))
+        teacher_rows = [
+            {"username": f"{prefix}-teacher-{n}", "full_name": f"Teacher {n}", "hashed_password": hashed, "role": "teacher"}
+            for n in range(sections)
+        ]
+        teacher_ids = list(db.scalars(insert(models.User).returning(models.User.id, sort_by_parameter_order=True), teacher_rows))
+        student_rows = [
+            {
+                "username": f"{prefix}-student-{n}",
+                "full_name": f"Student {n}",
+                "hashed_password": hashed,
+                "role": "student",
+                "otp_secret": pyotp.random_base32(),
+            }
+            for n in range(students)
+        ]
+        student_ids = list(db.scalars(insert(models.User).returning(models.User.id, sort_by_parameter_order=True), student_rows))
+        db.execute(insert(models.SectionTeacher), [
+            {"section_id": section_id, "teacher_id": teacher_id} for section_id, teacher_id in zip(section_ids, teacher_ids)
+        ])
+        db.execute(insert(models.SectionStudent), [
+            {"section_id": section_ids[n % sections], "student_id": student_id, "position": n // sections}
+            for n, student_id in enumerate(student_ids)
+        ])
+        db.commit()
+
+        teachers = {}
+        master_secrets = {}
+        for section_id, teacher_id, row in zip(section_ids, teacher_ids, teacher_rows):
+            teachers[section_id] = Member(teacher_id, row["username"], section_id, bearer(teacher_id, row["username"], "teacher"))
+            master_secrets[section_id] = str(uuid.uuid4())
+            crud.update_master_qr_mode(db, teacher_id, True, master_secrets[section_id], section_id=section_id)
+    finally:
+        db.close()
+
+    members = [
+        Member(student_id, row["username"], section_ids[n % sections], bearer(student_id, row["username"], "student"), row["otp_secret"])
+        for n, (student_id, row) in enumerate(zip(student_ids, student_rows))
+    ]
+    return Fixture(members, teachers, master_secrets)
+
+
+def build_request(fixture: Fixture, scenario: str, i: int) -> tuple:
+    student = fixture.student(i)
+    if scenario == "login":
+        return "POST", "/api/auth/token", {}, {"username": student.username, "password": PASSWORD}, None
+    if scenario == "qr-token":
+        return "GET", f"/api/student/qr-token/{student.id}", student.headers, None, None
+    if scenario == "scan-student":
+        token = pyotp.TOTP(student.otp_secret).now()
+        path = f"/api/attendance/scan-student?token={token}&section_id={student.section_id}"
+        return "POST", path, fixture.teacher_of(student).headers, None, None
+    if scenario == "scan-lecture":
+        secret = fixture.master_secrets[student.section_id]
+        path = f"/api/attendance/scan-lecture?secret={secret}&student_id={student.id}&section_id={student.section_id}"
+        return "POST", path, student.headers, None, None
+    if scenario == "manual":
+        body = {"section_id": student.section_id, "student_id": student.id}
+        return "POST", "/api/attendance/manual", fixture.teacher_of(student).headers, None, body
+    if scenario == "count":
+        return "GET", "/api/attendance/count", student.headers, None, None
+    raise ValueError(scenario)
+
+
+class InProcessTarget:
+    def __init__(self):
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def request(self, method, path, headers, form, body) -> int:
+        return self.client.request(method, path, headers=headers, data=form, json=body).status_code
+
+    def close(self) -> None:
+        self.client.__exit__(None, None, None)
+
+
+class HttpTarget:
+    def __init__(self, base_url: str):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.netloc = parsed.netloc
+        self.local = threading.local()
+
+    def request(self, method, path, headers, form, body) -> int:
+        headers = dict(headers)
+        payload = None
+        if form is not None:
+            payload = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        for _ in range(2):
+            if getattr(self.local, "connection", None) is None:
+                self.local.connection = self.connection_class(self.netloc, timeout=30)
+            try:
+                self.local.connection.request(method, path, body=payload, headers=headers)
+                response = self.local.connection.getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                self.local.connection.close()
+                self.local.connection = None
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[max(0, math.ceil(q * len(values)) - 1)] if values else 0.0
+
+
+def summarize(results: list[tuple[int, float]], elapsed: float) -> dict:
+    latencies = sorted(latency for _, latency in results)
+    statuses = Counter(status for status, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(n for status, n in statuses.items() if status == 0 or status >= 400),
+        "status_counts": {str(status): n for status, n in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def timed(target, fixture: Fixture, scenario: str, i: int, started: float | None = None) -> tuple[int, float]:
+    request = build_request(fixture, scenario, i)
+    started = time.perf_counter() if started is None else started
+    try:
+        status = target.request(*request)
+    except Exception:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def run_closed(target, fixture: Fixture, scenario: str, requests: int, concurrency: int, warmup: int) -> dict:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: timed(target, fixture, scenario, i), range(warmup)))
+        start = time.perf_counter()
+        results = list(pool.map(lambda i: timed(target, fixture, scenario, warmup + i), range(requests)))
+        elapsed = time.perf_counter() - start
+    return summarize(results, elapsed)
+
+
+def run_burst(target, fixture: Fixture, calls: int, seconds: float, concurrency: int) -> dict:
+    # open loop: calls are released on schedule, latency counts from the scheduled time so queueing shows up
+    interval = seconds / calls
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        futures = []
+        for i in range(calls):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(timed, target, fixture, "scan-lecture", i, scheduled))
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    summary = summarize(results, elapsed)
+    summary["target_window_s"] = seconds
+    summary["within_window"] = elapsed <= seconds + interval
+    return summary
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    print(f"\nvs {baseline_path}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if previous[key]:
+                print(f"  {name:>14} {key:>15} {previous[key]:>10} -> {current[key]:>10} ({(current[key] / previous[key] - 1) * 100:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency and throughput of the attendance hot paths")
+    parser.add_argument("--database-url", help="Seed this database; defaults to a temporary SQLite file")
+    parser.add_argument("--base-url", help="Drive a running server (it must use --database-url) instead of the app in-process")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--sections", type=int, default=20)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--burst-calls", type=int, default=500, help="scan-lecture calls of the class-start burst, 0 skips it")
+    parser.add_argument("--burst-seconds", type=float, default=10.0)
+    parser.add_argument("--burst-concurrency", type=int, default=128)
+    parser.add_argument("--bcrypt-rounds", type=int, help="Overrides CLUB_CHECK_BCRYPT_ROUNDS for the seeded hashes and the app")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--compare", help="Print deltas against an earlier JSON result")
+    args = parser.parse_args()
+
+    temp_db = None
+    if args.database_url:
+        os.environ["CLUB_CHECK_DATABASE_URL"] = args.database_url
+    elif args.base_url:
+        parser.error("--base-url needs --database-url to seed the server's database")
+    else:
+        fd, temp_db = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.environ["CLUB_CHECK_DATABASE_URL"] = f"sqlite:///{temp_db}"
+
+    if args.bcrypt_rounds:
+        os.environ["CLUB_CHECK_BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    from app import config as config_module
+
+    settings = config_module.get_settings()
+    try:
+        target = HttpTarget(args.base_url) if args.base_url else InProcessTarget()
+        fixture = seed(args.students, args.sections, settings.bcrypt_rounds)
+        results = {}
+        try:
+            for scenario in [name for name in args.scenarios.split(",") if name]:
+                results[scenario] = run_closed(target, fixture, scenario, args.requests, args.concurrency, args.warmup)
+                print(f"{scenario:>14} {json.dumps(results[scenario])}")
+            if args.burst_calls:
+                results["burst"] = run_burst(target, fixture, args.burst_calls, args.burst_seconds, args.burst_concurrency)
+                print(f"{'burst':>14} {json.dumps(results['burst'])}")
+        finally:
+            target.close()
+    finally:
+        if temp_db:
+            os.remove(temp_db)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.base_url or "in-process",
+            "database": settings.database_url.split(":", 1)[0] if args.base_url or args.database_url else "sqlite (temporary)",
+            "async_database": settings.async_database,
+            "attendance_write_behind": settings.attendance_write_behind,
+            "students": args.students,
+            "sections": args.sections,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "bcrypt_rounds": settings.bcrypt_rounds,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
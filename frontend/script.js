@@ -83,6 +83,41 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         };
 
+        // Подписанный QR (s1.id.шаг.hmac) считается на телефоне по ключу студента, без запросов к серверу
+        const toB64Url = (bytes) => btoa(String.fromCharCode(...bytes)).replace(/\+/g, '-').replace(/\//g, '_').replace(/=+$/, '');
+        const fromB64Url = (s) => Uint8Array.from(atob(s.replace(/-/g, '+').replace(/_/g, '/')), (c) => c.charCodeAt(0));
+        let qrKey = null;
+        let qrSigningKey = null;
+        const loadQrKey = async () => {
+            if (!window.crypto?.subtle) return false;
+            const storageKey = `qrKey:${studentId}`;
+            try {
+                const sent = Date.now();
+                const res = await apiFetch(`${API_URL}/student/qr-key/${studentId}`);
+                const received = Date.now();
+                if (res.ok) {
+                    // Смещение часов телефона относительно сервера; сохраняется вместе с ключом для офлайна
+                    const key = await res.json();
+                    key.clock_offset_ms = key.server_time * 1000 - (sent + received) / 2;
+                    localStorage.setItem(storageKey, JSON.stringify(key));
+                }
+            } catch (e) {
+                console.warn('Ключ QR не обновлён, использую сохранённый.', e);
+            }
+            qrKey = JSON.parse(localStorage.getItem(storageKey) || 'null');
+            if (!qrKey) return false;
+            qrSigningKey = await crypto.subtle.importKey('raw', fromB64Url(qrKey.key), { name: 'HMAC', hash: 'SHA-256' }, false, ['sign']);
+            return true;
+        };
+        const renderSignedQr = async () => {
+            const now = Math.floor((Date.now() + (qrKey.clock_offset_ms || 0)) / 1000);
+            const step = Math.floor(now / qrKey.interval);
+            const mac = await crypto.subtle.sign('HMAC', qrSigningKey, new TextEncoder().encode(`${studentId}.${step}`));
+            generateQrCode(`${qrKey.format}.${studentId}.${step}.${toB64Url(new Uint8Array(mac).slice(0, qrKey.mac_bytes))}`);
+            remaining = qrKey.interval - (now % qrKey.interval);
+            renderTimer();
+        };
+
         // Таймер 30с и прогресс
         const timerEl = document.getElementById('qr-timer');
         const progressEl = document.getElementById('qr-progress');
@@ -93,20 +128,53 @@ document.addEventListener('DOMContentLoaded', () => {
             if (timerEl) timerEl.textContent = `00:${mm}:${ss}`;
             if (progressEl) progressEl.style.width = `${(remaining / 30) * 100}%`;
         };
+        let streaming = false;
+        let signing = false;
         const tick = () => {
             remaining -= 1;
             if (remaining <= 0) {
                 remaining = 30;
-                fetchQrToken();
+                if (signing) renderSignedQr();
+                else if (!streaming) fetchQrToken();
             }
             renderTimer();
         };
 
-        fetchQrToken();
+        // Сервер сам присылает новый код на границе 30с-окна; без EventSource — опрос.
+        // В URL уходит не JWT, а одноразовый билет на минуту: EventSource не умеет слать заголовки
+        const startQrStream = async () => {
+            if (!window.EventSource) return false;
+            const res = await apiFetch(`${API_URL}/student/qr-stream-ticket/${studentId}`, { method: 'POST' });
+            if (!res.ok) return false;
+            const { ticket } = await res.json();
+            const source = new EventSource(`${API_URL}/student/qr-stream/${studentId}?ticket=${encodeURIComponent(ticket)}`);
+            source.addEventListener('token', (e) => {
+                const data = JSON.parse(e.data);
+                generateQrCode(data.token);
+                remaining = data.expires_in;
+                renderTimer();
+            });
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    // билет истёк при переподключении — берём новый, пока опрашиваем
+                    streaming = false;
+                    fetchQrToken();
+                    setTimeout(() => startQrStream().catch(() => false).then((ok) => { streaming = ok; }), 5000);
+                }
+            };
+            return true;
+        };
+
+        loadQrKey().catch(() => false).then((ok) => {
+            signing = ok;
+            if (signing) return renderSignedQr();
+            return startQrStream().catch(() => false).then((ok) => {
+                streaming = ok;
+                if (!streaming) fetchQrToken();
+            });
+        });
         renderTimer();
         setInterval(tick, 1000);
-        // резервный апдейт раз в 30с
-        setInterval(fetchQrToken, 30000);
         updateAttendanceCount();
 
         const showScannerBtn = document.getElementById('show-scanner-btn');
@@ -252,7 +320,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     alert('Сначала выберите секцию.');
                     return;
                 }
-                const response = await apiFetch(`${API_URL}/attendance/scan-student?token=${decodedText}&section_id=${selectedSectionId}`, { method: 'POST' });
+                const response = await apiFetch(`${API_URL}/attendance/scan-student?token=${encodeURIComponent(decodedText)}&section_id=${selectedSectionId}`, { method: 'POST' });
                 if (!response.ok) throw new Error('Сервер ответил ошибкой');
                 const data = await response.json();
                 alert('Скан обработан.');
@@ -283,10 +351,20 @@ document.addEventListener('DOMContentLoaded', () => {
         const studentListDiv = document.getElementById('student-list');
         const fetchStudents = async () => {
             try {
-                const response = await apiFetch(`${API_URL}/users/`);
-                const students = await response.json();
+                // список секции или всех студентов, постранично по курсору X-Next-After-Id
+                const baseUrl = selectedSectionId
+                    ? `${API_URL}/sections/${selectedSectionId}/students?limit=5000`
+                    : `${API_URL}/users/?role=student&limit=1000`;
+                const students = [];
+                let afterId = null;
+                do {
+                    const response = await apiFetch(afterId ? `${baseUrl}&after_id=${afterId}` : baseUrl);
+                    if (!response.ok) throw new Error('Ошибка загрузки студентов');
+                    students.push(...await response.json());
+                    afterId = response.headers.get('X-Next-After-Id');
+                } while (afterId);
                 studentListDiv.innerHTML = '';
-                students.filter(s => s.role === 'student').forEach(student => {
+                students.forEach(student => {
                     const studentEl = document.createElement('div');
                     studentEl.className = 'student-item';
                     studentEl.innerHTML = `<span>${student.full_name} (ID: ${student.id})</span><button data-id="${student.id}">Отметить</button>`;
@@ -339,7 +417,8 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 const teacherId = parseInt(teacherIdInput.value || '0');
                 if (!teacherId) { alert('Введите ваш ID преподавателя'); return; }
-                const response = await apiFetch(`${API_URL}/teacher/master-qr/enable/${teacherId}`, { method: 'POST' });
+                const sectionParam = selectedSectionId ? `?section_id=${selectedSectionId}` : '';
+                const response = await apiFetch(`${API_URL}/teacher/master-qr/enable/${teacherId}${sectionParam}`, { method: 'POST' });
                 const data = await response.json();
                 if (response.ok) {
                     masterQrCodeDiv.innerHTML = '';
@@ -405,6 +484,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (sectionSelect) {
             sectionSelect.addEventListener('change', (e) => {
                 selectedSectionId = parseInt(e.target.value || '0') || null;
+                fetchStudents();
             });
             loadSections();
         }
@@ -1,6 +1,5 @@
 import os
 import tempfile
-import importlib
 import pytest
 from fastapi.testclient import TestClient
 
@@ -16,28 +15,28 @@ def temp_db_url():
         pass
 
 
-@pytest.fixture()
-def client(temp_db_url, monkeypatch):
+@pytest.fixture(params=["sync", "async"])
+def client(request, temp_db_url, monkeypatch):
     monkeypatch.setenv("CLUB_CHECK_DATABASE_URL", temp_db_url)
+    monkeypatch.setenv("CLUB_CHECK_ASYNC_DATABASE", "true" if request.param == "async" else "false")
     monkeypatch.setenv("CLUB_CHECK_CREATE_TABLES_ON_STARTUP", "false")
     monkeypatch.setenv("CLUB_CHECK_SEED_ON_STARTUP", "false")
     monkeypatch.setenv("CLUB_CHECK_SECRET_KEY", "test-secret-key")
     monkeypatch.setenv("CLUB_CHECK_USE_ENV_FILE", "false")
+    monkeypatch.setenv("CLUB_CHECK_BCRYPT_ROUNDS", "4")
 
-    import app.config as cfg
-    importlib.reload(cfg)
-    import app.database as db
-    importlib.reload(db)
-    import app.models as models
-    import app.main as main
-    importlib.reload(main)
+    from app import config, database, models
+    from app.main import create_app
+    from app.totp_index import totp_index
 
-    models.Base.metadata.create_all(bind=db.engine)
+    config.get_settings.cache_clear()
+    database.reset_engines()
+    totp_index.clear()
+    models.Base.metadata.create_all(bind=database.get_engine())
 
-    test_client = TestClient(main.app)
+    test_client = TestClient(create_app())
     try:
         yield test_client
     finally:
-        models.Base.metadata.drop_all(bind=db.engine)
-
-
+        models.Base.metadata.drop_all(bind=database.get_engine())
+        database.reset_engines()
@@ -0,0 +1,94 @@
+from fastapi.testclient import TestClient
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_bucket_refills_and_forgets_idle_keys():
+    from app.admission import TokenBuckets
+
+    buckets = TokenBuckets(rate=2.0, burst=2)
+    assert buckets.take("a", 0.0) == 0.0
+    assert buckets.take("a", 0.0) == 0.0
+    assert buckets.take("a", 0.0) == 0.5
+    assert buckets.take("a", 0.5) == 0.0
+    assert buckets.take("b", 0.5) == 0.0
+    assert len(buckets) == 2
+
+    assert buckets.take("c", 1.4) == 0.0
+    assert len(buckets) == 3
+    assert buckets.take("c", 10.0) == 0.0
+    assert len(buckets) == 1
+
+
+def test_concurrency_limit_per_endpoint_class():
+    from app import config
+    from app.admission import AdmissionController
+
+    controller = AdmissionController()
+    controller.configure(config.Settings(admission_scan_concurrency=1, rate_limit_ip_per_second=0))
+    assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 0.0
+    assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 1.0
+    assert controller.admit("read", "10.0.0.1", None, now=0.0) == 0.0
+    controller.release("scan")
+    assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 0.0
+
+
+def test_concurrency_rejection_keeps_the_callers_tokens():
+    from app import config
+    from app.admission import AdmissionController
+
+    controller = AdmissionController()
+    controller.configure(config.Settings(admission_scan_concurrency=1, rate_limit_ip_per_second=1, rate_limit_ip_burst=2))
+    assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 0.0
+    for _ in range(5):
+        assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 1.0
+    controller.release("scan")
+    assert controller.admit("scan", "10.0.0.1", None, now=0.0) == 0.0
+
+
+def test_login_burst_is_rejected_before_password_work(client, monkeypatch):
+    register(client, "burst", "pass")
+    monkeypatch.setenv("CLUB_CHECK_ADMISSION_CONTROL", "true")
+    monkeypatch.setenv("CLUB_CHECK_RATE_LIMIT_LOGIN_IP_PER_SECOND", "0.01")
+    monkeypatch.setenv("CLUB_CHECK_RATE_LIMIT_LOGIN_IP_BURST", "2")
+    monkeypatch.setenv("CLUB_CHECK_RATE_LIMIT_USER_BURST", "1")
+    from app import config
+    from app.main import create_app
+    from app.passwords import password_hasher
+
+    config.get_settings.cache_clear()
+    limited = TestClient(create_app())
+    tok = login(limited, "burst", "pass")
+
+    calls = []
+    verify = password_hasher.verify_and_update
+    monkeypatch.setattr(password_hasher, "verify_and_update", lambda *a: calls.append(a) or verify(*a))
+    login(limited, "burst", "pass")
+    r = limited.post("/api/auth/token", data={"username": "burst", "password": "pass"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    assert len(calls) == 1
+
+    assert limited.get("/api/attendance/count", headers=auth_headers(tok)).status_code == 200
+    assert limited.get("/api/attendance/count", headers=auth_headers(tok)).status_code == 429
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+
+
+def test_partition_bounds_follow_configured_terms():
+    from app.archive import partition_end, partition_start
+
+    monthly = list(range(1, 13))
+    assert partition_start(datetime(2024, 9, 17, 8), monthly) == datetime(2024, 9, 1)
+    assert partition_end(datetime(2024, 12, 1), monthly) == datetime(2025, 1, 1)
+    terms = [9, 2]
+    assert partition_start(datetime(2025, 1, 20), terms) == datetime(2024, 9, 1)
+    assert partition_end(datetime(2024, 9, 1), terms) == datetime(2025, 2, 1)
+    assert partition_end(datetime(2025, 2, 1), terms) == datetime(2025, 9, 1)
+
+
+def test_archiving_closed_months_keeps_reports_and_counters(client):
+    from app import archive, crud, database, models
+
+    teacher = register(client, "at", "pass", role="teacher")
+    student = register(client, "as", "pass", role="student")
+    t_tok = login(client, "at", "pass")
+    section = client.post("/api/sections", json={"name": "Archive"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+    r = client.post(
+        "/api/attendance/batch",
+        json={"items": [
+            {"section_id": section["id"], "student_id": student["id"], "timestamp": "2024-09-02T09:00:00Z"},
+            {"section_id": section["id"], "student_id": student["id"], "timestamp": "2024-09-30T09:00:00Z"},
+            {"section_id": section["id"], "student_id": student["id"], "timestamp": "2024-10-07T09:00:00Z"},
+        ]},
+        headers=auth_headers(t_tok),
+    )
+    assert r.status_code == 200, r.text
+
+    db = database.SessionLocal()
+    try:
+        archived = archive.archive_closed_partitions(db, before=datetime(2024, 10, 15))
+        assert archived == [("section_attendance", datetime(2024, 9, 1), datetime(2024, 10, 1), 2)]
+        assert archive.archive_closed_partitions(db, before=datetime(2024, 10, 15)) == []
+        assert db.query(models.SectionAttendance).count() == 1
+        assert db.query(models.SectionAttendanceArchive).count() == 2
+        assert crud.verify_attendance_counters(db) == []
+    finally:
+        db.close()
+
+    r = client.get(f"/api/reports/sections/{section['id']}/rates", headers=auth_headers(t_tok))
+    assert r.json()[0]["attended_days"] == 3
+    r = client.get("/api/attendance/count", headers=auth_headers(login(client, "as", "pass")))
+    assert r.json()["count"] == 3
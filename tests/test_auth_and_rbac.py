@@ -43,3 +43,107 @@ def test_rbac_teacher_only_endpoints(client):
     assert r.status_code == 200
 
 
+
+
+def test_role_checks_trust_token_claims(client, monkeypatch):
+    import app.crud as crud
+
+    register(client, "claims", "pass", role="teacher")
+    tok = login(client, "claims", "pass")
+
+    def no_lookup(*args, **kwargs):
+        raise AssertionError("user lookup on a claims-authorized request")
+
+    monkeypatch.setattr(crud, "get_user", no_lookup)
+    monkeypatch.setattr(crud, "get_user_by_username", no_lookup)
+    r = client.get("/api/sections", headers=auth_headers(tok))
+    assert r.status_code == 200, r.text
+
+
+def test_database_principal_is_cached_until_invalidated(client, monkeypatch):
+    monkeypatch.setenv("CLUB_CHECK_TRUST_TOKEN_CLAIMS", "false")
+    from app import config
+    config.get_settings.cache_clear()
+    import app.crud as crud
+
+    teacher = register(client, "cached", "pass", role="teacher")
+    tok = login(client, "cached", "pass")
+
+    calls = []
+    get_user = crud.get_user
+    monkeypatch.setattr(crud, "get_user", lambda db, user_id: calls.append(user_id) or get_user(db, user_id))
+
+    assert client.get("/api/sections", headers=auth_headers(tok)).status_code == 200
+    assert client.get("/api/sections", headers=auth_headers(tok)).status_code == 200
+    assert calls == [teacher["id"]]
+
+    r = client.post(f"/api/teacher/master-qr/enable/{teacher['id']}", headers=auth_headers(tok))
+    assert r.status_code == 200
+    calls.clear()
+    assert client.get("/api/sections", headers=auth_headers(tok)).status_code == 200
+    assert calls == [teacher["id"]]
+
+
+def test_sqlite_pragmas_and_pool_stats(client, monkeypatch):
+    import app.database as database
+    from app import config
+
+    with database.get_engine().connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() == "wal"
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+
+    assert client.get("/health/db-pool").status_code == 404
+    monkeypatch.setenv("CLUB_CHECK_OPS_TOKEN", "ops-secret")
+    config.get_settings.cache_clear()
+    assert client.get("/health/db-pool").status_code == 401
+    assert client.get("/health/db-pool", headers=auth_headers("wrong")).status_code == 401
+    stats = client.get("/health/db-pool", headers=auth_headers("ops-secret")).json()
+    assert stats["checkouts"] >= 1
+    assert stats["size"] == 10
+    assert stats["checked_out"] == 0
+
+
+def test_login_rehashes_password_when_cost_changes(client, monkeypatch):
+    import app.config as cfg
+    import app.database as database
+    import app.models as models
+
+    register(client, "rehash", "pass")
+
+    def stored_hash():
+        db = database.SessionLocal()
+        try:
+            return db.query(models.User).filter_by(username="rehash").one().hashed_password
+        finally:
+            db.close()
+
+    assert stored_hash().startswith("$2b$04$")
+    monkeypatch.setenv("CLUB_CHECK_BCRYPT_ROUNDS", "5")
+    cfg.get_settings.cache_clear()
+    login(client, "rehash", "pass")
+    assert stored_hash().startswith("$2b$05$")
+    login(client, "rehash", "pass")
+
+
+def test_saturated_password_pool_rejects_logins(client, monkeypatch):
+    register(client, "busy", "pass")
+    monkeypatch.setenv("CLUB_CHECK_PASSWORD_HASH_MAX_PENDING", "0")
+    from app import config
+    config.get_settings.cache_clear()
+
+    r = client.post(
+        "/api/auth/token",
+        data={"username": "busy", "password": "pass"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
+def test_startup_timings_are_exposed(client):
+    from fastapi.testclient import TestClient
+    from app.main import create_app
+
+    with TestClient(create_app()) as started:
+        timings = started.get("/health/startup").json()
+    assert {"imports_ms", "create_app_ms", "startup_hooks_ms"} <= timings.keys()
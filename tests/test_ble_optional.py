@@ -26,9 +26,8 @@ def auth_headers(token):
 
 def test_ble_check_optional_off(client, monkeypatch):
     monkeypatch.setenv("CLUB_CHECK_ENABLE_BLE_CHECK", "false")
-    import importlib
-    import app.config as cfg
-    importlib.reload(cfg)
+    from app import config
+    config.get_settings.cache_clear()
 
     teacher = register(client, "tb", "pass", role="teacher")
     student = register(client, "sb", "pass", role="student")
@@ -51,9 +50,8 @@ def test_ble_check_optional_off(client, monkeypatch):
 
 def test_ble_check_enabled_requires_beacon(client, monkeypatch):
     monkeypatch.setenv("CLUB_CHECK_ENABLE_BLE_CHECK", "true")
-    import importlib
-    import app.config as cfg
-    importlib.reload(cfg)
+    from app import config
+    config.get_settings.cache_clear()
 
     teacher = register(client, "tb2", "pass", role="teacher")
     student = register(client, "sb2", "pass", role="student")
@@ -87,3 +85,30 @@ def test_ble_check_enabled_requires_beacon(client, monkeypatch):
     assert r.status_code == 200, r.text
 
 
+
+
+def test_beacon_cache_follows_shared_version(client):
+    import app.crud as crud
+    import app.database as database
+    import app.models as models
+    from app.beacon_cache import BEACONS_RESOURCE, beacon_allow_list
+
+    db = database.SessionLocal()
+    try:
+        section = models.Section(name="BLE-cache")
+        db.add(section)
+        db.commit()
+        crud.add_section_beacon(db, section.id, "beacon-a")
+        assert crud.get_resource_version(db, BEACONS_RESOURCE) == 1
+        assert crud.is_beacon_allowed_for_section(db, section.id, "beacon-a")
+        assert not crud.is_beacon_allowed_for_section(db, section.id, "beacon-b")
+
+        # another worker adds a beacon: rows and version change without touching this process's cache
+        db.add(models.SectionBeacon(section_id=section.id, beacon_id="beacon-b"))
+        crud.bump_resource_version(db, BEACONS_RESOURCE)
+        db.commit()
+        assert not crud.is_beacon_allowed_for_section(db, section.id, "beacon-b")
+        beacon_allow_list._checked_at = float("-inf")
+        assert crud.is_beacon_allowed_for_section(db, section.id, "beacon-b")
+    finally:
+        db.close()
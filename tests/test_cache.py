@@ -0,0 +1,118 @@
+import pyotp
+import pytest
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def shared_backend(monkeypatch):
+    monkeypatch.setenv("CLUB_CHECK_CACHE_URL", "memory://")
+    from app import cache, config
+
+    config.get_settings.cache_clear()
+    cache.configure_caches(config.get_settings())
+    try:
+        yield cache._backend
+    finally:
+        monkeypatch.delenv("CLUB_CHECK_CACHE_URL")
+        config.get_settings.cache_clear()
+        cache.configure_caches(config.get_settings())
+
+
+def test_invalidation_clears_shared_copy_and_notifies_other_workers(shared_backend):
+    from app import cache, schemas
+
+    received = []
+    shared_backend.subscribe(received.append)
+    cache.user_cache.set(7, schemas.Principal(id=7, username="u7", role="student"))
+    assert shared_backend.get("club_check:users:7") is not None
+
+    cache.user_cache.invalidate(7)
+    assert shared_backend.get("club_check:users:7") is None
+    assert received == [f"{cache._origin} users 7"]
+
+
+def test_messages_from_other_workers_evict_local_entries(shared_backend):
+    from app import cache, schemas
+    from app.totp_index import totp_index
+
+    cache.user_cache.set(7, schemas.Principal(id=7, username="u7", role="student"))
+    shared_backend.publish("another-worker users 7")
+    assert cache.TTLCache.get(cache.user_cache, "7") is None
+    assert cache.user_cache.get(7).username == "u7"
+
+    secret = pyotp.random_base32()
+    totp_index.load([(5, secret)])
+    token = pyotp.TOTP(secret).now()
+    assert totp_index.probe(token) == {5}
+    shared_backend.publish("another-worker totp 5")
+    assert totp_index.probe(token) == set()
+    assert totp_index.reload_due()
+    totp_index.clear()
+
+
+def test_principal_cached_by_one_worker_is_reused_by_another(client, monkeypatch, shared_backend):
+    monkeypatch.setenv("CLUB_CHECK_TRUST_TOKEN_CLAIMS", "false")
+    from app import cache, config
+    import app.crud as crud
+
+    config.get_settings.cache_clear()
+    teacher = register(client, "shared", "pass", role="teacher")
+    tok = login(client, "shared", "pass")
+
+    calls = []
+    get_user = crud.get_user
+    monkeypatch.setattr(crud, "get_user", lambda db, user_id: calls.append(user_id) or get_user(db, user_id))
+
+    assert client.get("/api/sections", headers=auth_headers(tok)).status_code == 200
+    cache.TTLCache.clear(cache.user_cache)
+    assert client.get("/api/sections", headers=auth_headers(tok)).status_code == 200
+    assert calls == [teacher["id"]]
+
+
+def test_backend_errors_fall_back_to_the_local_cache(shared_backend, caplog):
+    from app import cache, schemas
+
+    class Down(cache.InProcessBackend):
+        errors = (ConnectionError,)
+
+        def get(self, *args):
+            raise ConnectionError("redis is down")
+
+        set = delete = publish = get
+
+    cache._backend = Down()
+    principal = schemas.Principal(id=8, username="u8", role="student")
+    cache.user_cache.set(8, principal)
+    assert cache.user_cache.get(8) == principal
+    assert cache.master_session_cache.get(1) is None
+    cache.user_cache.invalidate(8)
+    assert cache.user_cache.get(8) is None
+    assert "falling back to the local cache" in caplog.text
+
+    calls = []
+    cache.on_invalidate("broken", lambda key: 1 / 0)
+    cache.on_invalidate("broken", calls.append)
+    cache._receive("another-worker broken 3")
+    assert calls == ["3"]
@@ -0,0 +1,78 @@
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_sections_answer_304_until_a_section_is_created(client, monkeypatch):
+    import app.crud as crud
+
+    register(client, "etag-t", "pass", role="teacher")
+    headers = auth_headers(login(client, "etag-t", "pass"))
+    client.post("/api/sections", json={"name": "Cached"}, headers=headers)
+
+    first = client.get("/api/sections", headers=headers)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "public, no-cache"
+    etag = first.headers["ETag"]
+
+    monkeypatch.setattr(crud, "list_sections", lambda db: (_ for _ in ()).throw(AssertionError("ORM queried")))
+    r = client.get("/api/sections", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["ETag"] == etag
+    monkeypatch.undo()
+    # a second-resolution date cannot prove freshness, only the ETag can
+    r = client.get("/api/sections", headers={**headers, "If-Modified-Since": first.headers["Last-Modified"]})
+    assert r.status_code == 200
+
+    client.post("/api/sections", json={"name": "Cached 2"}, headers=headers)
+    r = client.get("/api/sections", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert [s["name"] for s in r.json()][-1] == "Cached 2"
+
+
+def test_roster_and_beacon_etags_follow_their_writes(client):
+    teacher = register(client, "etag-t2", "pass", role="teacher")
+    student = register(client, "etag-s2", "pass")
+    headers = auth_headers(login(client, "etag-t2", "pass"))
+    section = client.post("/api/sections", json={"name": "Roster"}, headers=headers).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=headers)
+
+    roster_url = f"/api/sections/{section['id']}/students"
+    empty = client.get(roster_url, headers=headers)
+    assert empty.headers["Cache-Control"] == "private, no-cache"
+    assert client.get(roster_url, headers={**headers, "If-None-Match": empty.headers["ETag"]}).status_code == 304
+
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=headers)
+    r = client.get(roster_url, headers={**headers, "If-None-Match": empty.headers["ETag"]})
+    assert r.status_code == 200
+    assert [entry["id"] for entry in r.json()] == [student["id"]]
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=headers)
+    assert client.get(roster_url, headers={**headers, "If-None-Match": r.headers["ETag"]}).status_code == 304
+
+    beacons_url = f"/api/sections/{section['id']}/beacons"
+    etag = client.get(beacons_url, headers=headers).headers["ETag"]
+    client.post(beacons_url, json={"section_id": section["id"], "beacon_id": "b-1"}, headers=headers)
+    assert client.get(beacons_url, headers={**headers, "If-None-Match": etag}).status_code == 200
+
+    outsider = auth_headers(login(client, "etag-s2", "pass"))
+    assert client.get(roster_url, headers={**outsider, "If-None-Match": "*"}).status_code == 403
@@ -0,0 +1,46 @@
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_large_lists_are_gzipped_and_keep_their_shape(client):
+    teacher = register(client, "fast-t", "pass", role="teacher")
+    headers = auth_headers(login(client, "fast-t", "pass"))
+    for n in range(40):
+        register(client, f"fast-s{n:02d}", "pass")
+
+    r = client.get("/api/users/?limit=3", headers={**headers, "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in r.headers
+    assert "Accept-Encoding" in r.headers["Vary"]
+    assert r.json()[0] == {"username": "fast-t", "full_name": "Fast-T", "role": "teacher", "id": teacher["id"]}
+    assert r.headers["X-Next-After-Id"] == str(r.json()[-1]["id"])
+
+    r = client.get("/api/users/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["ETag"].endswith('-gzip"')
+    assert len(r.json()) == 41
+    cached = client.get("/api/users/", headers={**headers, "If-None-Match": r.headers["ETag"]})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == r.headers["ETag"]
+    assert "Accept-Encoding" in cached.headers["Vary"]
+
+    schema = client.get("/openapi.json").json()["paths"]["/api/users/"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"]["items"]["$ref"].endswith("/User")
@@ -0,0 +1,167 @@
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def section_with_students(client, prefix, students):
+    teacher = register(client, f"{prefix}-t", "pass", role="teacher")
+    headers = auth_headers(login(client, f"{prefix}-t", "pass"))
+    section = client.post("/api/sections", json={"name": prefix}, headers=headers).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=headers)
+    members = []
+    for n in range(students):
+        members.append(register(client, f"{prefix}-s{n}", "pass"))
+        client.post(f"/api/sections/{section['id']}/students/{members[-1]['id']}", headers=headers)
+    return teacher, headers, section, members
+
+
+def test_presence_bitmaps_and_tally():
+    from app import presence
+
+    bits = presence.from_positions([0, 3, 9])
+    assert presence.decode(presence.encode(bits)) == bits
+    assert presence.encode(bits) == b"\x09\x02"
+    assert presence.positions(presence.absent(bits, 5)) == [1, 2, 4]
+
+    tally = presence.Tally()
+    for positions in ([0, 1], [1], [1, 2], [1]):
+        tally.add(presence.from_positions(positions))
+    assert [tally[position] for position in range(4)] == [1, 4, 1, 0]
+
+
+def test_master_qr_scans_fill_the_open_lecture(client):
+    teacher, headers, section, students = section_with_students(client, "lec-qr", 3)
+    r = client.post(f"/api/teacher/master-qr/enable/{teacher['id']}?section_id={section['id']}", headers=headers)
+    secret = r.json()["master_qr_secret"]
+    lectures = client.get(f"/api/sections/{section['id']}/lectures", headers=headers).json()
+    assert [(lecture["roster_size"], lecture["present"]) for lecture in lectures] == [(3, 0)]
+
+    for student in (students[0], students[2], students[2]):
+        s_tok = login(client, student["username"], "pass")
+        r = client.post(
+            f"/api/attendance/scan-lecture?secret={secret}&student_id={student['id']}&section_id={section['id']}",
+            headers=auth_headers(s_tok),
+        )
+        assert r.status_code == 200, r.text
+
+    r = client.get(f"/api/sections/{section['id']}/lectures/{lectures[0]['id']}", headers=headers)
+    assert r.json()["lecture"]["present"] == 2
+    assert [entry["id"] for entry in r.json()["present"]] == [students[0]["id"], students[2]["id"]]
+    assert [entry["id"] for entry in r.json()["absent"]] == [students[1]["id"]]
+
+    client.post(f"/api/teacher/master-qr/disable/{teacher['id']}", headers=headers)
+    closed = client.get(f"/api/sections/{section['id']}/lectures", headers=headers).json()[0]
+    assert closed["ends_at"] < lectures[0]["ends_at"]
+
+
+def test_manual_marks_backfill_and_term_rates(client):
+    from datetime import datetime, timedelta
+
+    _, headers, section, students = section_with_students(client, "lec-manual", 2)
+    url = f"/api/sections/{section['id']}/lectures"
+    manual = lambda student: client.post(
+        "/api/attendance/manual", json={"section_id": section["id"], "student_id": student["id"]}, headers=headers
+    )
+
+    manual(students[0])
+    started = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+    first = client.post(url, json={"starts_at": started, "minutes": 30}, headers=headers).json()
+    assert (first["roster_size"], first["present"]) == (2, 1)
+
+    late = register(client, "lec-manual-late", "pass")
+    client.post(f"/api/sections/{section['id']}/students/{late['id']}", headers=headers)
+    manual(late)
+    assert client.get(f"{url}/{first['id']}", headers=headers).json()["lecture"] == {**first, "roster_size": 3, "present": 2}
+
+    later = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    client.post(url, json={"starts_at": later, "minutes": 30}, headers=headers)
+    r = client.get(f"{url}/rates", headers=headers)
+    assert r.status_code == 200, r.text
+    rates = r.json()
+    assert (rates["lectures"], rates["present"], rates["expected"], rates["rate"]) == (2, 2, 6, 0.3333)
+    assert [(s["id"], s["attended"], s["held"]) for s in rates["students"]] == [
+        (students[0]["id"], 1, 2), (students[1]["id"], 0, 2), (late["id"], 1, 2),
+    ]
+    assert client.get(f"{url}/rates?end={later}", headers=headers).json()["lectures"] == 1
+
+    assert client.post(url, json={"starts_at": later, "ends_at": started}, headers=headers).status_code == 400
+    outsider = auth_headers(login(client, "lec-manual-s0", "pass"))
+    assert client.get(f"{url}/{first['id']}", headers=outsider).status_code == 403
+
+
+def test_attendance_window_keys_lectures_and_slides_outside_them(client, monkeypatch):
+    from datetime import datetime, timedelta
+    from app import config
+
+    _, headers, section, students = section_with_students(client, "lec-window", 1)
+    mark = lambda: client.post(
+        "/api/attendance/manual", json={"section_id": section["id"], "student_id": students[0]["id"]}, headers=headers
+    ).json()["id"]
+    batch = lambda *stamps: [
+        item["attendance"]["id"] for item in client.post(
+            "/api/attendance/batch",
+            json={"items": [{"section_id": section["id"], "student_id": students[0]["id"], "timestamp": stamp} for stamp in stamps]},
+            headers=headers,
+        ).json()
+    ]
+    assert mark() != mark()
+
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_SESSION_WINDOW_MINUTES", "30")
+    config.get_settings.cache_clear()
+    started = datetime.utcnow() - timedelta(minutes=50)
+    client.post(f"/api/sections/{section['id']}/lectures", json={"starts_at": started.isoformat(), "minutes": 90}, headers=headers)
+    first = mark()
+    assert mark() == first
+    assert batch((started + timedelta(minutes=1)).isoformat()) == [first]
+
+    ids = batch("2024-09-02T09:00:00", "2024-09-02T09:15:00", "2024-09-02T08:50:00", "2024-09-02T09:40:00")
+    assert ids[0] == ids[1] == ids[2] != ids[3]
+    assert batch("2024-09-02T09:10:00") == [ids[0]]
+
+
+def test_presence_update_locks_the_lecture_after_lost_races(client, monkeypatch):
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    import app.crud as crud
+    import app.database as database
+
+    _, headers, section, students = section_with_students(client, "lec-race", 2)
+    started = datetime.utcnow() - timedelta(minutes=5)
+    url = f"/api/sections/{section['id']}/lectures"
+    lecture = client.post(url, json={"starts_at": started.isoformat(), "minutes": 30}, headers=headers).json()
+
+    locks = []
+    query, swap = crud.lecture_presence_query, crud.lecture_presence_swap
+    monkeypatch.setattr(crud, "lecture_presence_query", lambda lecture_id, lock=False: locks.append(lock) or query(lecture_id, lock))
+    # every optimistic attempt loses to a concurrent writer
+    monkeypatch.setattr(crud, "lecture_presence_swap", lambda lecture_id, row, bits: swap(
+        lecture_id, row if locks[-1] else (row[0], row[1], row[2] - 1), bits
+    ))
+    db = database.SessionLocal()
+    try:
+        mark = SimpleNamespace(section_id=section["id"], student_id=students[1]["id"], timestamp=datetime.utcnow())
+        crud.record_lecture_presence(db, [mark])
+        db.commit()
+    finally:
+        db.close()
+    assert locks == [False] * crud.LECTURE_PRESENCE_CAS_ATTEMPTS + [True]
+    detail = client.get(f"{url}/{lecture['id']}", headers=headers).json()
+    assert [entry["id"] for entry in detail["present"]] == [students[1]["id"]]
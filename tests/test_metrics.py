@@ -0,0 +1,72 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+
+
+def test_metrics_endpoint_reports_routes_and_queries(client, monkeypatch):
+    monkeypatch.setenv("CLUB_CHECK_METRICS_ENABLED", "true")
+    monkeypatch.setenv("CLUB_CHECK_METRICS_SLOW_QUERY_MS", "0")
+    monkeypatch.setenv("CLUB_CHECK_OPS_TOKEN", "ops-secret")
+    from app import config, database
+    from app.main import create_app
+    from app.metrics import metrics
+
+    config.get_settings.cache_clear()
+    database.reset_engines()
+    metrics.clear()
+    instrumented = TestClient(create_app())
+
+    register(instrumented, "metrics-student", "pass")
+    headers = auth_headers(login(instrumented, "metrics-student", "pass"))
+    assert instrumented.get("/api/attendance/count", headers=headers).status_code == 200
+
+    assert instrumented.get("/metrics", headers=headers).status_code == 401
+    text = instrumented.get("/metrics", headers=auth_headers("ops-secret")).text
+    route = 'method="GET",route="/api/attendance/count",status="200"'
+    assert f'club_check_http_request_duration_seconds_count{{{route}}} 1' in text
+    assert 'club_check_db_queries_per_request_count{route="/api/attendance/count"} 1' in text
+    assert 'club_check_db_slow_queries_total{route="/api/auth/token"}' in text
+    assert "club_check_db_pool_checkouts" in text
+
+
+def test_metrics_disabled_by_default(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(caplog):
+    from app.metrics import Metrics, _current
+
+    registry = Metrics(slow_query_seconds=10, n_plus_one_threshold=3)
+    token = registry.start_request({"method": "POST", "route": None})
+    for _ in range(3):
+        registry.record_query("SELECT * FROM section_students WHERE student_id = ?", 0.001)
+    with caplog.at_level(logging.WARNING, logger="app.metrics"):
+        registry.finish_request(token, "POST", 200, 0.01)
+    assert _current.get() is None
+    assert registry.n_plus_one["unmatched"] == 1
+    assert "Possible N+1" in caplog.text
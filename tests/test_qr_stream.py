@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pyotp
+
+from app.qr_stream import QrTokenBroadcaster
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def test_broadcaster_pushes_next_step_to_every_connection():
+    async def scenario():
+        broadcaster = QrTokenBroadcaster()
+        secret = pyotp.random_base32()
+        first = broadcaster.subscribe(7, secret)
+        second = broadcaster.subscribe(7, secret)
+        assert broadcaster.connections(7) == 2
+        initial = first.get_nowait()
+        assert initial["token"] == pyotp.TOTP(secret).now()
+
+        broadcaster.publish(123)
+        second.get_nowait()
+        broadcaster.publish(124)
+        expected = {"token": pyotp.TOTP(secret).generate_otp(124), "expires_in": 30}
+        assert first.get_nowait() == expected
+        assert second.get_nowait() == expected
+
+        broadcaster.unsubscribe(7, first)
+        broadcaster.unsubscribe(7, second)
+        assert broadcaster.connections(7) == 0
+        assert broadcaster._task is None
+
+    asyncio.run(scenario())
+
+
+def test_qr_stream_sends_current_token(client):
+    import app.api as api
+    import app.database as database
+    import app.schemas as schemas
+
+    student = register(client, "streamer", "pass")
+    token = login(client, "streamer", "pass")
+    principal = schemas.Principal(id=student["id"], username="streamer", role="student")
+
+    async def first_event():
+        response = api.stream_student_qr_token(student["id"], principal)
+        assert response.media_type == "text/event-stream"
+        chunk = await response.body_iterator.__anext__()
+        # an open stream must not pin a pooled connection
+        assert database.get_engine().pool.checkedout() == 0
+        await response.body_iterator.aclose()
+        return chunk
+
+    event, data = asyncio.run(first_event()).strip().split("\n")
+    assert event == "event: token"
+    r = client.get(f"/api/student/qr-token/{student['id']}", headers={"Authorization": f"Bearer {token}"})
+    assert json.loads(data[len("data: "):])["token"] == r.json()["token"]
+
+
+def test_qr_stream_requires_credentials(client):
+    student = register(client, "anon", "pass")
+    assert client.get(f"/api/student/qr-stream/{student['id']}").status_code == 401
+
+
+def test_stream_ticket_only_opens_streams(client):
+    student = register(client, "ticketed", "pass")
+    other = register(client, "ticketed2", "pass")
+    token = login(client, "ticketed", "pass")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    r = client.post(f"/api/student/qr-stream-ticket/{student['id']}", headers=headers)
+    assert r.status_code == 200
+    ticket = r.json()["ticket"]
+    assert client.post(f"/api/student/qr-stream-ticket/{other['id']}", headers=headers).status_code == 403
+
+    assert client.get(f"/api/student/qr-stream/{other['id']}?ticket={ticket}").status_code == 403
+    assert client.get(f"/api/student/qr-stream/{student['id']}?access_token={token}").status_code == 401
+    assert client.get(f"/api/student/qr-stream/{student['id']}?ticket={token}").status_code == 401
+    assert client.get("/api/attendance/count", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+
+
+def test_open_stream_follows_secret_changes():
+    async def scenario():
+        broadcaster = QrTokenBroadcaster()
+        old, new = pyotp.random_base32(), pyotp.random_base32()
+        queue = broadcaster.subscribe(7, old)
+        assert queue.get_nowait()["token"] == pyotp.TOTP(old).now()
+
+        await asyncio.to_thread(broadcaster.set_secret, 7, new)
+        event = await asyncio.wait_for(queue.get(), 1)
+        assert event["token"] == pyotp.TOTP(new).now()
+        broadcaster.unsubscribe(7, queue)
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import csv
+import io
+
+import pytest
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+
+
+def test_section_reports_matrix_rates_and_exports(client):
+    teacher = register(client, "rt", "pass", role="teacher")
+    present = register(client, "rs1", "pass", role="student")
+    absent = register(client, "rs2", "pass", role="student")
+    t_tok = login(client, "rt", "pass")
+    section = client.post("/api/sections", json={"name": "Reports"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    for student in (present, absent):
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+    r = client.post(
+        "/api/attendance/batch",
+        json={"items": [
+            {"section_id": section["id"], "student_id": present["id"], "timestamp": "2024-09-02T09:00:00Z"},
+            {"section_id": section["id"], "student_id": present["id"], "timestamp": "2024-09-03T09:00:00Z"},
+            {"section_id": section["id"], "student_id": present["id"], "timestamp": "2024-10-01T09:00:00Z"},
+        ]},
+        headers=auth_headers(t_tok),
+    )
+    assert r.status_code == 200, r.text
+    base = f"/api/reports/sections/{section['id']}"
+    september = "start=2024-09-01T00:00:00Z&end=2024-10-01T00:00:00Z"
+
+    r = client.get(f"{base}/matrix?{september}", headers=auth_headers(t_tok))
+    assert r.status_code == 200, r.text
+    assert r.json() == [
+        {"student_id": present["id"], "full_name": "Rs1", "2024-09-02": 1, "2024-09-03": 1},
+        {"student_id": absent["id"], "full_name": "Rs2", "2024-09-02": 0, "2024-09-03": 0},
+    ]
+
+    r = client.get(f"{base}/rates", headers=auth_headers(t_tok))
+    assert [(row["attended_days"], row["held_days"], row["rate"]) for row in r.json()] == [(3, 3, 1.0), (0, 3, 0.0)]
+
+    r = client.get(f"{base}/absentees?{september}", headers=auth_headers(t_tok))
+    assert [row["student_id"] for row in r.json()] == [absent["id"]]
+
+    r = client.get(f"{base}/matrix?{september}&format=csv", headers=auth_headers(t_tok))
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert rows[0] == ["student_id", "full_name", "2024-09-02", "2024-09-03"]
+    assert rows[2] == [str(absent["id"]), "Rs2", "0", "0"]
+
+    register(client, "rt2", "pass", role="teacher")
+    r = client.get(f"{base}/matrix", headers=auth_headers(login(client, "rt2", "pass")))
+    assert r.status_code == 403
+
+
+def test_section_report_parquet_and_arrow_exports(client):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    teacher = register(client, "pt", "pass", role="teacher")
+    student = register(client, "ps", "pass", role="student")
+    t_tok = login(client, "pt", "pass")
+    section = client.post("/api/sections", json={"name": "Columnar"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+    client.post(
+        "/api/attendance/batch",
+        json={"items": [{"section_id": section["id"], "student_id": student["id"], "timestamp": "2024-09-02T09:00:00Z"}]},
+        headers=auth_headers(t_tok),
+    )
+
+    r = client.get(f"/api/reports/sections/{section['id']}/rates?format=parquet", headers=auth_headers(t_tok))
+    assert r.status_code == 200, r.text
+    table = pq.read_table(io.BytesIO(r.content))
+    assert table.column_names == ["student_id", "full_name", "attended_days", "held_days", "rate"]
+    assert table.to_pylist()[0]["rate"] == 1.0
+
+    r = client.get(f"/api/reports/sections/{section['id']}/matrix?format=arrow", headers=auth_headers(t_tok))
+    assert r.status_code == 200, r.text
+    table = pa.ipc.open_stream(r.content).read_all()
+    assert table.to_pylist() == [{"student_id": student["id"], "full_name": "Ps", "2024-09-02": 1}]
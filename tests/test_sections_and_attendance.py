@@ -1,5 +1,6 @@
 from fastapi import status
 import pyotp
+import pytest
 
 
 def register(client, username, password, role="student"):
@@ -76,3 +77,301 @@ def test_student_qr_totp_scan_by_teacher(client):
     )
     assert r.status_code == 200, r.text
 
+
+
+def test_batch_attendance_reports_per_item_status(client):
+    teacher = register(client, "t3", "pass", role="teacher")
+    student = register(client, "s3", "pass", role="student")
+    outsider = register(client, "s4", "pass", role="student")
+    t_tok = login(client, "t3", "pass")
+
+    own = client.post("/api/sections", json={"name": "Sec C"}, headers=auth_headers(t_tok)).json()
+    other = client.post("/api/sections", json={"name": "Sec D"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{own['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{own['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    r = client.post(
+        "/api/attendance/batch",
+        json={"items": [
+            {"section_id": own["id"], "student_id": student["id"], "timestamp": "2024-09-02T09:00:00Z"},
+            {"section_id": own["id"], "student_id": outsider["id"]},
+            {"section_id": other["id"], "student_id": student["id"]},
+            {"section_id": own["id"], "student_id": student["id"]},
+        ]},
+        headers=auth_headers(t_tok),
+    )
+    assert r.status_code == 200, r.text
+    results = r.json()
+    assert [item["status_code"] for item in results] == [200, 400, 403, 200]
+    assert results[0]["attendance"]["timestamp"].startswith("2024-09-02T09:00:00")
+    assert results[3]["attendance"]["id"] > results[0]["attendance"]["id"]
+
+
+def test_attendance_counters_track_marks_and_rebuild(client, monkeypatch):
+    import app.crud as crud
+    import app.database as database
+    import app.models as models
+    from app import config
+
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_SESSION_WINDOW_MINUTES", "90")
+    config.get_settings.cache_clear()
+
+    teacher = register(client, "t5", "pass", role="teacher")
+    student = register(client, "s5", "pass", role="student")
+    t_tok = login(client, "t5", "pass")
+    s_tok = login(client, "s5", "pass")
+    sections = [client.post("/api/sections", json={"name": name}, headers=auth_headers(t_tok)).json() for name in ("E", "F")]
+    for section in sections:
+        client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    client.post("/api/attendance/manual", json={"section_id": sections[0]["id"], "student_id": student["id"]}, headers=auth_headers(t_tok))
+    client.post(
+        "/api/attendance/batch",
+        json={"items": [{"section_id": sections[1]["id"], "student_id": student["id"]}] * 2},
+        headers=auth_headers(t_tok),
+    )
+
+    def count(section_id=None):
+        url = "/api/attendance/count" + (f"?section_id={section_id}" if section_id else "")
+        return client.get(url, headers=auth_headers(s_tok)).json()["count"]
+
+    assert (count(), count(sections[0]["id"]), count(sections[1]["id"])) == (2, 1, 1)
+
+    db = database.SessionLocal()
+    try:
+        assert crud.verify_attendance_counters(db) == []
+        db.query(models.SectionAttendanceCounter).filter_by(section_id=sections[1]["id"]).update({"count": 7})
+        db.commit()
+        assert crud.verify_attendance_counters(db) == [(student["id"], sections[1]["id"], 7, 1)]
+        crud.rebuild_attendance_counters(db)
+        assert crud.verify_attendance_counters(db) == []
+    finally:
+        db.close()
+    assert count(sections[1]["id"]) == 1
+
+
+def test_repeated_memberships_and_marks_are_idempotent(client, monkeypatch):
+    import app.database as database
+    import app.models as models
+    from app import config
+
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_SESSION_WINDOW_MINUTES", "90")
+    config.get_settings.cache_clear()
+
+    teacher = register(client, "t6", "pass", role="teacher")
+    student = register(client, "s6", "pass", role="student")
+    t_tok = login(client, "t6", "pass")
+    s_tok = login(client, "s6", "pass")
+    section = client.post("/api/sections", json={"name": "G"}, headers=auth_headers(t_tok)).json()
+    for _ in range(2):
+        assert client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok)).status_code == 200
+        assert client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok)).status_code == 200
+        r = client.post(
+            f"/api/sections/{section['id']}/beacons",
+            json={"section_id": section["id"], "beacon_id": "b-1"},
+            headers=auth_headers(t_tok),
+        )
+        assert r.status_code == 200
+
+    marks = [
+        client.post("/api/attendance/manual", json={"section_id": section["id"], "student_id": student["id"]}, headers=auth_headers(t_tok)).json()
+        for _ in range(2)
+    ]
+    assert marks[0]["id"] == marks[1]["id"]
+    assert client.get(f"/api/attendance/count?section_id={section['id']}", headers=auth_headers(s_tok)).json()["count"] == 1
+
+    db = database.SessionLocal()
+    try:
+        assert db.query(models.SectionStudent).count() == 1
+        assert db.query(models.SectionTeacher).count() == 1
+        assert db.query(models.SectionBeacon).count() == 1
+        assert db.query(models.SectionAttendance).count() == 1
+    finally:
+        db.close()
+
+
+def test_users_keyset_pages_filters_and_section_roster(client):
+    teacher = register(client, "t7", "pass", role="teacher")
+    students = [register(client, name, "pass", role="student") for name in ("anna", "andrew", "boris")]
+    t_tok = login(client, "t7", "pass")
+    section = client.post("/api/sections", json={"name": "H"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    for student in students[1:]:
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    r = client.get("/api/users/?role=student&limit=2", headers=auth_headers(t_tok))
+    assert [u["username"] for u in r.json()] == ["anna", "andrew"]
+    cursor = r.headers["X-Next-After-Id"]
+    r = client.get(f"/api/users/?role=student&limit=2&after_id={cursor}", headers=auth_headers(t_tok))
+    assert [u["username"] for u in r.json()] == ["boris"]
+    assert "X-Next-After-Id" not in r.headers
+
+    r = client.get("/api/users/?name_prefix=An", headers=auth_headers(t_tok))
+    assert [u["username"] for u in r.json()] == ["anna", "andrew"]
+    r = client.get(f"/api/users/?section_id={section['id']}", headers=auth_headers(t_tok))
+    assert [u["username"] for u in r.json()] == ["t7", "andrew", "boris"]
+
+    r = client.get(f"/api/sections/{section['id']}/students", headers=auth_headers(t_tok))
+    assert r.json() == [{"id": s["id"], "full_name": s["full_name"]} for s in students[1:]]
+
+
+def test_master_qr_session_binding_disable_and_expiry(client):
+    import datetime
+    import app.database as database
+    import app.models as models
+
+    teacher = register(client, "t8", "pass", role="teacher")
+    student = register(client, "s8", "pass", role="student")
+    t_tok = login(client, "t8", "pass")
+    s_tok = login(client, "s8", "pass")
+    bound, other = [client.post("/api/sections", json={"name": name}, headers=auth_headers(t_tok)).json() for name in ("I", "J")]
+    client.post(f"/api/sections/{bound['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    for section in (bound, other):
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    def scan(secret, section):
+        return client.post(
+            f"/api/attendance/scan-lecture?secret={secret}&student_id={student['id']}&section_id={section['id']}",
+            headers=auth_headers(s_tok),
+        ).status_code
+
+    r = client.post(f"/api/teacher/master-qr/enable/{teacher['id']}?section_id={bound['id']}", headers=auth_headers(t_tok))
+    secret = r.json()["master_qr_secret"]
+    assert scan(secret, other) == 400
+    assert scan(secret, bound) == 200
+
+    client.post(f"/api/teacher/master-qr/disable/{teacher['id']}", headers=auth_headers(t_tok))
+    assert scan(secret, bound) == 400
+
+    secret = client.post(f"/api/teacher/master-qr/enable/{teacher['id']}", headers=auth_headers(t_tok)).json()["master_qr_secret"]
+    assert scan(secret, other) == 200
+    db = database.SessionLocal()
+    try:
+        db.query(models.MasterQrSession).filter_by(secret=secret).update(
+            {"expires_at": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)}
+        )
+        db.commit()
+    finally:
+        db.close()
+    import app.cache as cache
+    cache.master_session_cache.clear()
+    assert scan(secret, other) == 400
+
+
+def test_manual_mark_checks_membership_inside_the_insert(client):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    teacher = register(client, "t14", "pass", role="teacher")
+    other = register(client, "t14b", "pass", role="teacher")
+    student = register(client, "s14", "pass", role="student")
+    outsider = register(client, "s14b", "pass", role="student")
+    t_tok = login(client, "t14", "pass")
+    o_tok = login(client, "t14b", "pass")
+    section = client.post("/api/sections", json={"name": "Sec 14"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", listener)
+    try:
+        r = client.post(
+            "/api/attendance/manual",
+            json={"section_id": section["id"], "student_id": student["id"]},
+            headers=auth_headers(t_tok),
+        )
+    finally:
+        event.remove(Engine, "before_cursor_execute", listener)
+    assert r.status_code == 200, r.text
+    membership = [s for s in statements if "section_teachers" in s or "section_students" in s]
+    assert len(membership) == 1 and membership[0].lstrip().upper().startswith("INSERT")
+
+    r = client.post(
+        "/api/attendance/manual",
+        json={"section_id": section["id"], "student_id": student["id"]},
+        headers=auth_headers(o_tok),
+    )
+    assert r.status_code == 403
+    assert r.json()["detail"] == "Teacher not assigned to this section"
+    r = client.post(
+        "/api/attendance/manual",
+        json={"section_id": section["id"], "student_id": outsider["id"]},
+        headers=auth_headers(t_tok),
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Student not in section"
+
+    r = client.get(f"/api/attendance/count?section_id={section['id']}", headers=auth_headers(login(client, "s14", "pass")))
+    assert r.json()["count"] == 1
+
+
+def test_ambiguous_totp_does_not_reveal_rosters_to_other_teachers(client, monkeypatch):
+    import app.async_crud as async_crud
+    import app.crud as crud
+
+    teacher = register(client, "t15", "pass", role="teacher")
+    register(client, "t15b", "pass", role="teacher")
+    first = register(client, "s15", "pass", role="student")
+    second = register(client, "s15b", "pass", role="student")
+    t_tok = login(client, "t15", "pass")
+    o_tok = login(client, "t15b", "pass")
+    section = client.post("/api/sections", json={"name": "Sec 15"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    for student in (first, second):
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    candidates = [first["id"], second["id"]]
+    monkeypatch.setattr(crud, "find_user_ids_by_totp", lambda db, token: candidates)
+
+    async def async_candidates(db, token):
+        return candidates
+
+    monkeypatch.setattr(async_crud, "find_user_ids_by_totp", async_candidates)
+    url = f"/api/attendance/scan-student?token=123456&section_id={section['id']}"
+    r = client.post(url, headers=auth_headers(o_tok))
+    assert r.status_code == 403
+    assert r.json()["detail"] == "Teacher not assigned to this section"
+    assert client.post(url, headers=auth_headers(t_tok)).status_code == 409
+
+
+@pytest.mark.parametrize("window", ["0", "90"])
+def test_batch_statement_count_does_not_grow_with_batch_size(client, monkeypatch, window):
+    from sqlalchemy import event
+    import app.database as database
+    from app import config
+
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_SESSION_WINDOW_MINUTES", window)
+    config.get_settings.cache_clear()
+    teacher = register(client, "t-bulk", "pass", role="teacher")
+    t_tok = login(client, "t-bulk", "pass")
+    section = client.post("/api/sections", json={"name": "Bulk"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    students = [register(client, f"s-bulk{n}", "pass") for n in range(50)]
+    for student in students:
+        client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{section['id']}/lectures", json={"minutes": 60}, headers=auth_headers(t_tok))
+
+    statements = []
+    count = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(database.get_engine(), "before_cursor_execute", count)
+
+    def batch(members, day):
+        statements.clear()
+        items = [{"section_id": section["id"], "student_id": s["id"], "timestamp": f"2024-09-0{day}T09:00:00"} for s in members]
+        r = client.post("/api/attendance/batch", json={"items": items}, headers=auth_headers(t_tok))
+        assert r.status_code == 200, r.text
+        assert [item["attendance"]["student_id"] for item in r.json()] == [s["id"] for s in members]
+        return len(statements)
+
+    try:
+        assert batch(students[:5], 2) == batch(students, 3)
+        assert batch(students[:1], 4) == batch(students, 5) <= 10
+        current = [{"section_id": section["id"], "student_id": s["id"]} for s in students]
+        statements.clear()
+        r = client.post("/api/attendance/batch", json={"items": current * 2}, headers=auth_headers(t_tok))
+        assert len({item["attendance"]["id"] for item in r.json()}) == (50 if window == "90" else 100)
+        assert len(statements) <= 10
+    finally:
+        event.remove(database.get_engine(), "before_cursor_execute", count)
@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import hmac
+import time
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_signed_tokens_verify_within_the_window_only():
+    from app import signed_qr
+
+    now = 1_700_000_000
+    token = signed_qr.issue(42, for_time=now)
+    assert signed_qr.is_signed(token)
+    assert signed_qr.verify(token, for_time=now) == 42
+    assert signed_qr.verify(token, for_time=now + 30) == 42
+    assert signed_qr.verify(token, for_time=now + 90) is None
+
+    prefix, user_id, step, mac = token.split(".")
+    assert signed_qr.verify(f"{prefix}.43.{step}.{mac}", for_time=now) is None
+    tampered = mac[:-1] + ("A" if mac[-1] != "A" else "B")
+    assert signed_qr.verify(f"{prefix}.{user_id}.{step}.{tampered}", for_time=now) is None
+    assert signed_qr.verify("s1.garbage", for_time=now) is None
+    assert signed_qr.hkdf_sha256(b"k", b"student-qr:1") != signed_qr.hkdf_sha256(b"k", b"student-qr:2")
+
+
+def test_signed_qr_scan_needs_no_otp_secret(client):
+    import app.database as database
+    import app.models as models
+
+    teacher = register(client, "sqt", "pass", role="teacher")
+    student = register(client, "sqs", "pass", role="student")
+    t_tok = login(client, "sqt", "pass")
+    s_tok = login(client, "sqs", "pass")
+    section = client.post("/api/sections", json={"name": "Signed"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/teachers/{teacher['id']}", headers=auth_headers(t_tok))
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+
+    r = client.get(f"/api/student/qr-token/{student['id']}?format=signed", headers=auth_headers(s_tok))
+    assert r.status_code == 200, r.text
+    token = r.json()["token"]
+
+    r = client.post(f"/api/attendance/scan-student?token={token}&section_id={section['id']}", headers=auth_headers(t_tok))
+    assert r.status_code == 200, r.text
+    assert r.json()["student_id"] == student["id"]
+
+    db = database.SessionLocal()
+    try:
+        assert db.get(models.User, student["id"]).otp_secret is None
+    finally:
+        db.close()
+
+    forged = token.rsplit(".", 1)[0] + ".AAAAAAAAAAAAAA"
+    r = client.post(f"/api/attendance/scan-student?token={forged}&section_id={section['id']}", headers=auth_headers(t_tok))
+    assert r.status_code == 400
+
+
+def test_phone_renders_the_same_code_from_its_key(client):
+    student = register(client, "keyed", "pass", role="student")
+    other = register(client, "other", "pass", role="student")
+    s_tok = login(client, "keyed", "pass")
+
+    assert client.get(f"/api/student/qr-key/{other['id']}", headers=auth_headers(s_tok)).status_code == 403
+    key = client.get(f"/api/student/qr-key/{student['id']}", headers=auth_headers(s_tok)).json()
+
+    assert abs(key["server_time"] - time.time()) < 5
+    step = int(time.time() // key["interval"])
+    raw = base64.urlsafe_b64decode(key["key"] + "=" * (-len(key["key"]) % 4))
+    mac = hmac.new(raw, f"{student['id']}.{step}".encode(), hashlib.sha256).digest()[: key["mac_bytes"]]
+    token = f"{key['format']}.{student['id']}.{step}.{base64.urlsafe_b64encode(mac).rstrip(b'=').decode()}"
+
+    from app import signed_qr
+
+    assert signed_qr.verify(token) == student["id"]
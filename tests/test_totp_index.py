@@ -0,0 +1,35 @@
+import pyotp
+
+from app.totp_index import TotpIndex
+
+
+def test_index_maps_tokens_across_window_and_rollover():
+    index = TotpIndex()
+    secret = pyotp.random_base32()
+    index.set_secret(1, secret)
+    now = 1_700_000_000
+    totp = pyotp.TOTP(secret)
+
+    assert index.probe(totp.at(now), now) == {1}
+    assert index.probe(totp.at(now - 30), now) == {1}
+    assert index.probe(totp.at(now + 30), now) == {1}
+    assert 1 not in index.probe(totp.at(now - 60), now)
+
+    later = now + 90
+    assert index.probe(totp.at(later), later) == {1}
+    assert set(index._steps) == {later // 30 - 1, later // 30, later // 30 + 1}
+
+
+def test_index_secret_change_and_collisions():
+    index = TotpIndex()
+    secret = pyotp.random_base32()
+    now = 1_700_000_000
+    index.set_secret(1, secret)
+    index.set_secret(2, secret)
+    token = pyotp.TOTP(secret).at(now)
+    assert index.probe(token, now) == {1, 2}
+
+    index.set_secret(2, pyotp.random_base32())
+    assert 2 not in index.probe(token, now)
+    index.set_secret(1, None)
+    assert index.probe(token, now) == set()
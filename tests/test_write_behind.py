@@ -0,0 +1,157 @@
+import json
+import time
+
+import pytest
+
+
+def register(client, username, password, role="student"):
+    res = client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "role": role, "full_name": username.title()},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def login(client, username, password):
+    res = client.post(
+        "/api/auth/token",
+        data={"username": username, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["access_token"]
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def enable_write_behind(monkeypatch, tmp_path, **overrides):
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_WRITE_BEHIND", "true")
+    monkeypatch.setenv("CLUB_CHECK_ATTENDANCE_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    for key, value in overrides.items():
+        monkeypatch.setenv(f"CLUB_CHECK_{key.upper()}", str(value))
+    from app import config
+    config.get_settings.cache_clear()
+    import app.attendance_queue as aq
+    return aq
+
+
+def test_scan_lecture_is_queued_and_drained_on_stop(client, monkeypatch, tmp_path):
+    aq = enable_write_behind(monkeypatch, tmp_path, attendance_flush_interval_ms=60000, attendance_session_window_minutes=0)
+    teacher = register(client, "tq", "pass", role="teacher")
+    student = register(client, "sq", "pass", role="student")
+    t_tok = login(client, "tq", "pass")
+    s_tok = login(client, "sq", "pass")
+    section = client.post("/api/sections", json={"name": "Queued"}, headers=auth_headers(t_tok)).json()
+    client.post(f"/api/sections/{section['id']}/students/{student['id']}", headers=auth_headers(t_tok))
+    secret = client.post(f"/api/teacher/master-qr/enable/{teacher['id']}", headers=auth_headers(t_tok)).json()["master_qr_secret"]
+
+    aq.attendance_queue.start()
+    try:
+        for _ in range(3):
+            r = client.post(
+                f"/api/attendance/scan-lecture?secret={secret}&student_id={student['id']}&section_id={section['id']}",
+                headers=auth_headers(s_tok),
+            )
+            assert r.status_code == 200, r.text
+        with open(aq.attendance_queue.spill_path) as fh:
+            assert len(fh.readlines()) == 3
+        assert client.get("/api/attendance/count", headers=auth_headers(s_tok)).json()["count"] == 0
+    finally:
+        aq.attendance_queue.stop()
+
+    assert client.get("/api/attendance/count", headers=auth_headers(s_tok)).json()["count"] == 3
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_file_is_replayed_on_start(client, monkeypatch, tmp_path):
+    aq = enable_write_behind(monkeypatch, tmp_path, attendance_session_window_minutes=0)
+    teacher = register(client, "tr", "pass", role="teacher")
+    student = register(client, "sr", "pass", role="student")
+    s_tok = login(client, "sr", "pass")
+    t_tok = login(client, "tr", "pass")
+    section = client.post("/api/sections", json={"name": "Replayed"}, headers=auth_headers(t_tok)).json()
+
+    row = {"section_id": section["id"], "student_id": student["id"], "timestamp": "2024-09-02T09:00:00"}
+    (tmp_path / "spill.jsonl.1").write_text(json.dumps(row) + "\n")
+    (tmp_path / "spill.jsonl").write_text(json.dumps({**row, "timestamp": "2024-09-02T09:00:01"}) + "\n")
+
+    aq.attendance_queue.start()
+    aq.attendance_queue.stop()
+    aq.attendance_queue.start()
+    aq.attendance_queue.stop()
+
+    r = client.get(f"/api/attendance/count?section_id={section['id']}", headers=auth_headers(s_tok))
+    assert r.json()["count"] == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_full_queue_rejects_new_marks(client, monkeypatch, tmp_path):
+    aq = enable_write_behind(
+        monkeypatch, tmp_path,
+        attendance_queue_max_size=1, attendance_queue_put_timeout_ms=10, attendance_flush_interval_ms=60000,
+    )
+    aq.attendance_queue.start()
+    try:
+        aq.attendance_queue.enqueue(1, 1)
+        with pytest.raises(aq.QueueFullError):
+            aq.attendance_queue.enqueue(1, 2)
+    finally:
+        aq.attendance_queue.stop()
+
+
+def test_recovery_skips_live_workers_and_orders_segments(client, monkeypatch, tmp_path):
+    aq = enable_write_behind(monkeypatch, tmp_path, attendance_session_window_minutes=0)
+    teacher = register(client, "tw", "pass", role="teacher")
+    student = register(client, "sw", "pass", role="student")
+    s_tok = login(client, "sw", "pass")
+    t_tok = login(client, "tw", "pass")
+    section = client.post("/api/sections", json={"name": "Workers"}, headers=auth_headers(t_tok)).json()
+    row = {"section_id": section["id"], "student_id": student["id"]}
+
+    # a live worker: its lock is held, so its files are not touched
+    live = tmp_path / "spill.jsonl.w999999"
+    live.write_text(json.dumps({**row, "timestamp": "2024-09-02T08:00:00"}) + "\n")
+    live_lock = aq._lock_owner(str(live))
+    # a crashed worker: replayed segment by segment in numeric order, then its live file
+    replayed = []
+    for n in (10, 2):
+        (tmp_path / f"spill.jsonl.w999998.{n}").write_text(json.dumps({**row, "timestamp": f"2024-09-02T09:00:{n:02d}"}) + "\n")
+    (tmp_path / "spill.jsonl.w999998").write_text(json.dumps({**row, "timestamp": "2024-09-02T09:01:00"}) + "\n")
+    replay = aq.AttendanceWriteBehind._replay
+    monkeypatch.setattr(aq.AttendanceWriteBehind, "_replay", lambda self, path: replayed.append(path) or replay(self, path))
+
+    aq.attendance_queue.start()
+    aq.attendance_queue.stop()
+
+    assert [path.rsplit("/", 1)[1] for path in replayed] == [
+        "spill.jsonl.w999998.2", "spill.jsonl.w999998.10", "spill.jsonl.w999998",
+    ]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["spill.jsonl.w999999", "spill.jsonl.w999999.lock"]
+    r = client.get(f"/api/attendance/count?section_id={section['id']}", headers=auth_headers(s_tok))
+    assert r.json()["count"] == 3
+    live_lock.close()
+
+
+def test_failed_flushes_count_against_the_queue_limit(client, monkeypatch, tmp_path):
+    aq = enable_write_behind(
+        monkeypatch, tmp_path,
+        attendance_queue_max_size=2, attendance_queue_put_timeout_ms=10, attendance_flush_interval_ms=10,
+    )
+    monkeypatch.setattr(aq.AttendanceWriteBehind, "_write", lambda self, rows: 1 / 0)
+    aq.attendance_queue.start()
+    try:
+        aq.attendance_queue.enqueue(1, 1)
+        aq.attendance_queue.enqueue(1, 2)
+        # wait for the flusher to move both rows from pending to failed, a full queue proves nothing before that
+        deadline = time.monotonic() + 5
+        while aq.attendance_queue._failed_rows < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert aq.attendance_queue._failed_rows == 2
+        with pytest.raises(aq.QueueFullError):
+            aq.attendance_queue.enqueue(1, 3)
+    finally:
+        monkeypatch.undo()
+        aq.attendance_queue.stop()